@@ -0,0 +1,116 @@
+"""Async gateway for LLM calls: bounded concurrency, timeouts, swappable backends"""
+import os
+import json
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Messages = List[Dict[str, str]]
+
+class AIGatewayError(Exception):
+    """Raised when a completion fails, times out or returns unusable content"""
+
+class OpenAIBackend:
+    """Chat completions through the async OpenAI client"""
+
+    def __init__(self, api_key: str, model: str = 'gpt-4o-mini'):
+        from openai import AsyncOpenAI
+        # The gateway owns timeouts; don't let the client retry behind its back
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
+        self.model = model
+
+    async def complete(self, messages: Messages, max_tokens: int) -> str:
+        completion = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens
+        )
+        return completion.choices[0].message.content
+
+    async def close(self):
+        await self.client.close()
+
+class LocalBackend:
+    """Offline stand-in for tests and keyless environments.
+    Replies with reply(messages), by default an empty JSON array."""
+
+    def __init__(self, reply: Optional[Callable[[Messages], str]] = None):
+        self.reply = reply or (lambda messages: '[]')
+        self.calls: List[Messages] = []
+
+    async def complete(self, messages: Messages, max_tokens: int) -> str:
+        self.calls.append(messages)
+        return self.reply(messages)
+
+    async def close(self):
+        pass
+
+class AIGateway:
+    """Every LLM call goes through here so none can block the event loop,
+    pile up without bound, or hang a request past its timeout"""
+
+    def __init__(self, backend=None, max_concurrency: Optional[int] = None, timeout: Optional[float] = None):
+        self.backend = backend or self._backend_from_env()
+        self.max_concurrency = max_concurrency or int(os.getenv('AI_MAX_CONCURRENCY', '8'))
+        self.timeout = timeout or float(os.getenv('AI_TIMEOUT_SECONDS', '10'))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.stats = {'calls': 0, 'errors': 0, 'timeouts': 0, 'in_flight': 0}
+
+    @staticmethod
+    def _backend_from_env():
+        api_key = os.getenv('EMERGENT_LLM_KEY', '')
+        backend = os.getenv('AI_BACKEND', 'openai' if api_key else 'local').lower()
+        if backend == 'local':
+            logger.info("AI gateway using the local stand-in backend")
+            return LocalBackend()
+        return OpenAIBackend(api_key, os.getenv('AI_MODEL', 'gpt-4o-mini'))
+
+    async def complete(self, messages: Messages, max_tokens: int = 200, timeout: Optional[float] = None) -> str:
+        """Completion text. The timeout covers waiting for a slot as well as the call."""
+        self.stats['calls'] += 1
+        try:
+            return await asyncio.wait_for(self._complete(messages, max_tokens), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            raise AIGatewayError('AI request timed out')
+        except AIGatewayError:
+            self.stats['errors'] += 1
+            raise
+        except Exception as e:
+            self.stats['errors'] += 1
+            raise AIGatewayError(f'AI request failed: {e}') from e
+
+    async def _complete(self, messages: Messages, max_tokens: int) -> str:
+        async with self.semaphore:
+            self.stats['in_flight'] += 1
+            try:
+                content = await self.backend.complete(messages, max_tokens)
+            finally:
+                self.stats['in_flight'] -= 1
+        if not content:
+            raise AIGatewayError('Empty AI response')
+        return content
+
+    async def complete_json(self, messages: Messages, max_tokens: int = 200, timeout: Optional[float] = None):
+        """Completion parsed as JSON (tolerates a ```json fenced reply)"""
+        content = (await self.complete(messages, max_tokens, timeout)).strip()
+        if content.startswith('```'):
+            content = content.strip('`').removeprefix('json').strip()
+        try:
+            return json.loads(content)
+        except ValueError as e:
+            self.stats['errors'] += 1
+            raise AIGatewayError(f'AI response is not JSON: {e}') from e
+
+    async def complete_list(self, messages: Messages, max_tokens: int = 200, timeout: Optional[float] = None) -> list:
+        """Completion that must be a non-empty JSON array"""
+        result = await self.complete_json(messages, max_tokens, timeout)
+        if not isinstance(result, list) or not result:
+            self.stats['errors'] += 1
+            raise AIGatewayError('AI response is not a non-empty JSON array')
+        return result
+
+    async def close(self):
+        await self.backend.close()
@@ -0,0 +1,57 @@
+"""
+Geo Coordinates Backfill Script
+Writes GeoJSON points to location_details.coordinates for users whose location
+was saved before Discover moved to $geoNear (latitude/longitude scalars only)
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URL = os.getenv('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = 'ember_dating'
+BATCH_SIZE = 500
+
+async def backfill_geo_coordinates():
+    """Add location_details.coordinates to every user that has lat/lng but no point"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    print("Backfilling GeoJSON coordinates for Ember Dating App...")
+
+    query = {
+        'location_details.latitude': {'$type': 'number'},
+        'location_details.longitude': {'$type': 'number'},
+        'location_details.coordinates': None  # matches missing or null
+    }
+    cursor = db.users.find(query, {'_id': 0, 'user_id': 1, 'location_details': 1})
+
+    updated = 0
+    batch = []
+    async for user in cursor:
+        details = user['location_details']
+        batch.append(UpdateOne(
+            {'user_id': user['user_id']},
+            {'$set': {'location_details.coordinates': {
+                'type': 'Point',
+                'coordinates': [details['longitude'], details['latitude']]
+            }}}
+        ))
+        if len(batch) >= BATCH_SIZE:
+            result = await db.users.bulk_write(batch, ordered=False)
+            updated += result.modified_count
+            batch = []
+
+    if batch:
+        result = await db.users.bulk_write(batch, ordered=False)
+        updated += result.modified_count
+
+    print(f"\n✅ Backfilled coordinates for {updated} users")
+
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_geo_coordinates())
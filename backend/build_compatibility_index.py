@@ -0,0 +1,58 @@
+"""
+Compatibility Index Build Script
+Computes the interests/prompts/bio embedding for every active user, for users
+who have not updated their profile since the compatibility index was added
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from datetime import datetime, timezone
+import os
+from dotenv import load_dotenv
+from compatibility_index import EMBEDDING_DIM, EMBEDDING_DTYPE, embed_profile
+
+load_dotenv()
+
+MONGO_URL = os.getenv('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = 'ember_dating'
+BATCH_SIZE = 500
+
+async def build_compatibility_index():
+    """Upsert an embedding for every user that is not deleted"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    print("Building compatibility index for Ember Dating App...")
+
+    cursor = db.users.find(
+        {'deleted_at': None},
+        {'_id': 0, 'user_id': 1, 'interests': 1, 'prompts': 1, 'bio': 1}
+    )
+
+    indexed = 0
+    batch = []
+    async for user in cursor:
+        batch.append(UpdateOne(
+            {'user_id': user['user_id']},
+            {'$set': {
+                'vector': embed_profile(user).astype(EMBEDDING_DTYPE).tobytes(),
+                'dim': EMBEDDING_DIM,
+                'updated_at': datetime.now(timezone.utc)
+            }},
+            upsert=True
+        ))
+        if len(batch) >= BATCH_SIZE:
+            await db.compatibility_index.bulk_write(batch, ordered=False)
+            indexed += len(batch)
+            batch = []
+
+    if batch:
+        await db.compatibility_index.bulk_write(batch, ordered=False)
+        indexed += len(batch)
+
+    print(f"\n✅ Indexed {indexed} users")
+
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(build_compatibility_index())
@@ -0,0 +1,109 @@
+"""Offline compatibility index: hashed bag-of-words profile embeddings"""
+import re
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 256
+EMBEDDING_DTYPE = np.float16  # 512 bytes per user
+
+# Interests are curated tags, so they count for more than free text
+FIELD_WEIGHTS = {
+    'interests': 3.0,
+    'prompts': 1.0,
+    'bio': 1.0
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'i', "i'm", 'if', 'in',
+    'is', 'it', 'me', 'my', 'of', 'on', 'or', 'so', 'that', 'the', 'to', 'was', 'with', 'you'
+}
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOP_WORDS and len(t) > 1]
+
+def profile_terms(profile: dict) -> Dict[str, List[str]]:
+    """Tokens per embedded field of a user document"""
+    prompts = profile.get('prompts') or []
+    prompt_text = ' '.join(
+        p.get('answer', '') if isinstance(p, dict) else str(p)
+        for p in prompts
+    )
+    return {
+        # Multi-word interests stay a single feature ("rock climbing")
+        'interests': [i.strip().lower() for i in profile.get('interests') or [] if i and i.strip()],
+        'prompts': tokenize(prompt_text),
+        'bio': tokenize(profile.get('bio') or '')
+    }
+
+def _bucket(term: str) -> tuple:
+    """Stable (index, sign) for a term; Python's hash() is salted per process"""
+    digest = int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+    return digest % EMBEDDING_DIM, 1.0 if (digest >> 63) & 1 else -1.0
+
+def embed_profile(profile: dict) -> np.ndarray:
+    """L2-normalised embedding of interests, prompts and bio (zero vector if empty)"""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for field, terms in profile_terms(profile).items():
+        weight = FIELD_WEIGHTS[field]
+        for term in set(terms):
+            index, sign = _bucket(f"{field}:{term}" if field != 'interests' else term)
+            vector[index] += sign * weight
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def cosine_similarities(vector: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Cosine similarity of one normalised vector against rows of normalised vectors"""
+    if matrix.size == 0:
+        return np.empty(0, dtype=np.float32)
+    return matrix.astype(np.float32) @ vector.astype(np.float32)
+
+class CompatibilityIndex:
+    """Per-user embeddings stored in MongoDB and queried in batches"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def update_user(self, profile: dict):
+        """Recompute and store the embedding for a user document"""
+        vector = embed_profile(profile).astype(EMBEDDING_DTYPE)
+        await self.collection.update_one(
+            {'user_id': profile['user_id']},
+            {'$set': {
+                'vector': vector.tobytes(),
+                'dim': EMBEDDING_DIM,
+                'updated_at': datetime.now(timezone.utc)
+            }},
+            upsert=True
+        )
+
+    async def remove_user(self, user_id: str):
+        await self.collection.delete_one({'user_id': user_id})
+
+    async def similarities(self, profile: dict, user_ids: List[str]) -> np.ndarray:
+        """Cosine similarity of a profile to each user id, in input order.
+        Users not yet in the index get NaN so rankers can treat them as neutral."""
+        scores = np.full(len(user_ids), np.nan, dtype=np.float32)
+        if not user_ids:
+            return scores
+
+        docs = await self.collection.find(
+            {'user_id': {'$in': user_ids}, 'dim': EMBEDDING_DIM},
+            {'_id': 0, 'user_id': 1, 'vector': 1}
+        ).to_list(len(user_ids))
+        if not docs:
+            return scores
+
+        positions = {user_id: i for i, user_id in enumerate(user_ids)}
+        matrix = np.frombuffer(
+            b''.join(doc['vector'] for doc in docs), dtype=EMBEDDING_DTYPE
+        ).reshape(len(docs), EMBEDDING_DIM)
+        found = np.array([positions[doc['user_id']] for doc in docs])
+        scores[found] = cosine_similarities(embed_profile(profile), matrix)
+        return scores
@@ -26,7 +26,7 @@ async def create_demo_profile():
         await db.users.delete_one({'email': 'demo@ember.app'})
     
     # Create demo profile
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     # Hash password
     password = bcrypt.hashpw('demo123'.encode('utf-8'), bcrypt.gensalt())
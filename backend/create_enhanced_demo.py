@@ -22,7 +22,7 @@ async def create_enhanced_demo_profile():
     # Delete existing demo profile
     await db.users.delete_many({'is_demo': True})
     
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     password = bcrypt.hashpw('demo123'.encode('utf-8'), bcrypt.gensalt())
     
     # Create comprehensive demo profile
@@ -195,7 +195,7 @@ Looking for someone who can appreciate both museum dates and hiking trails, who
         'ambassador_applied_at': None,
         
         # Timestamps
-        'created_at': (datetime.now(timezone.utc) - timedelta(days=30)).isoformat(),  # Account 30 days old
+        'created_at': datetime.now(timezone.utc) - timedelta(days=30),  # Account 30 days old
         'updated_at': now,
         'last_active': now,
         
@@ -29,10 +29,17 @@ async def create_indexes():
     await db.users.create_index([('location_details.coordinates', '2dsphere')])  # Geospatial
     await db.users.create_index('created_at')
     
+    # User sessions indexes (expired sessions removed by TTL)
+    print("Creating user_sessions indexes...")
+    await db.user_sessions.create_index('session_token')
+    await db.user_sessions.create_index('expires_at', expireAfterSeconds=0)
+    
     # Likes collection indexes
     print("Creating likes indexes...")
     await db.likes.create_index([('liker_id', 1), ('liked_user_id', 1)], unique=True)
     await db.likes.create_index('liked_user_id')
+    await db.likes.create_index([('liked_user_id', 1), ('created_at', -1), ('like_id', -1)])  # Likes You pages
+    await db.likes.create_index([('liked_user_id', 1), ('like_type', 1), ('created_at', -1), ('like_id', -1)])  # Roses pages
     await db.likes.create_index('like_type')
     await db.likes.create_index('created_at')
     
@@ -42,6 +49,7 @@ async def create_indexes():
     await db.matches.create_index('user1_id')
     await db.matches.create_index('user2_id')
     await db.matches.create_index('expires_at')
+    await db.matches.create_index([('first_message_sent', 1), ('matched_at', 1)])  # Auto-disconnect job
     await db.matches.create_index('created_at')
     
     # Messages collection indexes
@@ -55,8 +63,17 @@ async def create_indexes():
     print("Creating blocks indexes...")
     await db.blocks.create_index([('blocker_id', 1), ('blocked_id', 1)], unique=True)
     await db.blocks.create_index('blocker_id')
+    await db.blocks.create_index([('blocker_id', 1), ('created_at', -1), ('block_id', -1)])  # Blocked users pages
     await db.blocks.create_index('blocked_id')
     
+    # Discover exclusion sets (one document per user)
+    print("Creating discover_exclusions indexes...")
+    await db.discover_exclusions.create_index('user_id', unique=True)
+    
+    # Compatibility embeddings (one document per user)
+    print("Creating compatibility_index indexes...")
+    await db.compatibility_index.create_index('user_id', unique=True)
+    
     # Reports collection indexes
     print("Creating reports indexes...")
     await db.reports.create_index('reporter_id')
@@ -0,0 +1,70 @@
+"""Daily swipe, super like and rose quotas, checked and consumed in one atomic update"""
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+from pymongo import ReturnDocument
+
+# Daily quotas: user document field, default daily max, unlimited for premium
+DAILY_LIMITS = {
+    'swipes': {'field': 'swipe_limit', 'default_max': 10, 'premium_unlimited': True},
+    'super_likes': {'field': 'super_like_limit', 'default_max': 3, 'premium_unlimited': False},
+    'roses': {'field': 'rose_limit', 'default_max': 1, 'premium_unlimited': False}
+}
+DAILY_LIMIT_WINDOW = timedelta(hours=24)
+LIMITS_PROJECTION = {'_id': 0, 'is_premium': 1, **{spec['field']: 1 for spec in DAILY_LIMITS.values()}}
+
+def daily_limit_exprs(kind: str, now: datetime) -> tuple:
+    """(is_stale, effective count, daily max) as aggregation expressions"""
+    spec = DAILY_LIMITS[kind]
+    field = spec['field']
+    last_reset = {'$ifNull': [f'${field}.last_reset', datetime(1970, 1, 1, tzinfo=timezone.utc)]}
+    is_stale = {'$gte': [{'$subtract': [now, last_reset]}, DAILY_LIMIT_WINDOW.total_seconds() * 1000]}
+    count = {'$cond': [is_stale, 0, {'$ifNull': [f'${field}.count', 0]}]}
+    daily_max = {'$ifNull': [f'${field}.daily_max', spec['default_max']]}
+    return is_stale, count, daily_max
+
+def format_daily_limits(user: dict, now: datetime) -> dict:
+    """Used/max/remaining per quota; counters older than 24 hours read as 0"""
+    is_premium = user.get('is_premium', False)
+    limits = {}
+    for kind, spec in DAILY_LIMITS.items():
+        state = user.get(spec['field']) or {}
+        last_reset = state.get('last_reset')
+        stale = not last_reset or now - last_reset >= DAILY_LIMIT_WINDOW
+        used = 0 if stale else state.get('count', 0)
+        daily_max = state.get('daily_max', spec['default_max'])
+        unlimited = is_premium and spec['premium_unlimited']
+        limits[kind] = {
+            'used': used,
+            'max': daily_max,
+            'remaining': 'unlimited' if unlimited else max(0, daily_max - used)
+        }
+        if spec['premium_unlimited']:
+            limits[kind]['unlimited'] = unlimited
+    return limits
+
+async def consume_daily_limit(users, user_id: str, kind: str, now: Optional[datetime] = None) -> Optional[dict]:
+    """Check, reset if 24 hours have passed, and increment a quota in one round
+    trip. Returns all limits after consuming, or None if this one is used up."""
+    now = now or datetime.now(timezone.utc)
+    field = DAILY_LIMITS[kind]['field']
+    is_stale, count, daily_max = daily_limit_exprs(kind, now)
+
+    has_quota = {'$lt': [count, daily_max]}
+    if DAILY_LIMITS[kind]['premium_unlimited']:
+        has_quota = {'$or': [{'$eq': ['$is_premium', True]}, has_quota]}
+
+    # The filter only matches while quota remains, so concurrent requests
+    # can never both take the last one
+    user = await users.find_one_and_update(
+        {'user_id': user_id, '$expr': has_quota},
+        [{'$set': {
+            f'{field}.count': {'$add': [count, 1]},
+            f'{field}.last_reset': {'$cond': [is_stale, now, f'${field}.last_reset']},
+            f'{field}.daily_max': daily_max
+        }}],
+        projection=LIMITS_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if not user:
+        return None
+    return format_daily_limits(user, now)
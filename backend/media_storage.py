@@ -0,0 +1,311 @@
+"""Media storage drivers for photo and video uploads (Cloudinary or local disk)"""
+import os
+import base64
+import asyncio
+import logging
+import mimetypes
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+import aiofiles
+import cloudinary.uploader
+import cloudinary.utils
+from fastapi import HTTPException
+from starlette.responses import FileResponse, Response, StreamingResponse
+from upload_pipeline import run_upload_call
+
+logger = logging.getLogger(__name__)
+
+PHOTO_TRANSFORMATION = [
+    {'width': 1080, 'height': 1350, 'crop': 'limit'},  # Max size
+    {'quality': 'auto:good'},  # Auto quality optimization
+    {'fetch_format': 'auto'}  # Auto format (webp when supported)
+]
+VIDEO_TRANSFORMATION = [
+    {'width': 1080, 'height': 1920, 'crop': 'limit'},  # Max size for mobile
+    {'quality': 'auto:good'},  # Auto quality optimization
+    {'duration': '30'},  # Max 30 seconds
+    {'fetch_format': 'auto'}  # Auto format
+]
+VIDEO_EAGER = [
+    {'format': 'jpg', 'transformation': [{'width': 300, 'crop': 'fill'}]}  # Generate thumbnail
+]
+
+CHUNK_SIZE = 1024 * 1024
+THUMBNAIL_SIZE = 300
+
+class CloudinaryStorage:
+    """Uploads to Cloudinary; the SDK runs in the upload thread pool"""
+
+    name = 'cloudinary'
+
+    async def save_photo(self, source, folder: str, public_id: str,
+                         content_type: Optional[str] = None,
+                         transformation: List[dict] = PHOTO_TRANSFORMATION,
+                         thumbnail: bool = True) -> dict:
+        """source is a file object or a base64 data URI"""
+        result = await run_upload_call(
+            cloudinary.uploader.upload,
+            source,
+            folder=folder,
+            public_id=public_id,
+            overwrite=True,
+            transformation=transformation
+        )
+        # Derived on request by the CDN, so building the URL costs nothing here
+        thumbnail_url = cloudinary.utils.cloudinary_url(
+            result['public_id'], width=THUMBNAIL_SIZE, crop='fill', secure=True
+        )[0] if thumbnail else None
+        return {
+            'url': result['secure_url'],
+            'thumbnail_url': thumbnail_url,
+            'public_id': result['public_id'],
+            'width': result.get('width'),
+            'height': result.get('height')
+        }
+
+    async def save_video(self, source, folder: str, public_id: str,
+                         content_type: Optional[str] = None) -> dict:
+        result = await run_upload_call(
+            cloudinary.uploader.upload,
+            source,
+            resource_type='video',
+            folder=folder,
+            public_id=public_id,
+            overwrite=True,
+            transformation=VIDEO_TRANSFORMATION,
+            eager=VIDEO_EAGER
+        )
+        thumbnail_url = result.get('eager', [{}])[0].get('secure_url') if result.get('eager') else None
+        return {
+            'url': result['secure_url'],
+            'thumbnail_url': thumbnail_url,
+            'public_id': result['public_id'],
+            'duration': result.get('duration'),
+            'width': result.get('width'),
+            'height': result.get('height'),
+            'format': result.get('format')
+        }
+
+    async def delete(self, public_id: str) -> str:
+        result = await run_upload_call(cloudinary.uploader.destroy, public_id)
+        return result.get('result', 'ok')
+
+def make_thumbnail(source: str, destination: str, size: int = THUMBNAIL_SIZE) -> Optional[tuple]:
+    """Runs in a worker process: write a JPEG thumbnail, return the original (width, height)"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    with Image.open(source) as image:
+        dimensions = image.size
+        image.thumbnail((size, size))
+        image.convert('RGB').save(destination, 'JPEG', quality=80)
+    return dimensions
+
+def read_dimensions(source: str) -> Optional[tuple]:
+    """(width, height) from the image header, without decoding the pixels"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    with Image.open(source) as image:
+        return image.size
+
+def decode_data_uri(data: str) -> tuple:
+    """(bytes, mime type) from a base64 data URI or bare base64 string"""
+    mime_type = None
+    if data.startswith('data:'):
+        header, _, data = data.partition(',')
+        mime_type = header[5:].split(';')[0] or None
+    try:
+        return base64.b64decode(data, validate=False), mime_type
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid base64 data')
+
+def is_safe_public_id(public_id: str) -> bool:
+    """True if public_id is a plain relative path: no empty, '.' or '..'
+    segments and no backslashes, so a prefix check on it can be trusted"""
+    if not public_id or '\\' in public_id:
+        return False
+    return all(segment not in ('', '.', '..') for segment in public_id.split('/'))
+
+def parse_range(header: str, size: int) -> Optional[tuple]:
+    """(start, end) inclusive for a single 'bytes=' range; None to serve the whole file"""
+    units, _, spec = header.partition('=')
+    if units.strip().lower() != 'bytes' or ',' in spec:
+        return None
+
+    start, _, end = spec.strip().partition('-')
+    if not start:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end) if end else size - 1, size - 1)
+
+    if start > end or start >= size:
+        raise ValueError('Unsatisfiable range')
+    return start, end
+
+class LocalStorage:
+    """Writes media under a directory with aiofiles and serves it with Range support.
+    Public ids mirror the Cloudinary folder layout plus the file extension."""
+
+    name = 'local'
+
+    def __init__(self, root: Path, base_url: str = '', thumbnail_workers: int = 2):
+        self.root = root.resolve()
+        self.base_url = base_url.rstrip('/')
+        self.thumbnail_workers = thumbnail_workers
+        self._thumbnail_pool = None
+
+    @property
+    def thumbnail_pool(self) -> ProcessPoolExecutor:
+        # Created on first use so importing the server never forks
+        if self._thumbnail_pool is None:
+            self._thumbnail_pool = ProcessPoolExecutor(max_workers=self.thumbnail_workers)
+        return self._thumbnail_pool
+
+    def url_for(self, public_id: str) -> str:
+        return f"{self.base_url}/api/uploads/{public_id}"
+
+    def resolve(self, public_id: str) -> Path:
+        if not is_safe_public_id(public_id):
+            raise HTTPException(status_code=404, detail='File not found')
+        path = (self.root / public_id).resolve()
+        if not path.is_relative_to(self.root):
+            raise HTTPException(status_code=404, detail='File not found')
+        return path
+
+    async def _write(self, source, folder: str, public_id: str, content_type: Optional[str]) -> tuple:
+        """Stream source to disk; returns (public_id with extension, path)"""
+        loop = asyncio.get_running_loop()
+        data = None
+        if isinstance(source, str):
+            data, content_type = await loop.run_in_executor(None, decode_data_uri, source)
+
+        extension = mimetypes.guess_extension(content_type or '') or '.bin'
+        stored_id = f"{folder}/{public_id}{extension}"
+        path = self.resolve(stored_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        async with aiofiles.open(path, 'wb') as out:
+            if data is not None:
+                await out.write(data)
+            else:
+                while chunk := await loop.run_in_executor(None, source.read, CHUNK_SIZE):
+                    await out.write(chunk)
+        return stored_id, path
+
+    async def _thumbnail(self, path: Path) -> tuple:
+        """(thumbnail public id, (width, height)) or (None, None) if it can't be made"""
+        thumbnail_path = path.with_name(f"{path.stem}_thumb.jpg")
+        loop = asyncio.get_running_loop()
+        try:
+            dimensions = await loop.run_in_executor(
+                self.thumbnail_pool, make_thumbnail, str(path), str(thumbnail_path)
+            )
+        except Exception as e:
+            logger.error(f"Thumbnail generation failed for {path.name}: {e}")
+            return None, None
+        if dimensions is None:
+            return None, None
+        return str(thumbnail_path.relative_to(self.root)), dimensions
+
+    async def _dimensions(self, path: Path) -> Optional[tuple]:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, read_dimensions, str(path))
+        except Exception as e:
+            logger.error(f"Reading image size failed for {path.name}: {e}")
+            return None
+
+    async def save_photo(self, source, folder: str, public_id: str,
+                         content_type: Optional[str] = None,
+                         transformation: List[dict] = PHOTO_TRANSFORMATION,
+                         thumbnail: bool = True) -> dict:
+        """thumbnail=False skips the worker-process job, e.g. for ID documents"""
+        stored_id, path = await self._write(source, folder, public_id, content_type)
+        if thumbnail:
+            thumbnail_id, dimensions = await self._thumbnail(path)
+        else:
+            thumbnail_id, dimensions = None, await self._dimensions(path)
+        width, height = dimensions or (None, None)
+        return {
+            'url': self.url_for(stored_id),
+            'thumbnail_url': self.url_for(thumbnail_id) if thumbnail_id else None,
+            'public_id': stored_id,
+            'width': width,
+            'height': height
+        }
+
+    async def save_video(self, source, folder: str, public_id: str,
+                         content_type: Optional[str] = None) -> dict:
+        # No transcoding or frame grabs locally; the file is stored as uploaded
+        stored_id, path = await self._write(source, folder, public_id, content_type)
+        return {
+            'url': self.url_for(stored_id),
+            'thumbnail_url': None,
+            'public_id': stored_id,
+            'duration': None,
+            'width': None,
+            'height': None,
+            'format': path.suffix.lstrip('.')
+        }
+
+    async def delete(self, public_id: str) -> str:
+        path = self.resolve(public_id)
+        if not path.is_file():
+            return 'not found'
+        path.unlink()
+        path.with_name(f"{path.stem}_thumb.jpg").unlink(missing_ok=True)
+        return 'ok'
+
+    async def serve(self, public_id: str, range_header: Optional[str] = None) -> Response:
+        """File response honouring a single-range Range header (206 / 416)"""
+        path = self.resolve(public_id)
+        if not path.is_file():
+            raise HTTPException(status_code=404, detail='File not found')
+
+        size = path.stat().st_size
+        media_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        try:
+            byte_range = parse_range(range_header, size) if range_header else None
+        except ValueError:
+            return Response(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+
+        if byte_range is None:
+            return FileResponse(path, media_type=media_type, headers={'Accept-Ranges': 'bytes'})
+
+        start, end = byte_range
+
+        async def body():
+            async with aiofiles.open(path, 'rb') as f:
+                await f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+
+        return StreamingResponse(body(), status_code=206, media_type=media_type, headers={
+            'Accept-Ranges': 'bytes',
+            'Content-Range': f'bytes {start}-{end}/{size}',
+            'Content-Length': str(end - start + 1)
+        })
+
+    def close(self):
+        if self._thumbnail_pool is not None:
+            self._thumbnail_pool.shutdown(wait=False)
+
+def create_storage(driver: str, upload_dir: Path, base_url: str = ''):
+    """Storage driver by name: 'cloudinary' (default) or 'local'"""
+    if driver == 'local':
+        return LocalStorage(upload_dir, base_url, int(os.getenv('THUMBNAIL_WORKERS', '2')))
+    if driver != 'cloudinary':
+        logger.warning(f"Unknown MEDIA_STORAGE '{driver}', using cloudinary")
+    return CloudinaryStorage()
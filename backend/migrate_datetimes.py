@@ -0,0 +1,119 @@
+"""
+Datetime Migration Script
+Converts ISO-8601 timestamp strings written by older versions of the server
+into native BSON dates. Safe to stop and re-run: each pass only picks up
+values that are still strings, in batches ordered by _id.
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from datetime import datetime, timezone
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URL = os.getenv('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = 'ember_dating'
+BATCH_SIZE = 1000
+
+# Timestamp fields per collection (dotted paths for sub-documents)
+DATETIME_FIELDS = {
+    'users': [
+        'created_at', 'last_active', 'last_passed_at', 'deleted_at', 'last_token_update',
+        'swipe_limit.last_reset', 'super_like_limit.last_reset', 'rose_limit.last_reset',
+        'photo_verification.verified_at', 'id_verification.verified_at',
+        'phone_verification.verified_at', 'phone_verification.expires_at',
+        'location_details.updated_at'
+    ],
+    'user_sessions': ['created_at', 'expires_at'],
+    'likes': ['created_at'],
+    'matches': ['created_at', 'matched_at', 'last_message_at'],
+    'disconnected_matches': ['matched_at', 'disconnected_at'],
+    'messages': ['created_at', 'sent_at', 'delivered_at', 'read_at', 'edited_at', 'deleted_at'],
+    'blocks': ['created_at'],
+    'reports': ['created_at'],
+    'notifications': ['created_at', 'sent_at', 'read_at'],
+    'calls': ['created_at', 'ended_at'],
+    'icebreaker_sessions': ['created_at', 'completed_at'],
+    'virtual_gifts': ['created_at', 'sent_at'],
+    'daily_picks': ['generated_at'],
+    'discover_exclusions': ['rebuilt_at'],
+    'support_messages': ['created_at', 'resolved_at'],
+    'fs.files': ['metadata.created_at', 'metadata.expires_at'],  # GridFS voice messages
+}
+
+def get_path(doc: dict, path: str):
+    for key in path.split('.'):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
+
+def parse_timestamp(value: str):
+    """Parse an ISO string as an aware UTC datetime, or None if it is not one"""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+async def migrate_field(collection, field: str) -> tuple:
+    """Convert one field across a collection; returns (converted, skipped)"""
+    converted = 0
+    skipped = 0
+    last_id = None
+
+    while True:
+        query = {field: {'$type': 'string'}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+
+        docs = await collection.find(query, {field: 1}).sort('_id', 1).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+        if not docs:
+            break
+
+        updates = []
+        for doc in docs:
+            parsed = parse_timestamp(get_path(doc, field))
+            if parsed is None:
+                skipped += 1
+                continue
+            # Match on the old value so a concurrent write is never overwritten
+            updates.append(UpdateOne(
+                {'_id': doc['_id'], field: get_path(doc, field)},
+                {'$set': {field: parsed}}
+            ))
+
+        if updates:
+            result = await collection.bulk_write(updates, ordered=False)
+            converted += result.modified_count
+
+        last_id = docs[-1]['_id']
+
+    return converted, skipped
+
+async def migrate_datetimes():
+    """Convert every known timestamp field to a BSON date"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    print("Migrating timestamps to BSON dates for Ember Dating App...")
+
+    total = 0
+    for collection_name, fields in DATETIME_FIELDS.items():
+        collection = db[collection_name]
+        for field in fields:
+            converted, skipped = await migrate_field(collection, field)
+            total += converted
+            if converted or skipped:
+                print(f"  - {collection_name}.{field}: {converted} converted, {skipped} unparseable")
+
+    print(f"\n✅ Converted {total} timestamps")
+
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_datetimes())
@@ -0,0 +1,107 @@
+"""In-memory presence: who is online and when users were last seen, with
+last_active persisted to MongoDB in periodic bulk writes"""
+import os
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, Iterable, Optional
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_FLUSH_SECONDS = float(os.getenv('PRESENCE_FLUSH_SECONDS', '30'))
+# Idle but still connected users are re-stamped this often, not on every flush
+PRESENCE_CONNECTED_REFRESH_SECONDS = float(os.getenv('PRESENCE_CONNECTED_REFRESH_SECONDS', '300'))
+
+class PresenceService:
+    """Fed by WebSocket connect, disconnect and ping. Reads never query the
+    database: lookups merge the in-memory state into documents the caller
+    already loaded (their stored last_active)."""
+
+    def __init__(self, collection, flush_interval: float = PRESENCE_FLUSH_SECONDS,
+                 remote_online: Callable[[str], bool] = None,
+                 connected_refresh: float = PRESENCE_CONNECTED_REFRESH_SECONDS):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.connected_refresh = timedelta(seconds=connected_refresh)
+        self.remote_online = remote_online or (lambda user_id: False)
+        self.connections: Dict[str, int] = {}  # user_id -> open sockets on this worker
+        self.last_seen: Dict[str, datetime] = {}
+        self.dirty = set()  # users whose last_seen hasn't been written yet
+        self.flushes = 0
+        self.written = 0
+
+    def _seen(self, user_id: str):
+        self.last_seen[user_id] = datetime.now(timezone.utc)
+        self.dirty.add(user_id)
+
+    def connected(self, user_id: str):
+        self.connections[user_id] = self.connections.get(user_id, 0) + 1
+        self._seen(user_id)
+
+    def disconnected(self, user_id: str):
+        count = self.connections.get(user_id, 0) - 1
+        if count > 0:
+            self.connections[user_id] = count
+        else:
+            self.connections.pop(user_id, None)
+        self._seen(user_id)
+
+    def touch(self, user_id: str):
+        """Activity on an open socket (ping)"""
+        self._seen(user_id)
+
+    def is_online(self, user_id: str) -> bool:
+        return user_id in self.connections or self.remote_online(user_id)
+
+    def last_active(self, user_id: str, stored: Optional[datetime] = None) -> Optional[datetime]:
+        """Latest of the in-memory last seen and the value loaded from the database"""
+        seen = self.last_seen.get(user_id)
+        if seen is None or (stored is not None and stored > seen):
+            return stored
+        return seen
+
+    def annotate(self, users: Iterable[dict]):
+        """Set is_online and a fresh last_active on user documents in place"""
+        for user in users:
+            if not user:
+                continue
+            user_id = user['user_id']
+            user['is_online'] = self.is_online(user_id)
+            user['last_active'] = self.last_active(user_id, user.get('last_active'))
+
+    async def flush(self):
+        """Write last_active for users seen since the last flush, in one unordered bulk write"""
+        stale = datetime.now(timezone.utc) - self.connected_refresh
+        for user_id in self.connections:
+            # Still connected counts as active, even without pings
+            if self.last_seen[user_id] < stale:
+                self._seen(user_id)
+        if not self.dirty:
+            return
+
+        pending, self.dirty = self.dirty, set()
+        operations = [
+            # $max so a worker with an older value never moves last_active back
+            UpdateOne({'user_id': user_id}, {'$max': {'last_active': self.last_seen[user_id]}})
+            for user_id in pending
+        ]
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Presence flush failed for {len(operations)} users: {e}")
+            self.dirty |= pending
+            return
+
+        self.flushes += 1
+        self.written += len(operations)
+        # Offline users are now in the database; only keep what's still live
+        for user_id in pending:
+            if user_id not in self.connections and user_id not in self.dirty:
+                self.last_seen.pop(user_id, None)
+
+    async def run(self):
+        """Background flush loop, started with the app"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
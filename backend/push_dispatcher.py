@@ -0,0 +1,209 @@
+"""Batched push notifications: an in-process queue drained in time windows,
+sent through FCM send_each in a worker thread"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+PUSH_BATCH_WINDOW_SECONDS = float(os.getenv('PUSH_BATCH_WINDOW_SECONDS', '0.5'))
+PUSH_MAX_BATCH = 500  # FCM send_each limit per call
+PUSH_QUEUE_SIZE = int(os.getenv('PUSH_QUEUE_SIZE', '10000'))
+RECIPIENT_CACHE_TTL = float(os.getenv('PUSH_RECIPIENT_CACHE_TTL', '300'))
+
+RECIPIENT_PROJECTION = {'_id': 0, 'user_id': 1, 'fcm_token': 1, 'notification_preferences': 1}
+
+@dataclass
+class PushMessage:
+    user_id: str
+    title: str
+    body: str
+    data: Dict[str, str] = field(default_factory=dict)
+    token: Optional[str] = None
+
+@dataclass
+class PushResult:
+    success: bool
+    message_id: Optional[str] = None
+    error: Optional[str] = None
+    unregistered: bool = False  # token is dead and should be forgotten
+
+class FCMTransport:
+    """Firebase Cloud Messaging. Blocking; the dispatcher calls it from a worker thread."""
+
+    def send_batch(self, messages: List[PushMessage]) -> List[PushResult]:
+        from firebase_admin import messaging
+
+        response = messaging.send_each([
+            messaging.Message(
+                notification=messaging.Notification(title=m.title, body=m.body),
+                data=m.data,
+                token=m.token
+            )
+            for m in messages
+        ])
+        return [
+            PushResult(success=True, message_id=r.message_id) if r.success else PushResult(
+                success=False,
+                error=str(r.exception),
+                unregistered=isinstance(r.exception, messaging.UnregisteredError)
+            )
+            for r in response.responses
+        ]
+
+class FakeTransport:
+    """Records batches instead of sending them, for tests and local runs.
+    Tokens listed in unregistered_tokens fail as FCM does for dead tokens."""
+
+    def __init__(self, unregistered_tokens=()):
+        self.batches: List[List[PushMessage]] = []
+        self.unregistered_tokens = set(unregistered_tokens)
+
+    @property
+    def sent(self) -> List[PushMessage]:
+        return [m for batch in self.batches for m in batch]
+
+    def send_batch(self, messages: List[PushMessage]) -> List[PushResult]:
+        self.batches.append(list(messages))
+        return [
+            PushResult(success=False, error='Unregistered', unregistered=True)
+            if m.token in self.unregistered_tokens
+            else PushResult(success=True, message_id=f"fake_{uuid.uuid4().hex[:12]}")
+            for m in messages
+        ]
+
+class PushDispatcher:
+    """enqueue() never blocks a request. A background task collects messages
+    for up to window seconds (or max_batch messages), resolves tokens and
+    preferences from a TTL cache backed by one $in query, drops the ones the
+    recipient has turned off, and sends the rest in one transport call."""
+
+    def __init__(self, db, transport=None, window: float = PUSH_BATCH_WINDOW_SECONDS,
+                 max_batch: int = PUSH_MAX_BATCH, cache_ttl: float = RECIPIENT_CACHE_TTL):
+        self.db = db
+        self.transport = transport or FCMTransport()
+        self.window = window
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=PUSH_QUEUE_SIZE)
+        self.recipients = TTLCache(maxsize=50000, ttl=cache_ttl)
+        # One thread: batches go out in order and FCM connections are reused
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='push')
+        self.stats = {'queued': 0, 'sent': 0, 'failed': 0, 'skipped': 0, 'dropped': 0, 'batches': 0}
+
+    def enqueue(self, user_id: str, title: str, body: str, data: dict = None) -> bool:
+        # FCM data payloads must be string to string; unset fields are left out
+        data = {k: str(v) for k, v in (data or {}).items() if v is not None}
+        message = PushMessage(user_id, title, body, data)
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            logger.warning(f"Push queue full, dropping notification for {user_id}")
+            return False
+        self.stats['queued'] += 1
+        return True
+
+    def invalidate(self, user_id: str):
+        """Call when a user's token or notification preferences change"""
+        self.recipients.pop(user_id, None)
+
+    async def _load_recipients(self, user_ids: List[str]) -> Dict[str, dict]:
+        missing = [user_id for user_id in set(user_ids) if user_id not in self.recipients]
+        if missing:
+            users = await self.db.users.find(
+                {'user_id': {'$in': missing}}, RECIPIENT_PROJECTION
+            ).to_list(len(missing))
+            found = {u['user_id']: u for u in users}
+            for user_id in missing:
+                self.recipients[user_id] = found.get(user_id, {})
+        return {user_id: self.recipients.get(user_id, {}) for user_id in user_ids}
+
+    def _allowed(self, message: PushMessage, recipient: dict) -> bool:
+        if not recipient.get('fcm_token'):
+            return False
+        preferences = recipient.get('notification_preferences') or {}
+        notification_type = message.data.get('type', 'general')
+        return not (notification_type in preferences and not preferences.get(notification_type))
+
+    async def _collect(self) -> List[PushMessage]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def dispatch(self, batch: List[PushMessage]):
+        recipients = await self._load_recipients([m.user_id for m in batch])
+        to_send = []
+        for message in batch:
+            recipient = recipients[message.user_id]
+            if self._allowed(message, recipient):
+                message.token = recipient['fcm_token']
+                to_send.append(message)
+        self.stats['skipped'] += len(batch) - len(to_send)
+        if not to_send:
+            return
+
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self.executor, self.transport.send_batch, to_send)
+        self.stats['batches'] += 1
+
+        now = datetime.now(timezone.utc)
+        notifications = []
+        for message, result in zip(to_send, results):
+            if result.success:
+                notifications.append({
+                    'notification_id': str(uuid.uuid4()),
+                    'user_id': message.user_id,
+                    'title': message.title,
+                    'body': message.body,
+                    'data': message.data,
+                    'sent_at': now,
+                    'read': False
+                })
+                continue
+            logger.error(f"Failed to send push notification to {message.user_id}: {result.error}")
+            if result.unregistered:
+                await self.db.users.update_one(
+                    {'user_id': message.user_id, 'fcm_token': message.token},
+                    {'$unset': {'fcm_token': ''}}
+                )
+                self.invalidate(message.user_id)
+
+        self.stats['sent'] += len(notifications)
+        self.stats['failed'] += len(to_send) - len(notifications)
+        if notifications:
+            await self.db.notifications.insert_many(notifications)
+
+    async def run(self):
+        """Background loop, started with the app"""
+        while True:
+            batch = await self._collect()
+            try:
+                await self.dispatch(batch)
+            except Exception as e:
+                logger.error(f"Failed to send push notification batch of {len(batch)}: {e}")
+
+    async def drain(self):
+        """Send whatever is still queued (on shutdown)"""
+        while not self.queue.empty():
+            batch = []
+            while not self.queue.empty() and len(batch) < self.max_batch:
+                batch.append(self.queue.get_nowait())
+            await self.dispatch(batch)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,126 @@
+"""Vectorized candidate ranking for discover, standouts and daily picks"""
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Feature -> weight. Every feature is normalised to [0, 1], higher is better.
+DEFAULT_WEIGHTS = {
+    'age': 1.0,             # closeness to the user's own age
+    'distance': 1.5,        # closeness in miles (neutral when unknown)
+    'interests': 2.0,       # Jaccard overlap of interests
+    'compatibility': 2.0,   # embedding similarity from the compatibility index
+    'prompts': 0.75,        # answered prompts, saturating at PROMPT_TARGET
+    'photos': 0.75,         # photos, saturating at PHOTO_TARGET
+    'recency': 1.0,         # decays with time since last_active
+    'ambassador': 0.5       # is_ambassador flag
+}
+FEATURES = list(DEFAULT_WEIGHTS)
+
+AGE_SCALE_YEARS = 5.0
+DISTANCE_SCALE_MILES = 10.0
+RECENCY_HALF_LIFE_HOURS = 72.0
+PROMPT_TARGET = 3
+PHOTO_TARGET = 6
+
+def load_weights(overrides: Optional[str] = None) -> Dict[str, float]:
+    """Default weights updated from a JSON object, e.g. RANKING_WEIGHTS='{"distance": 3}'"""
+    weights = dict(DEFAULT_WEIGHTS)
+    if not overrides:
+        return weights
+
+    try:
+        for feature, weight in json.loads(overrides).items():
+            if feature in weights:
+                weights[feature] = float(weight)
+            else:
+                logger.warning(f"Unknown ranking feature ignored: {feature}")
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.error(f"Invalid ranking weights, using defaults: {e}")
+    return weights
+
+def _timestamp(value) -> float:
+    if not isinstance(value, datetime):
+        return np.nan
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def _number(value) -> float:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+def candidate_features(
+    user: dict,
+    candidates: List[dict],
+    now: Optional[datetime] = None,
+    compatibility: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Feature matrix of shape (len(candidates), len(FEATURES)).
+    compatibility holds cosine similarities aligned with candidates (NaN = unknown)."""
+    now = now or datetime.now(timezone.utc)
+    if compatibility is None:
+        compatibility = np.full(len(candidates), np.nan)
+
+    # Gather raw columns in one pass, then do all the maths on whole arrays
+    ages = np.array([_number(c.get('age')) for c in candidates], dtype=float)
+    distances = np.array([_number(c.get('distance')) for c in candidates], dtype=float)
+    prompts = np.array([len(c.get('prompts') or []) for c in candidates], dtype=float)
+    photos = np.array([len(c.get('photos') or []) for c in candidates], dtype=float)
+    last_active = np.array([_timestamp(c.get('last_active')) for c in candidates], dtype=float)
+    ambassador = np.array([bool(c.get('is_ambassador')) for c in candidates], dtype=float)
+
+    user_interests = set(user.get('interests') or [])
+    candidate_interests = [set(c.get('interests') or []) for c in candidates]
+    shared = np.array([len(user_interests & i) for i in candidate_interests], dtype=float)
+    union = np.array([len(user_interests | i) for i in candidate_interests], dtype=float)
+
+    user_age = _number(user.get('age'))
+    age_delta = np.abs(ages - user_age)
+    hours_inactive = np.maximum(now.timestamp() - last_active, 0) / 3600
+
+    features = np.column_stack([
+        1 / (1 + age_delta / AGE_SCALE_YEARS),
+        1 / (1 + distances / DISTANCE_SCALE_MILES),
+        np.divide(shared, union, out=np.zeros_like(shared), where=union > 0),
+        (np.clip(np.asarray(compatibility, dtype=float), -1, 1) + 1) / 2,
+        np.minimum(prompts, PROMPT_TARGET) / PROMPT_TARGET,
+        np.minimum(photos, PHOTO_TARGET) / PHOTO_TARGET,
+        np.exp2(-hours_inactive / RECENCY_HALF_LIFE_HOURS),
+        ambassador
+    ]) if candidates else np.empty((0, len(FEATURES)))
+
+    # Unknown age, distance, similarity or activity is neutral rather than best or worst
+    return np.nan_to_num(features, nan=0.5)
+
+def score_candidates(
+    user: dict,
+    candidates: List[dict],
+    weights: Optional[Dict[str, float]] = None,
+    now: Optional[datetime] = None,
+    compatibility: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Weighted score per candidate, in input order"""
+    weights = weights or DEFAULT_WEIGHTS
+    weight_vector = np.array([weights.get(f, 0.0) for f in FEATURES], dtype=float)
+    return candidate_features(user, candidates, now, compatibility) @ weight_vector
+
+def rank_candidates(
+    user: dict,
+    candidates: List[dict],
+    weights: Optional[Dict[str, float]] = None,
+    limit: Optional[int] = None,
+    now: Optional[datetime] = None,
+    compatibility: Optional[np.ndarray] = None
+) -> List[dict]:
+    """Candidates sorted best first; ties keep their input order"""
+    if not candidates:
+        return []
+
+    scores = score_candidates(user, candidates, weights, now, compatibility)
+    order = np.argsort(-scores, kind='stable')
+    if limit is not None:
+        order = order[:limit]
+    return [candidates[i] for i in order]
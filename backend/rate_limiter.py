@@ -0,0 +1,58 @@
+"""Token-bucket rate limiting with pluggable bucket storage"""
+import time
+from typing import Dict, Tuple
+from cachetools import TTLCache
+
+# Rule name -> bucket shape. capacity is the allowed burst; tokens refill
+# continuously at refill_per_second up to capacity.
+DEFAULT_RULES = {
+    'likes': {'capacity': 20, 'refill_per_second': 1.0},
+    'passes': {'capacity': 20, 'refill_per_second': 1.0},
+    'messages': {'capacity': 20, 'refill_per_second': 0.5}
+}
+
+class BucketStore:
+    """Storage interface for token buckets. A shared implementation (e.g. a
+    Redis Lua script) must make take() atomic across processes."""
+
+    async def take(self, key: str, capacity: float, refill_per_second: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """Consume cost tokens if available; returns (allowed, seconds until allowed)"""
+        raise NotImplementedError
+
+class InMemoryBucketStore(BucketStore):
+    """Per-process buckets for a single node. Idle buckets expire once they
+    would have refilled anyway, which keeps memory bounded."""
+
+    def __init__(self, max_keys: int = 100000, idle_ttl: float = 3600):
+        self.buckets = TTLCache(maxsize=max_keys, ttl=idle_ttl)
+
+    async def take(self, key: str, capacity: float, refill_per_second: float, cost: float = 1.0) -> Tuple[bool, float]:
+        # No awaits between read and write, so this is atomic on the event loop
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = (tokens, now)
+
+        if allowed:
+            return True, 0.0
+        return False, (cost - tokens) / refill_per_second
+
+class RateLimiter:
+    """Applies named rules to keys (usually a user id) against a BucketStore"""
+
+    def __init__(self, store: BucketStore = None, rules: Dict[str, dict] = None):
+        self.store = store or InMemoryBucketStore()
+        self.rules = rules or DEFAULT_RULES
+        self.rejected = {name: 0 for name in self.rules}
+
+    async def hit(self, rule: str, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        spec = self.rules[rule]
+        allowed, retry_after = await self.store.take(
+            f"{rule}:{key}", spec['capacity'], spec['refill_per_second'], cost
+        )
+        if not allowed:
+            self.rejected[rule] = self.rejected.get(rule, 0) + 1
+        return allowed, retry_after
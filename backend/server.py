@@ -1,20 +1,24 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, WebSocket, WebSocketDisconnect, UploadFile, File, Header
 from fastapi.security import HTTPBearer
-from fastapi.staticfiles import StaticFiles
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import uuid
 from datetime import datetime, timezone, timedelta
+from collections import deque
+import copy
+from cachetools import TTLCache
+import hashlib
+import math
 import httpx
-import bcrypt
 import jwt
-from openai import OpenAI
 import json
 import asyncio
 import aiofiles
@@ -24,7 +28,20 @@ import cloudinary
 import cloudinary.uploader
 import cloudinary.api
 import firebase_admin
-from firebase_admin import credentials, messaging
+from firebase_admin import credentials
+from translation_service import translation_service
+from ranking_engine import load_weights, rank_candidates
+from compatibility_index import CompatibilityIndex
+from ai_gateway import AIGateway
+from upload_pipeline import UploadSizeLimitMiddleware, too_large, MAX_UPLOAD_BYTES
+from media_storage import LocalStorage, create_storage, is_safe_public_id
+from password_hasher import PasswordHasher, PasswordHasherBusy
+from rate_limiter import RateLimiter
+from daily_limits import LIMITS_PROJECTION, format_daily_limits, consume_daily_limit as consume_user_limit
+from ws_backplane import Backplane, create_backplane
+from ws_connection import ClientConnection
+from presence import PresenceService
+from push_dispatcher import PushDispatcher, FCMTransport, FakeTransport
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -49,16 +66,28 @@ cloudinary.config(
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)  # timestamps are stored as BSON dates
 db = client[os.environ['DB_NAME']]
 fs = AsyncIOMotorGridFSBucket(db)
+compatibility_index = CompatibilityIndex(db.compatibility_index)
 
-# OpenAI client for AI features
-openai_client = OpenAI(api_key=os.environ.get('EMERGENT_LLM_KEY', ''))
+# Async LLM gateway for AI features (AI_BACKEND=local for the offline stand-in)
+ai_gateway = AIGateway()
+
+# Candidate ranking weights, JSON overrides of ranking_engine.DEFAULT_WEIGHTS
+RANKING_WEIGHTS = load_weights(os.environ.get('RANKING_WEIGHTS'))
+
+# LLM re-ranking of the top ranked profiles (off by default: slow and paid)
+AI_RERANK_ENABLED = os.environ.get('AI_RERANK_ENABLED', 'false').lower() == 'true'
+AI_RERANK_POOL = int(os.environ.get('AI_RERANK_POOL', '10'))
 
 # Stripe configuration - REMOVED (no longer using Stripe)
 # stripe.api_key = os.environ.get('STRIPE_API_KEY', '')
 
+# bcrypt runs in its own bounded thread pool (BCRYPT_WORKERS / BCRYPT_MAX_QUEUE)
+password_hasher = PasswordHasher()
+PASSWORD_HASHING_METRICS_SECONDS = int(os.environ.get('PASSWORD_HASHING_METRICS_SECONDS', '60'))
+
 # JWT Secret
 JWT_SECRET = os.environ.get('JWT_SECRET', 'ember-secret-key-2024')
 JWT_ALGORITHM = 'HS256'
@@ -67,6 +96,12 @@ JWT_ALGORITHM = 'HS256'
 UPLOAD_DIR = ROOT_DIR / 'uploads'
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Media storage for photo/video uploads: MEDIA_STORAGE=cloudinary (default) or local
+MEDIA_BASE_URL = os.environ.get('MEDIA_BASE_URL', '')
+media_storage = create_storage(os.environ.get('MEDIA_STORAGE', 'cloudinary'), UPLOAD_DIR, MEDIA_BASE_URL)
+# UPLOAD_DIR is always served at /api/uploads, whichever driver takes new uploads
+local_media = media_storage if isinstance(media_storage, LocalStorage) else LocalStorage(UPLOAD_DIR, MEDIA_BASE_URL)
+
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -117,33 +152,125 @@ TURN_SERVERS = [
 
 # ==================== WEBSOCKET CONNECTION MANAGER ====================
 
+CALL_SESSION_TTL = 4 * 3600  # longest call we keep signalling state for
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.call_sessions: Dict[str, Dict] = {}
+    """A user may be connected from several devices; each connection has its
+    own send queue and writer task so no producer waits on a slow socket."""
 
-    async def connect(self, websocket: WebSocket, user_id: str):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        logger.info(f"User {user_id} connected via WebSocket")
+    def __init__(self, backplane: Backplane, presence: PresenceService):
+        self.active_connections: Dict[str, Set[ClientConnection]] = {}
+        # call_id -> {'caller_id', 'callee_id', 'status'}; signalling is relayed from here
+        self.call_sessions: TTLCache = TTLCache(maxsize=10000, ttl=CALL_SESSION_TTL)
+        self.backplane = backplane
+        self.presence = presence
 
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
+    async def connect(self, websocket: WebSocket, user_id: str) -> ClientConnection:
+        await websocket.accept()
+        connection = ClientConnection(websocket, user_id)
+        connection.start()
+        first = user_id not in self.active_connections
+        self.active_connections.setdefault(user_id, set()).add(connection)
+        self.presence.connected(user_id)
+        if first:
+            await self.backplane.user_connected(user_id)
+        
+        # Registered first so match changes during the load are not missed
+        try:
+            connection.match_peers = await load_match_peers(user_id)
+        except Exception:
+            await self.disconnect(connection)
+            raise
+        connection.match_peers_loaded = True
+        for message in connection.pending_match_frames:
+            track_match_frame(connection, message)
+        connection.pending_match_frames.clear()
+        logger.info(f"User {user_id} connected via WebSocket ({len(self.active_connections[user_id])} devices)")
+        return connection
+
+    async def disconnect(self, connection: ClientConnection):
+        connection.close()
+        user_id = connection.user_id
+        connections = self.active_connections.get(user_id)
+        if connections is None or connection not in connections:
+            return
+        connections.discard(connection)
+        self.presence.disconnected(user_id)
+        if not connections:
             del self.active_connections[user_id]
-            logger.info(f"User {user_id} disconnected")
+            await self.backplane.user_disconnected(user_id)
+        logger.info(f"User {user_id} disconnected")
+
+    def is_online(self, user_id: str) -> bool:
+        """Connected to this worker or, through the backplane, any other"""
+        return self.presence.is_online(user_id)
+
+    async def deliver_local(self, user_id: str, message: dict):
+        for connection in list(self.active_connections.get(user_id, ())):
+            track_match_frame(connection, message)
+            connection.send(message)
 
     async def send_personal_message(self, message: dict, user_id: str):
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending message to {user_id}: {e}")
+        # Queued per device; the same user may also hold a socket on another worker
+        message = jsonable_encoder(message)
+        await self.deliver_local(user_id, message)
+        await self.backplane.publish(user_id, message)
 
     async def broadcast_to_match(self, message: dict, user_ids: List[str]):
         for user_id in user_ids:
             await self.send_personal_message(message, user_id)
 
-manager = ConnectionManager()
+    async def handle_control(self, message: dict):
+        """Shared-state changes broadcast by other workers"""
+        if message.get('type') == 'call_closed':
+            self.call_sessions.pop(message['call_id'], None)
+
+    async def start(self):
+        await self.backplane.start(self.deliver_local, lambda: set(self.active_connections), self.handle_control)
+
+    async def stop(self):
+        await self.backplane.stop()
+
+# Frames that end a match; the connection's typing cache forgets it
+MATCH_REMOVED_FRAMES = {'unmatched', 'match_expired'}
+
+async def load_match_peers(user_id: str) -> Dict[str, str]:
+    """match_id -> other user for every match of user_id, loaded once per connection"""
+    matches = await db.matches.find(
+        {'$or': [{'user1_id': user_id}, {'user2_id': user_id}]},
+        {'_id': 0, 'match_id': 1, 'user1_id': 1, 'user2_id': 1}
+    ).to_list(None)
+    return {
+        m['match_id']: m['user2_id'] if m['user1_id'] == user_id else m['user1_id']
+        for m in matches
+    }
+
+def track_match_frame(connection: ClientConnection, message: dict):
+    """Keep the match cache current from the frames the user is sent, which
+    reach every worker the user is connected to. Runs on the sender's request
+    path, so a malformed frame is ignored rather than raised."""
+    frame_type = message.get('type')
+    if frame_type != 'new_match' and frame_type not in MATCH_REMOVED_FRAMES:
+        return
+    if not connection.match_peers_loaded:
+        connection.pending_match_frames.append(message)
+        return
+    
+    match_id = message.get('match_id')
+    if frame_type == 'new_match':
+        peer_id = (message.get('matched_user') or {}).get('user_id')
+        if match_id and peer_id:
+            connection.match_peers[match_id] = peer_id
+    elif match_id:
+        connection.forget_match(match_id)
+
+# Push notifications are queued and sent in batches (PUSH_TRANSPORT=fake records instead)
+push_dispatcher = PushDispatcher(db, FakeTransport() if os.environ.get('PUSH_TRANSPORT') == 'fake' else FCMTransport())
+
+# WS_BACKPLANE=mongo fans events out across workers; the default only reaches local sockets
+ws_backplane = create_backplane(os.environ.get('WS_BACKPLANE', 'memory'), db)
+presence = PresenceService(db.users, remote_online=ws_backplane.is_online_elsewhere)
+manager = ConnectionManager(ws_backplane, presence)
 
 # ==================== MODELS ====================
 
@@ -254,15 +381,96 @@ class FilterPreferences(BaseModel):
     ethnicities: Optional[List[str]] = None
     sub_ethnicities: Optional[List[str]] = None
 
+# ==================== PROFILE PROJECTIONS ====================
+
+# Projections used whenever one user's profile is shown to another. They are
+# inclusion-only so private fields (password, email, fcm_token, verification
+# codes, swipe counters, filter preferences, exact coordinates) never leave
+# the database.
+
+# Discover cards, standouts, daily picks and likes
+CARD_PROJECTION = {
+    '_id': 0,
+    'user_id': 1,
+    'name': 1,
+    'age': 1,
+    'location': 1,
+    'bio': 1,
+    'photos': 1,
+    'video_url': 1,
+    'prompts': 1,
+    'interests': 1,
+    'is_ambassador': 1,
+    'verification_status': 1,
+    'created_at': 1,
+    'last_active': 1
+}
+
+# Chat list, likes, blocked list and match notifications (avatar only)
+MATCH_LIST_PROJECTION = {
+    '_id': 0,
+    'user_id': 1,
+    'name': 1,
+    'age': 1,
+    'photos': {'$slice': 1},
+    'is_ambassador': 1,
+    'verification_status': 1,
+    'last_active': 1
+}
+
+# Full public profile page
+FULL_PROFILE_PROJECTION = {
+    **CARD_PROJECTION,
+    'picture': 1,
+    'gender': 1,
+    'interested_in': 1,
+    'height': 1,
+    'education': 1,
+    'dating_purpose': 1,
+    'religion': 1,
+    'languages': 1,
+    'children': 1,
+    'political_view': 1,
+    'has_pets': 1,
+    'ethnicity': 1,
+    'sub_ethnicity': 1
+}
+
+async def hydrate_users(user_ids: List[str], projection: dict = CARD_PROJECTION) -> Dict[str, dict]:
+    """Load many users in one $in query, keyed by user_id in the order given.
+    Duplicate IDs are fetched once; unknown IDs are left out."""
+    unique_ids = list(dict.fromkeys(user_ids))
+    if not unique_ids:
+        return {}
+    
+    users = await db.users.find({'user_id': {'$in': unique_ids}}, projection).to_list(len(unique_ids))
+    by_id = {u['user_id']: u for u in users}
+    return {user_id: by_id[user_id] for user_id in unique_ids if user_id in by_id}
+
 # ==================== AUTH HELPERS ====================
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail='Too many sign-in attempts right now, please try again shortly')
+
+async def verify_password(password: str, hashed: str) -> bool:
+    try:
+        return await password_hasher.verify(password, hashed)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail='Too many sign-in attempts right now, please try again shortly')
 
-def verify_password(password: str, hashed: str) -> bool:
-    if not hashed:
-        return False
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+async def log_password_hashing_metrics():
+    """Background task: log bcrypt pool queue depth and timings while it is in use"""
+    last_seen = None
+    while True:
+        await asyncio.sleep(PASSWORD_HASHING_METRICS_SECONDS)
+        metrics = password_hasher.metrics()
+        activity = (metrics['completed'], metrics['rejected'], metrics['queued'], metrics['running'])
+        if activity != last_seen:
+            logger.info(f"Password hashing: {metrics}")
+            last_seen = activity
 
 def create_token(user_id: str) -> str:
     payload = {
@@ -273,139 +481,213 @@ def create_token(user_id: str) -> str:
 
 # ==================== PHASE 1 HELPER FUNCTIONS ====================
 
-async def reset_daily_limits_if_needed(user: dict) -> dict:
-    """Reset swipe/super like/rose limits if 24 hours have passed"""
-    now = datetime.now(timezone.utc)
-    updated = False
-    updates = {}
-    
-    # Reset swipe limit
-    if 'swipe_limit' in user:
-        last_reset = user['swipe_limit'].get('last_reset')
-        if isinstance(last_reset, str):
-            last_reset = datetime.fromisoformat(last_reset)
-        if last_reset.tzinfo is None:
-            last_reset = last_reset.replace(tzinfo=timezone.utc)
-        
-        if (now - last_reset).total_seconds() >= 86400:  # 24 hours
-            updates['swipe_limit.count'] = 0
-            updates['swipe_limit.last_reset'] = now.isoformat()
-            updated = True
-    
-    # Reset super like limit
-    if 'super_like_limit' in user:
-        last_reset = user['super_like_limit'].get('last_reset')
-        if isinstance(last_reset, str):
-            last_reset = datetime.fromisoformat(last_reset)
-        if last_reset.tzinfo is None:
-            last_reset = last_reset.replace(tzinfo=timezone.utc)
-        
-        if (now - last_reset).total_seconds() >= 86400:
-            updates['super_like_limit.count'] = 0
-            updates['super_like_limit.last_reset'] = now.isoformat()
-            updated = True
-    
-    # Reset rose limit
-    if 'rose_limit' in user:
-        last_reset = user['rose_limit'].get('last_reset')
-        if isinstance(last_reset, str):
-            last_reset = datetime.fromisoformat(last_reset)
-        if last_reset.tzinfo is None:
-            last_reset = last_reset.replace(tzinfo=timezone.utc)
-        
-        if (now - last_reset).total_seconds() >= 86400:
-            updates['rose_limit.count'] = 0
-            updates['rose_limit.last_reset'] = now.isoformat()
-            updated = True
-    
-    if updated:
-        await db.users.update_one({'user_id': user['user_id']}, {'$set': updates})
-        user = await db.users.find_one({'user_id': user['user_id']}, {'_id': 0})
-    
-    return user
-
-async def check_swipe_limit(user: dict) -> bool:
-    """Check if user has swipes remaining (returns True if can swipe)"""
-    # Premium users have unlimited swipes
-    if user.get('is_premium'):
-        return True
-    
-    # Reset limits if needed
-    user = await reset_daily_limits_if_needed(user)
-    
-    swipe_limit = user.get('swipe_limit', {})
-    count = swipe_limit.get('count', 0)
-    daily_max = swipe_limit.get('daily_max', 10)
-    
-    return count < daily_max
-
-async def increment_swipe_count(user_id: str):
-    """Increment the swipe counter"""
-    await db.users.update_one(
-        {'user_id': user_id},
-        {'$inc': {'swipe_limit.count': 1}}
-    )
-
-async def check_super_like_limit(user: dict) -> bool:
-    """Check if user has super likes remaining"""
-    user = await reset_daily_limits_if_needed(user)
-    
-    limit = user.get('super_like_limit', {})
-    count = limit.get('count', 0)
-    daily_max = limit.get('daily_max', 3)
-    
-    return count < daily_max
-
-async def check_rose_limit(user: dict) -> bool:
-    """Check if user has roses remaining"""
-    user = await reset_daily_limits_if_needed(user)
-    
-    limit = user.get('rose_limit', {})
-    count = limit.get('count', 0)
-    daily_max = limit.get('daily_max', 1)
-    
-    return count < daily_max
+async def consume_daily_limit(user_id: str, kind: str) -> Optional[dict]:
+    """Consume one of the user's daily quotas; None if it is used up"""
+    limits = await consume_user_limit(db.users, user_id, kind)
+    if limits is not None:
+        invalidate_user(user_id)
+    return limits
 
 def generate_verification_code() -> str:
     """Generate 6-digit verification code"""
     import random
     return ''.join([str(random.randint(0, 9)) for _ in range(6)])
 
-async def get_current_user(request: Request, credentials = Depends(security)) -> dict:
+def encode_cursor(values: list) -> str:
+    """Opaque pagination cursor holding the sort key of the last item returned"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    return values
+
+# Short-lived per-process caches so chatty endpoints don't hit Mongo just to
+# authenticate. Writes to a user call invalidate_user(); the TTL bounds how
+# stale another worker process can be.
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '5'))
+user_cache = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL)
+session_cache = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL)
+account_cache = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL)  # user_id -> account is usable
+
+# Just enough of the user document to tell whether a token's account still exists
+ACCOUNT_PROJECTION = {'_id': 0, 'user_id': 1, 'deleted_at': 1, 'is_deleted': 1}
+
+def invalidate_user(user_id: str):
+    user_cache.pop(user_id, None)
+    account_cache.pop(user_id, None)
+
+def invalidate_session(session_token: str):
+    session_cache.pop(session_token, None)
+
+async def get_cached_user(user_id: str) -> Optional[dict]:
+    """Shared cached user document; read-only, use load_user to get a copy"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({'user_id': user_id}, {'_id': 0})
+        if not user:
+            return None
+        user_cache[user_id] = user
+    return user
+
+def is_deleted_account(user: dict) -> bool:
+    return bool(user.get('deleted_at') or user.get('is_deleted'))
+
+async def load_user(user_id: str) -> Optional[dict]:
+    """User document by id, served from user_cache when fresh"""
+    user = await get_cached_user(user_id)
+    if user is None:
+        return None
+    # Handlers may mutate current_user, so never hand out the cached object
+    return copy.deepcopy(user)
+
+async def is_active_account(user_id: str) -> bool:
+    """Whether the user exists and isn't deleted, without loading the full document"""
+    user = user_cache.get(user_id)
+    if user is not None:
+        return not is_deleted_account(user)
+    
+    active = account_cache.get(user_id)
+    if active is None:
+        account = await db.users.find_one({'user_id': user_id}, ACCOUNT_PROJECTION)
+        active = bool(account) and not is_deleted_account(account)
+        account_cache[user_id] = active
+    return active
+
+async def get_session_user_id(session_token: str) -> Optional[str]:
+    now = datetime.now(timezone.utc)
+    cached = session_cache.get(session_token)
+    if cached and cached['expires_at'] > now:
+        return cached['user_id']
+    
+    session = await db.user_sessions.find_one({
+        'session_token': session_token,
+        'expires_at': {'$gt': now}
+    }, {'_id': 0, 'user_id': 1, 'expires_at': 1})
+    if not session:
+        return None
+    session_cache[session_token] = session
+    return session['user_id']
+
+async def authenticate_user_id(request: Request, credentials) -> str:
     session_token = request.cookies.get('session_token')
     if session_token:
-        session = await db.user_sessions.find_one({'session_token': session_token}, {'_id': 0})
-        if session:
-            expires_at = session.get('expires_at')
-            if isinstance(expires_at, str):
-                expires_at = datetime.fromisoformat(expires_at)
-            if expires_at.tzinfo is None:
-                expires_at = expires_at.replace(tzinfo=timezone.utc)
-            if expires_at > datetime.now(timezone.utc):
-                user = await db.users.find_one({'user_id': session['user_id']}, {'_id': 0})
-                if user:
-                    return user
+        user_id = await get_session_user_id(session_token)
+        if user_id:
+            return user_id
     
     if credentials:
         try:
             payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            user = await db.users.find_one({'user_id': payload['user_id']}, {'_id': 0})
-            if user:
-                return user
+            return payload['user_id']
         except jwt.ExpiredSignatureError:
             raise HTTPException(status_code=401, detail='Token expired')
-        except jwt.InvalidTokenError:
+        except (jwt.InvalidTokenError, KeyError):
             raise HTTPException(status_code=401, detail='Invalid token')
     
     raise HTTPException(status_code=401, detail='Not authenticated')
 
+async def get_current_user_id(request: Request, credentials = Depends(security)) -> str:
+    """Authenticate without loading the user document; tokens of missing or
+    deleted accounts are rejected via a narrow, cached lookup."""
+    user_id = await authenticate_user_id(request, credentials)
+    if not await is_active_account(user_id):
+        raise HTTPException(status_code=401, detail='Not authenticated')
+    return user_id
+
+# Per-user request rate limits (token buckets, see rate_limiter.DEFAULT_RULES)
+rate_limiter = RateLimiter()
+
+def rate_limited(rule: str):
+    """Route dependency that sheds a user's requests over the rule's rate.
+    Runs before the handler's own dependencies and queries."""
+    async def check_rate_limit(user_id: str = Depends(get_current_user_id)):
+        allowed, retry_after = await rate_limiter.hit(rule, user_id)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail='Too many requests, please slow down',
+                headers={'Retry-After': str(math.ceil(retry_after))}
+            )
+    return Depends(check_rate_limit)
+
+async def get_current_user(user_id: str = Depends(get_current_user_id)) -> dict:
+    user = await load_user(user_id)
+    if not user:
+        raise HTTPException(status_code=401, detail='Not authenticated')
+    return user
+
 async def get_user_from_token(token: str) -> Optional[dict]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({'user_id': payload['user_id']}, {'_id': 0})
-        return user
+        user = await load_user(payload['user_id'])
     except:
         return None
+    if user and is_deleted_account(user):
+        return None
+    return user
+
+# ==================== DISCOVER EXCLUSIONS ====================
+
+# One document per user in `discover_exclusions`, holding everyone that user
+# should no longer see in Discover, split by reason so each can be undone
+# independently (unblock, unmatch, undo pass, rejected like).
+DISCOVER_EXCLUSION_FIELDS = ['liked', 'passed', 'matched', 'blocked', 'blocked_by']
+
+async def add_discover_exclusion(user_id: str, field: str, other_user_id: str):
+    """Add a user to another user's Discover exclusion set"""
+    await db.discover_exclusions.update_one(
+        {'user_id': user_id},
+        {'$addToSet': {field: other_user_id}},
+        upsert=True
+    )
+
+async def remove_discover_exclusion(user_id: str, field: str, other_user_id: str):
+    """Remove a user from another user's Discover exclusion set"""
+    await db.discover_exclusions.update_one(
+        {'user_id': user_id},
+        {'$pull': {field: other_user_id}}
+    )
+
+async def rebuild_discover_exclusions(user_id: str) -> dict:
+    """Backfill the exclusion document from likes, matches and blocks"""
+    liked = await db.likes.distinct('liked_user_id', {'liker_id': user_id})
+    matched_as_user1 = await db.matches.distinct('user2_id', {'user1_id': user_id})
+    matched_as_user2 = await db.matches.distinct('user1_id', {'user2_id': user_id})
+    blocked = await db.blocks.distinct('blocked_id', {'blocker_id': user_id})
+    blocked_by = await db.blocks.distinct('blocker_id', {'blocked_id': user_id})
+
+    # $addToSet keeps anything written concurrently by the incremental updates
+    return await db.discover_exclusions.find_one_and_update(
+        {'user_id': user_id},
+        {
+            '$addToSet': {
+                'liked': {'$each': liked},
+                'matched': {'$each': matched_as_user1 + matched_as_user2},
+                'blocked': {'$each': blocked},
+                'blocked_by': {'$each': blocked_by}
+            },
+            '$set': {'rebuilt_at': datetime.now(timezone.utc)}
+        },
+        projection={'_id': 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+async def get_discover_exclusions(user_id: str) -> set:
+    """Get every user ID that should be hidden from this user's Discover deck"""
+    doc = await db.discover_exclusions.find_one({'user_id': user_id}, {'_id': 0})
+    if not doc or not doc.get('rebuilt_at'):
+        doc = await rebuild_discover_exclusions(user_id)
+
+    excluded = set()
+    for field in DISCOVER_EXCLUSION_FIELDS:
+        excluded.update(doc.get(field, []))
+    return excluded
 
 # ==================== AUTH ROUTES ====================
 
@@ -416,12 +698,12 @@ async def register(user_data: UserCreate):
         raise HTTPException(status_code=400, detail='Email already registered')
     
     user_id = f"user_{uuid.uuid4().hex[:12]}"
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     user_doc = {
         'user_id': user_id,
         'email': user_data.email,
-        'password': hash_password(user_data.password),
+        'password': await hash_password(user_data.password),
         'name': user_data.name,
         'picture': None,
         'age': None,
@@ -499,11 +781,12 @@ async def register(user_data: UserCreate):
 @api_router.post("/auth/login")
 async def login(user_data: UserLogin):
     user = await db.users.find_one({'email': user_data.email}, {'_id': 0})
-    if not user or not verify_password(user_data.password, user.get('password')):
+    if not user or not await verify_password(user_data.password, user.get('password')):
         raise HTTPException(status_code=401, detail='Invalid credentials')
     
     token = create_token(user['user_id'])
-    await db.users.update_one({'user_id': user['user_id']}, {'$set': {'last_active': datetime.now(timezone.utc).isoformat()}})
+    await db.users.update_one({'user_id': user['user_id']}, {'$set': {'last_active': datetime.now(timezone.utc)}})
+    invalidate_user(user['user_id'])
     
     return {'token': token, 'user': {k: v for k, v in user.items() if k != 'password'}}
 
@@ -565,9 +848,9 @@ async def google_session(request: Request, response: Response):
             'phone_verification': {'status': 'pending', 'phone': None, 'verified_at': None, 'code': None, 'expires_at': None},
             'id_verification': {'status': 'pending', 'id_photo_url': None, 'verified_at': None},
             # Swipe limits
-            'swipe_limit': {'count': 0, 'last_reset': now.isoformat(), 'daily_max': 10},
-            'super_like_limit': {'count': 0, 'last_reset': now.isoformat(), 'daily_max': 3},
-            'rose_limit': {'count': 0, 'last_reset': now.isoformat(), 'daily_max': 1},
+            'swipe_limit': {'count': 0, 'last_reset': now, 'daily_max': 10},
+            'super_like_limit': {'count': 0, 'last_reset': now, 'daily_max': 3},
+            'rose_limit': {'count': 0, 'last_reset': now, 'daily_max': 1},
             'last_passed_user_id': None,
             'last_passed_at': None,
             # Phase 2: Filter preferences
@@ -597,20 +880,20 @@ async def google_session(request: Request, response: Response):
             'has_pets': None,
             'ethnicity': None,
             'sub_ethnicity': None,
-            'created_at': now.isoformat(),
-            'last_active': now.isoformat()
+            'created_at': now,
+            'last_active': now
         }
         await db.users.insert_one(user)
     else:
-        await db.users.update_one({'email': google_data['email']}, {'$set': {'last_active': now.isoformat()}})
+        await db.users.update_one({'email': google_data['email']}, {'$set': {'last_active': now}})
         user = await db.users.find_one({'email': google_data['email']}, {'_id': 0})
     
     session_token = google_data['session_token']
     await db.user_sessions.insert_one({
         'user_id': user['user_id'],
         'session_token': session_token,
-        'expires_at': (now + timedelta(days=7)).isoformat(),
-        'created_at': now.isoformat()
+        'expires_at': now + timedelta(days=7),
+        'created_at': now
     })
     
     response.set_cookie(
@@ -675,9 +958,9 @@ async def apple_session(request: Request, response: Response):
             'phone_verification': {'status': 'pending', 'phone': None, 'verified_at': None, 'code': None, 'expires_at': None},
             'id_verification': {'status': 'pending', 'id_photo_url': None, 'verified_at': None},
             # Swipe limits
-            'swipe_limit': {'count': 0, 'last_reset': now.isoformat(), 'daily_max': 10},
-            'super_like_limit': {'count': 0, 'last_reset': now.isoformat(), 'daily_max': 3},
-            'rose_limit': {'count': 0, 'last_reset': now.isoformat(), 'daily_max': 1},
+            'swipe_limit': {'count': 0, 'last_reset': now, 'daily_max': 10},
+            'super_like_limit': {'count': 0, 'last_reset': now, 'daily_max': 3},
+            'rose_limit': {'count': 0, 'last_reset': now, 'daily_max': 1},
             'last_passed_user_id': None,
             'last_passed_at': None,
             # Phase 2: Filter preferences
@@ -707,20 +990,20 @@ async def apple_session(request: Request, response: Response):
             'has_pets': None,
             'ethnicity': None,
             'sub_ethnicity': None,
-            'created_at': now.isoformat(),
-            'last_active': now.isoformat()
+            'created_at': now,
+            'last_active': now
         }
         await db.users.insert_one(user)
     else:
-        await db.users.update_one({'email': apple_data['email']}, {'$set': {'last_active': now.isoformat()}})
+        await db.users.update_one({'email': apple_data['email']}, {'$set': {'last_active': now}})
         user = await db.users.find_one({'email': apple_data['email']}, {'_id': 0})
     
     session_token = apple_data['session_token']
     await db.user_sessions.insert_one({
         'user_id': user['user_id'],
         'session_token': session_token,
-        'expires_at': (now + timedelta(days=7)).isoformat(),
-        'created_at': now.isoformat()
+        'expires_at': now + timedelta(days=7),
+        'created_at': now
     })
     
     response.set_cookie(
@@ -744,6 +1027,7 @@ async def logout(request: Request, response: Response):
     session_token = request.cookies.get('session_token')
     if session_token:
         await db.user_sessions.delete_one({'session_token': session_token})
+        invalidate_session(session_token)
     response.delete_cookie('session_token', path='/')
     return {'message': 'Logged out'}
 
@@ -768,8 +1052,8 @@ async def get_verification_status(current_user: dict = Depends(get_current_user)
 async def verify_photo(data: PhotoVerification, current_user: dict = Depends(get_current_user)):
     """Upload selfie for photo verification"""
     try:
-        # Upload selfie to Cloudinary
-        result = cloudinary.uploader.upload(
+        # Upload selfie to media storage
+        result = await media_storage.save_photo(
             data.selfie_data,
             folder=f"ember/verification/{current_user['user_id']}",
             public_id=f"selfie_{uuid.uuid4().hex[:8]}",
@@ -777,15 +1061,16 @@ async def verify_photo(data: PhotoVerification, current_user: dict = Depends(get
                 {'width': 500, 'height': 500, 'crop': 'fill'},
                 {'quality': 'auto'},
                 {'fetch_format': 'auto'}
-            ]
+            ],
+            thumbnail=False
         )
         
-        now = datetime.now(timezone.utc).isoformat()
+        now = datetime.now(timezone.utc)
         
         # Update user verification
         updates = {
             'photo_verification.status': 'verified',
-            'photo_verification.selfie_url': result['secure_url'],
+            'photo_verification.selfie_url': result['url'],
             'photo_verification.verified_at': now
         }
         
@@ -801,6 +1086,7 @@ async def verify_photo(data: PhotoVerification, current_user: dict = Depends(get
             updates['verification_status'] = 'verified'
         
         await db.users.update_one({'user_id': current_user['user_id']}, {'$set': updates})
+        invalidate_user(current_user['user_id'])
         
         return {'message': 'Photo verification successful', 'status': 'verified'}
     
@@ -813,7 +1099,7 @@ async def send_phone_code(data: PhoneSendCode, current_user: dict = Depends(get_
     """Send SMS verification code"""
     # Generate 6-digit code
     code = generate_verification_code()
-    expires_at = (datetime.now(timezone.utc) + timedelta(minutes=10)).isoformat()
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=10)
     
     # Store code in user document
     await db.users.update_one(
@@ -824,6 +1110,7 @@ async def send_phone_code(data: PhoneSendCode, current_user: dict = Depends(get_
             'phone_verification.expires_at': expires_at
         }}
     )
+    invalidate_user(current_user['user_id'])
     
     # TODO: In production, integrate Twilio to send actual SMS
     # For now, return the code for testing purposes
@@ -853,11 +1140,6 @@ async def verify_phone_code(data: PhoneVerifyCode, current_user: dict = Depends(
         raise HTTPException(status_code=400, detail='Phone number mismatch')
     
     # Check expiration
-    if isinstance(expires_at, str):
-        expires_at = datetime.fromisoformat(expires_at)
-    if expires_at.tzinfo is None:
-        expires_at = expires_at.replace(tzinfo=timezone.utc)
-    
     if datetime.now(timezone.utc) > expires_at:
         raise HTTPException(status_code=400, detail='Verification code expired')
     
@@ -865,7 +1147,7 @@ async def verify_phone_code(data: PhoneVerifyCode, current_user: dict = Depends(
         raise HTTPException(status_code=400, detail='Invalid verification code')
     
     # Mark as verified
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     updates = {
         'phone_verification.status': 'verified',
         'phone_verification.verified_at': now
@@ -882,6 +1164,7 @@ async def verify_phone_code(data: PhoneVerifyCode, current_user: dict = Depends(
         updates['verification_status'] = 'verified'
     
     await db.users.update_one({'user_id': current_user['user_id']}, {'$set': updates})
+    invalidate_user(current_user['user_id'])
     
     return {'message': 'Phone verification successful', 'status': 'verified'}
 
@@ -889,23 +1172,24 @@ async def verify_phone_code(data: PhoneVerifyCode, current_user: dict = Depends(
 async def verify_id(data: IDVerification, current_user: dict = Depends(get_current_user)):
     """Upload ID document for verification"""
     try:
-        # Upload ID to Cloudinary
-        result = cloudinary.uploader.upload(
+        # Upload ID to media storage
+        result = await media_storage.save_photo(
             data.id_photo_data,
             folder=f"ember/verification/{current_user['user_id']}",
             public_id=f"id_{uuid.uuid4().hex[:8]}",
             transformation=[
                 {'quality': 'auto'},
                 {'fetch_format': 'auto'}
-            ]
+            ],
+            thumbnail=False
         )
         
-        now = datetime.now(timezone.utc).isoformat()
+        now = datetime.now(timezone.utc)
         
         # Update user verification
         updates = {
             'id_verification.status': 'verified',
-            'id_verification.id_photo_url': result['secure_url'],
+            'id_verification.id_photo_url': result['url'],
             'id_verification.verified_at': now
         }
         
@@ -921,6 +1205,7 @@ async def verify_id(data: IDVerification, current_user: dict = Depends(get_curre
             updates['verification_status'] = 'verified'
         
         await db.users.update_one({'user_id': current_user['user_id']}, {'$set': updates})
+        invalidate_user(current_user['user_id'])
         
         return {'message': 'ID verification successful', 'status': 'verified'}
     
@@ -931,52 +1216,27 @@ async def verify_id(data: IDVerification, current_user: dict = Depends(get_curre
 # ==================== SWIPE LIMITS ROUTES ====================
 
 @api_router.get("/limits/swipes")
-async def get_swipe_limits(current_user: dict = Depends(get_current_user)):
+async def get_swipe_limits(current_user_id: str = Depends(get_current_user_id)):
     """Get remaining swipes, super likes, and roses"""
-    # Reset limits if needed
-    user = await reset_daily_limits_if_needed(current_user)
-    
-    swipe_limit = user.get('swipe_limit', {})
-    super_like_limit = user.get('super_like_limit', {})
-    rose_limit = user.get('rose_limit', {})
-    
-    is_premium = user.get('is_premium', False)
-    
-    return {
-        'swipes': {
-            'used': swipe_limit.get('count', 0),
-            'max': swipe_limit.get('daily_max', 10),
-            'remaining': 'unlimited' if is_premium else max(0, swipe_limit.get('daily_max', 10) - swipe_limit.get('count', 0)),
-            'unlimited': is_premium
-        },
-        'super_likes': {
-            'used': super_like_limit.get('count', 0),
-            'max': super_like_limit.get('daily_max', 3),
-            'remaining': max(0, super_like_limit.get('daily_max', 3) - super_like_limit.get('count', 0))
-        },
-        'roses': {
-            'used': rose_limit.get('count', 0),
-            'max': rose_limit.get('daily_max', 1),
-            'remaining': max(0, rose_limit.get('daily_max', 1) - rose_limit.get('count', 0))
-        }
-    }
+    user = await db.users.find_one({'user_id': current_user_id}, LIMITS_PROJECTION)
+    if not user:
+        raise HTTPException(status_code=404, detail='User not found')
+    return format_daily_limits(user, datetime.now(timezone.utc))
 
-@api_router.post("/discover/pass")
+@api_router.post("/discover/pass", dependencies=[rate_limited('passes')])
 async def pass_profile(liked_user_id: str, current_user: dict = Depends(get_current_user)):
     """Pass on a profile (counts toward daily swipe limit)"""
     # Check verification
     if current_user.get('verification_status') != 'verified':
         raise HTTPException(status_code=403, detail='Profile verification required')
     
-    # Check swipe limit
-    if not await check_swipe_limit(current_user):
+    # Check and use up one swipe
+    limits = await consume_daily_limit(current_user['user_id'], 'swipes')
+    if limits is None:
         raise HTTPException(status_code=429, detail='Daily swipe limit reached. Upgrade to premium for unlimited swipes!')
     
-    # Increment swipe count
-    await increment_swipe_count(current_user['user_id'])
-    
     # Store last passed user for undo feature
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     await db.users.update_one(
         {'user_id': current_user['user_id']},
         {'$set': {
@@ -984,8 +1244,10 @@ async def pass_profile(liked_user_id: str, current_user: dict = Depends(get_curr
             'last_passed_at': now
         }}
     )
+    invalidate_user(current_user['user_id'])
+    await add_discover_exclusion(current_user['user_id'], 'passed', liked_user_id)
     
-    return {'message': 'Profile passed', 'swipes_remaining': await get_swipe_limits(current_user)}
+    return {'message': 'Profile passed', 'swipes_remaining': limits}
 
 # ==================== BLOCK/REPORT ROUTES ====================
 
@@ -1001,7 +1263,7 @@ async def block_user(data: BlockUser, current_user: dict = Depends(get_current_u
     if existing:
         raise HTTPException(status_code=400, detail='User already blocked')
     
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     block_doc = {
         'block_id': f"block_{uuid.uuid4().hex[:12]}",
@@ -1013,26 +1275,45 @@ async def block_user(data: BlockUser, current_user: dict = Depends(get_current_u
     await db.blocks.insert_one(block_doc)
     
     # Remove any existing matches
-    await db.matches.delete_many({
+    match_filter = {
         '$or': [
             {'user1_id': current_user['user_id'], 'user2_id': data.blocked_user_id},
             {'user1_id': data.blocked_user_id, 'user2_id': current_user['user_id']}
         ]
-    })
+    }
+    removed = await db.matches.find(match_filter, {'_id': 0, 'match_id': 1}).to_list(None)
+    await db.matches.delete_many(match_filter)
+    for match in removed:
+        unmatched = {'type': 'unmatched', 'match_id': match['match_id']}
+        await manager.send_personal_message(unmatched, current_user['user_id'])
+        await manager.send_personal_message(unmatched, data.blocked_user_id)
+    
+    # Hide both users from each other's Discover deck
+    await add_discover_exclusion(current_user['user_id'], 'blocked', data.blocked_user_id)
+    await add_discover_exclusion(data.blocked_user_id, 'blocked_by', current_user['user_id'])
+    await remove_discover_exclusion(current_user['user_id'], 'matched', data.blocked_user_id)
+    await remove_discover_exclusion(data.blocked_user_id, 'matched', current_user['user_id'])
     
     return {'message': 'User blocked successfully'}
 
+BLOCKED_PAGE_SIZE = 100
+
 @api_router.get("/users/blocked")
-async def get_blocked_users(current_user: dict = Depends(get_current_user)):
-    """Get list of blocked users"""
-    blocks = await db.blocks.find({'blocker_id': current_user['user_id']}, {'_id': 0}).to_list(1000)
+async def get_blocked_users(
+    cursor: Optional[str] = None,
+    limit: int = BLOCKED_PAGE_SIZE,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """Get blocked users, most recently blocked first, one page at a time"""
+    limit = max(1, min(limit, BLOCKED_PAGE_SIZE))
+    blocks, next_cursor = await find_newest_page(db.blocks, {'blocker_id': current_user_id}, 'block_id', cursor, limit)
     
     # Fetch user details
+    users = await hydrate_users([block['blocked_id'] for block in blocks], MATCH_LIST_PROJECTION)
     for block in blocks:
-        user = await db.users.find_one({'user_id': block['blocked_id']}, {'_id': 0, 'password': 0})
-        block['user'] = user
+        block['user'] = users.get(block['blocked_id'])
     
-    return blocks
+    return {'blocks': blocks, 'next_cursor': next_cursor}
 
 @api_router.post("/users/unblock")
 async def unblock_user(data: BlockUser, current_user: dict = Depends(get_current_user)):
@@ -1045,12 +1326,15 @@ async def unblock_user(data: BlockUser, current_user: dict = Depends(get_current
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail='Block not found')
     
+    await remove_discover_exclusion(current_user['user_id'], 'blocked', data.blocked_user_id)
+    await remove_discover_exclusion(data.blocked_user_id, 'blocked_by', current_user['user_id'])
+    
     return {'message': 'User unblocked successfully'}
 
 @api_router.post("/users/report")
 async def report_user(data: ReportUser, current_user: dict = Depends(get_current_user)):
     """Report a user for violations"""
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     report_doc = {
         'report_id': f"report_{uuid.uuid4().hex[:12]}",
@@ -1066,45 +1350,37 @@ async def report_user(data: ReportUser, current_user: dict = Depends(get_current
     
     return {'message': 'Report submitted successfully'}
 
-# ==================== FILE UPLOAD ROUTES (CLOUDINARY) ====================
+# ==================== FILE UPLOAD ROUTES ====================
 
 @api_router.post("/upload/photo")
 async def upload_photo(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
-    """Upload photo to Cloudinary cloud storage"""
+    """Upload photo to the configured media storage"""
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail='File must be an image')
     
+    if file.size and file.size > MAX_UPLOAD_BYTES:
+        raise too_large(MAX_UPLOAD_BYTES)
+    
     try:
-        # Read file content
-        content = await file.read()
+        # Starlette has already spooled large bodies to a temp file; hand
+        # the driver that file instead of reading it all into memory
+        await file.seek(0)
         
-        # Upload to Cloudinary with transformations
-        result = cloudinary.uploader.upload(
-            content,
+        return await media_storage.save_photo(
+            file.file,
             folder=f"ember/users/{current_user['user_id']}",
             public_id=f"photo_{uuid.uuid4().hex[:8]}",
-            overwrite=True,
-            transformation=[
-                {'width': 1080, 'height': 1350, 'crop': 'limit'},  # Max size
-                {'quality': 'auto:good'},  # Auto quality optimization
-                {'fetch_format': 'auto'}  # Auto format (webp when supported)
-            ]
+            content_type=file.content_type
         )
-        
-        # Return the secure URL
-        return {
-            'url': result['secure_url'],
-            'public_id': result['public_id'],
-            'width': result.get('width'),
-            'height': result.get('height')
-        }
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Cloudinary upload error: {e}")
+        logger.error(f"{media_storage.name} upload error: {e}")
         raise HTTPException(status_code=500, detail=f'Upload failed: {str(e)}')
 
 @api_router.post("/upload/photo/base64")
 async def upload_photo_base64(request: Request, current_user: dict = Depends(get_current_user)):
-    """Upload base64 encoded photo to Cloudinary"""
+    """Upload base64 encoded photo to the configured media storage"""
     body = await request.json()
     data = body.get('data')
     
@@ -1112,41 +1388,103 @@ async def upload_photo_base64(request: Request, current_user: dict = Depends(get
         raise HTTPException(status_code=400, detail='No image data provided')
     
     try:
-        # Upload base64 directly to Cloudinary
-        result = cloudinary.uploader.upload(
-            data,  # Cloudinary accepts base64 with data URI prefix
+        return await media_storage.save_photo(
+            data,  # base64 with data URI prefix
             folder=f"ember/users/{current_user['user_id']}",
-            public_id=f"photo_{uuid.uuid4().hex[:8]}",
-            overwrite=True,
-            transformation=[
-                {'width': 1080, 'height': 1350, 'crop': 'limit'},
-                {'quality': 'auto:good'},
-                {'fetch_format': 'auto'}
-            ]
+            public_id=f"photo_{uuid.uuid4().hex[:8]}"
         )
-        
-        return {
-            'url': result['secure_url'],
-            'public_id': result['public_id'],
-            'width': result.get('width'),
-            'height': result.get('height')
-        }
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Cloudinary base64 upload error: {e}")
+        logger.error(f"{media_storage.name} base64 upload error: {e}")
         raise HTTPException(status_code=500, detail=f'Upload failed: {str(e)}')
 
+PHOTO_BATCH_CONCURRENCY = int(os.environ.get('PHOTO_BATCH_CONCURRENCY', '3'))
+
+@api_router.post("/upload/photos")
+async def upload_photos(files: List[UploadFile] = File(...), current_user: dict = Depends(get_current_user)):
+    """Upload several photos in one request and append them to the profile"""
+    if len(files) > MAX_PROFILE_PHOTOS:
+        raise HTTPException(status_code=400, detail='Maximum 6 photos allowed')
+    
+    for file in files:
+        if not file.content_type or not file.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail='All files must be images')
+        if file.size and file.size > MAX_UPLOAD_BYTES:
+            raise too_large(MAX_UPLOAD_BYTES)
+    
+    # Fail fast before uploading anything; the append below re-checks atomically
+    existing = len(current_user.get('photos') or [])
+    if existing + len(files) > MAX_PROFILE_PHOTOS:
+        raise HTTPException(status_code=400, detail='Maximum 6 photos allowed')
+    
+    semaphore = asyncio.Semaphore(PHOTO_BATCH_CONCURRENCY)
+    
+    async def upload_one(file: UploadFile) -> dict:
+        async with semaphore:
+            await file.seek(0)
+            return await media_storage.save_photo(
+                file.file,
+                folder=f"ember/users/{current_user['user_id']}",
+                public_id=f"photo_{uuid.uuid4().hex[:8]}",
+                content_type=file.content_type
+            )
+    
+    results = await asyncio.gather(*[upload_one(f) for f in files], return_exceptions=True)
+    uploaded = [r for r in results if not isinstance(r, BaseException)]
+    
+    async def discard_uploaded():
+        for result in uploaded:
+            try:
+                await media_storage.delete(result['public_id'])
+            except Exception as e:
+                logger.error(f"{media_storage.name} cleanup error for {result['public_id']}: {e}")
+    
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        logger.error(f"{media_storage.name} batch upload error: {errors[0]}")
+        await discard_uploaded()
+        raise HTTPException(status_code=500, detail=f'Upload failed: {str(errors[0])}')
+    
+    # Append all URLs in one write, only if the profile still has room for them
+    updated = await db.users.find_one_and_update(
+        {
+            'user_id': current_user['user_id'],
+            f'photos.{MAX_PROFILE_PHOTOS - len(uploaded)}': {'$exists': False}
+        },
+        {
+            '$push': {'photos': {'$each': [r['url'] for r in uploaded]}},
+            '$set': {'last_active': datetime.now(timezone.utc)}
+        },
+        projection={'_id': 0, 'password': 0},
+        return_document=ReturnDocument.AFTER
+    )
+    invalidate_user(current_user['user_id'])
+    if not updated:
+        await discard_uploaded()
+        raise HTTPException(status_code=400, detail='Maximum 6 photos allowed')
+    
+    complete = is_profile_complete(updated)
+    if complete != updated.get('is_profile_complete'):
+        await db.users.update_one({'user_id': current_user['user_id']}, {'$set': {'is_profile_complete': complete}})
+        invalidate_user(current_user['user_id'])
+        updated['is_profile_complete'] = complete
+    
+    return {'uploaded': uploaded, 'user': updated}
+
 @api_router.delete("/upload/photo/{public_id:path}")
 async def delete_photo(public_id: str, current_user: dict = Depends(get_current_user)):
-    """Delete photo from Cloudinary"""
-    # Verify the photo belongs to the user
-    if not public_id.startswith(f"ember/users/{current_user['user_id']}"):
+    """Delete photo from the configured media storage"""
+    # Verify the photo belongs to the user (no '..' segments escaping the prefix)
+    if not is_safe_public_id(public_id) or not public_id.startswith(f"ember/users/{current_user['user_id']}/"):
         raise HTTPException(status_code=403, detail='Not authorized to delete this photo')
     
     try:
-        result = cloudinary.uploader.destroy(public_id)
-        return {'result': result.get('result', 'ok')}
+        return {'result': await media_storage.delete(public_id)}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Cloudinary delete error: {e}")
+        logger.error(f"{media_storage.name} delete error: {e}")
         raise HTTPException(status_code=500, detail=f'Delete failed: {str(e)}')
 
 @api_router.get("/cloudinary/config")
@@ -1160,56 +1498,34 @@ async def get_cloudinary_config():
 
 @api_router.post("/upload/video")
 async def upload_video(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
-    """Upload video to Cloudinary cloud storage (max 30 seconds, 50MB)"""
+    """Upload video to the configured media storage (max 30 seconds, 50MB)"""
     if not file.content_type.startswith('video/'):
         raise HTTPException(status_code=400, detail='File must be a video')
     
-    # Read file content
-    content = await file.read()
-    
-    # Check file size (max 50MB)
-    if len(content) > 50 * 1024 * 1024:
+    # Check file size (max 50MB); oversized bodies are normally cut off
+    # while streaming by UploadSizeLimitMiddleware before we get here
+    if file.size and file.size > MAX_UPLOAD_BYTES:
         raise HTTPException(status_code=400, detail='Video size must be less than 50MB')
     
     try:
-        # Upload to Cloudinary with video transformations
-        result = cloudinary.uploader.upload(
-            content,
-            resource_type='video',
+        # Upload the spooled temp file rather than reading it into memory
+        await file.seek(0)
+        
+        return await media_storage.save_video(
+            file.file,
             folder=f"ember/users/{current_user['user_id']}/videos",
             public_id=f"video_{uuid.uuid4().hex[:8]}",
-            overwrite=True,
-            transformation=[
-                {'width': 1080, 'height': 1920, 'crop': 'limit'},  # Max size for mobile
-                {'quality': 'auto:good'},  # Auto quality optimization
-                {'duration': '30'},  # Max 30 seconds
-                {'fetch_format': 'auto'}  # Auto format
-            ],
-            eager=[
-                {'format': 'jpg', 'transformation': [{'width': 300, 'crop': 'fill'}]}  # Generate thumbnail
-            ]
+            content_type=file.content_type
         )
-        
-        # Get thumbnail URL
-        thumbnail_url = result.get('eager', [{}])[0].get('secure_url') if result.get('eager') else None
-        
-        # Return the secure URL and metadata
-        return {
-            'url': result['secure_url'],
-            'thumbnail_url': thumbnail_url,
-            'public_id': result['public_id'],
-            'duration': result.get('duration'),
-            'width': result.get('width'),
-            'height': result.get('height'),
-            'format': result.get('format')
-        }
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Cloudinary video upload error: {e}")
+        logger.error(f"{media_storage.name} video upload error: {e}")
         raise HTTPException(status_code=500, detail=f'Video upload failed: {str(e)}')
 
 @api_router.post("/upload/video/base64")
 async def upload_video_base64(request: Request, current_user: dict = Depends(get_current_user)):
-    """Upload base64 encoded video to Cloudinary"""
+    """Upload base64 encoded video to the configured media storage"""
     body = await request.json()
     data = body.get('data')
     
@@ -1217,65 +1533,50 @@ async def upload_video_base64(request: Request, current_user: dict = Depends(get
         raise HTTPException(status_code=400, detail='No video data provided')
     
     try:
-        # Upload base64 video to Cloudinary
-        result = cloudinary.uploader.upload(
+        return await media_storage.save_video(
             data,
-            resource_type='video',
             folder=f"ember/users/{current_user['user_id']}/videos",
-            public_id=f"video_{uuid.uuid4().hex[:8]}",
-            overwrite=True,
-            transformation=[
-                {'width': 1080, 'height': 1920, 'crop': 'limit'},
-                {'quality': 'auto:good'},
-                {'duration': '30'},
-                {'fetch_format': 'auto'}
-            ],
-            eager=[
-                {'format': 'jpg', 'transformation': [{'width': 300, 'crop': 'fill'}]}
-            ]
+            public_id=f"video_{uuid.uuid4().hex[:8]}"
         )
-        
-        thumbnail_url = result.get('eager', [{}])[0].get('secure_url') if result.get('eager') else None
-        
-        return {
-            'url': result['secure_url'],
-            'thumbnail_url': thumbnail_url,
-            'public_id': result['public_id'],
-            'duration': result.get('duration'),
-            'width': result.get('width'),
-            'height': result.get('height'),
-            'format': result.get('format')
-        }
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Cloudinary video base64 upload error: {e}")
+        logger.error(f"{media_storage.name} video base64 upload error: {e}")
         raise HTTPException(status_code=500, detail=f'Video upload failed: {str(e)}')
 
 
 # ==================== PROFILE ROUTES ====================
 
+MAX_PROFILE_PHOTOS = 6
+
+def is_profile_complete(user: dict) -> bool:
+    return all([
+        user.get('age'),
+        user.get('gender'),
+        user.get('interested_in'),
+        user.get('photos') and len(user['photos']) > 0,
+        user.get('prompts') and len(user['prompts']) > 0
+    ])
+
 @api_router.put("/profile")
 async def update_profile(profile: ProfileUpdate, current_user: dict = Depends(get_current_user)):
     update_data = {k: v for k, v in profile.model_dump().items() if v is not None}
     
     user = await db.users.find_one({'user_id': current_user['user_id']}, {'_id': 0})
-    merged = {**user, **update_data}
-    is_complete = all([
-        merged.get('age'),
-        merged.get('gender'),
-        merged.get('interested_in'),
-        merged.get('photos') and len(merged['photos']) > 0,
-        merged.get('prompts') and len(merged['prompts']) > 0
-    ])
-    update_data['is_profile_complete'] = is_complete
-    update_data['last_active'] = datetime.now(timezone.utc).isoformat()
+    update_data['is_profile_complete'] = is_profile_complete({**user, **update_data})
+    update_data['last_active'] = datetime.now(timezone.utc)
     
     await db.users.update_one({'user_id': current_user['user_id']}, {'$set': update_data})
+    invalidate_user(current_user['user_id'])
     updated = await db.users.find_one({'user_id': current_user['user_id']}, {'_id': 0})
+    await compatibility_index.update_user(updated)
+    if update_data.keys() & set(STARTER_PROFILE_FIELDS):
+        invalidate_starters(current_user['user_id'])
     return {k: v for k, v in updated.items() if k != 'password'}
 
 @api_router.get("/profile/{user_id}")
 async def get_profile(user_id: str, current_user: dict = Depends(get_current_user)):
-    user = await db.users.find_one({'user_id': user_id}, {'_id': 0, 'password': 0})
+    user = await db.users.find_one({'user_id': user_id}, FULL_PROFILE_PROJECTION)
     if not user:
         raise HTTPException(status_code=404, detail='User not found')
     return user
@@ -1286,10 +1587,19 @@ async def update_notifications(settings: NotificationSettings, current_user: dic
         {'user_id': current_user['user_id']},
         {'$set': {'notification_settings': settings.model_dump()}}
     )
+    invalidate_user(current_user['user_id'])
     return {'message': 'Notification settings updated'}
 
 # ==================== LOCATION ROUTES ====================
 
+METERS_PER_MILE = 1609.344
+
+def location_point(latitude: Optional[float], longitude: Optional[float]) -> Optional[dict]:
+    """Build a GeoJSON point (longitude first) or None if coordinates are missing"""
+    if latitude is None or longitude is None:
+        return None
+    return {'type': 'Point', 'coordinates': [longitude, latitude]}
+
 @api_router.put("/profile/location")
 async def update_location(location: LocationUpdate, current_user: dict = Depends(get_current_user)):
     """Update user's location - can change city, state, country anytime"""
@@ -1304,7 +1614,9 @@ async def update_location(location: LocationUpdate, current_user: dict = Depends
         'country': location.country,
         'latitude': location.latitude,
         'longitude': location.longitude,
-        'updated_at': datetime.now(timezone.utc).isoformat()
+        # GeoJSON point for the 2dsphere index used by Discover
+        'coordinates': location_point(location.latitude, location.longitude),
+        'updated_at': datetime.now(timezone.utc)
     }
     
     await db.users.update_one(
@@ -1312,9 +1624,10 @@ async def update_location(location: LocationUpdate, current_user: dict = Depends
         {'$set': {
             'location': location_string,
             'location_details': location_details,
-            'last_active': datetime.now(timezone.utc).isoformat()
+            'last_active': datetime.now(timezone.utc)
         }}
     )
+    invalidate_user(current_user['user_id'])
     
     updated = await db.users.find_one({'user_id': current_user['user_id']}, {'_id': 0})
     return {k: v for k, v in updated.items() if k != 'password'}
@@ -1330,11 +1643,11 @@ async def delete_account(request: Request, current_user: dict = Depends(get_curr
     
     # Verify password
     user = await db.users.find_one({'user_id': current_user['user_id']})
-    if not user or not bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
+    if not user or not await verify_password(password, user.get('password')):
         raise HTTPException(status_code=401, detail='Incorrect password')
     
     user_id = current_user['user_id']
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     try:
         # Mark account as deleted (soft delete)
@@ -1346,6 +1659,7 @@ async def delete_account(request: Request, current_user: dict = Depends(get_curr
                 'is_active': False
             }}
         )
+        invalidate_user(user_id)
         
         # Remove from all matches
         await db.matches.delete_many({
@@ -1383,6 +1697,11 @@ async def delete_account(request: Request, current_user: dict = Depends(get_curr
         # Delete notifications
         await db.notifications.delete_many({'user_id': user_id})
         
+        # Drop the user's own Discover exclusion set
+        await db.discover_exclusions.delete_one({'user_id': user_id})
+        await compatibility_index.remove_user(user_id)
+        push_dispatcher.invalidate(user_id)
+        
         # Remove from disconnected matches
         await db.disconnected_matches.delete_many({
             '$or': [
@@ -1411,7 +1730,7 @@ async def reorder_photos(request: Request, current_user: dict = Depends(get_curr
     if not isinstance(photos, list):
         raise HTTPException(status_code=400, detail='Photos must be an array')
     
-    if len(photos) > 6:
+    if len(photos) > MAX_PROFILE_PHOTOS:
         raise HTTPException(status_code=400, detail='Maximum 6 photos allowed')
     
     # Get current user photos
@@ -1427,9 +1746,10 @@ async def reorder_photos(request: Request, current_user: dict = Depends(get_curr
         {'user_id': current_user['user_id']},
         {'$set': {
             'photos': photos,
-            'last_active': datetime.now(timezone.utc).isoformat()
+            'last_active': datetime.now(timezone.utc)
         }}
     )
+    invalidate_user(current_user['user_id'])
     
     updated = await db.users.find_one({'user_id': current_user['user_id']}, {'_id': 0})
     return {k: v for k, v in updated.items() if k != 'password'}
@@ -1465,31 +1785,69 @@ async def get_popular_locations():
 
 # ==================== DISCOVER ROUTES ====================
 
-@api_router.get("/discover")
-async def discover_profiles(current_user: dict = Depends(get_current_user)):
-    # Check verification status
-    if current_user.get('verification_status') != 'verified':
-        raise HTTPException(status_code=403, detail='Profile verification required to use Ember')
-    
-    # Get blocked users
-    blocks = await db.blocks.find({'blocker_id': current_user['user_id']}, {'_id': 0}).to_list(1000)
-    blocked_ids = [b['blocked_id'] for b in blocks]
-    
-    # Get users who blocked me
-    blocked_by = await db.blocks.find({'blocked_id': current_user['user_id']}, {'_id': 0}).to_list(1000)
-    blocked_by_ids = [b['blocker_id'] for b in blocked_by]
-    
-    liked_ids = await db.likes.find({'liker_id': current_user['user_id']}, {'_id': 0}).to_list(1000)
-    liked_user_ids = [l['liked_user_id'] for l in liked_ids]
-    
-    matches = await db.matches.find(
-        {'$or': [{'user1_id': current_user['user_id']}, {'user2_id': current_user['user_id']}]},
-        {'_id': 0}
-    ).to_list(1000)
-    matched_ids = [m['user1_id'] if m['user2_id'] == current_user['user_id'] else m['user2_id'] for m in matches]
-    
-    # Combine all IDs to skip
-    skip_ids = list(set(liked_user_ids + matched_ids + blocked_ids + blocked_by_ids + [current_user['user_id']]))
+DISCOVER_CANDIDATE_LIMIT = 100
+DECK_PAGE_SIZE = 10
+DECK_MAX_PAGE_SIZE = 50
+
+# Slim card returned by the paginated deck
+DECK_CARD_PROJECTION = {
+    '_id': 0,
+    'user_id': 1,
+    'name': 1,
+    'age': 1,
+    'photos': {'$slice': ['$photos', 3]},
+    'prompts': 1,
+    'is_ambassador': 1,
+    'verification_status': 1
+}
+
+def discover_rank_stage(now: datetime) -> dict:
+    """Priority bucket computed in MongoDB: 0 new ambassador, 1 new user,
+    2 ambassador, 3 regular. New users = created within last 48 hours."""
+    is_new_user = {'$gt': ['$created_at', now - timedelta(hours=48)]}
+    is_ambassador = {'$eq': ['$is_ambassador', True]}
+    return {'$addFields': {'discover_rank': {'$switch': {
+        'branches': [
+            {'case': {'$and': [is_new_user, is_ambassador]}, 'then': 0},
+            {'case': is_new_user, 'then': 1},
+            {'case': is_ambassador, 'then': 2}
+        ],
+        'default': 3
+    }}}}
+
+def discover_sort_key(profile: dict) -> list:
+    """Total order of the deck: priority bucket, then distance, then user_id"""
+    return [profile['discover_rank'], profile.get('distance'), profile['user_id']]
+
+def discover_after_stage(cursor: str) -> dict:
+    """$match stage resuming the deck strictly after the card a cursor points at"""
+    try:
+        rank, distance, user_id = decode_cursor(cursor)
+        rank = int(rank)
+        distance = float(distance) if distance is not None else None
+        user_id = str(user_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    
+    return {'$match': {'$or': [
+        {'discover_rank': {'$gt': rank}},
+        {'discover_rank': rank, 'distance': {'$gt': distance}},
+        {'discover_rank': rank, 'distance': distance, 'user_id': {'$gt': user_id}}
+    ]}}
+
+async def find_discover_candidates(
+    current_user: dict,
+    projection: dict = CARD_PROJECTION,
+    cursor: Optional[str] = None,
+    limit: int = DISCOVER_CANDIDATE_LIMIT,
+    with_sort_key: bool = False
+) -> list:
+    """Eligible Discover profiles for a user, in deck order (see discover_sort_key).
+    Filtering, distance, prioritisation and pagination all run in one aggregation.
+    The internal discover_rank is only returned with_sort_key, for deck cursors."""
+    # Liked, passed, matched and blocked users (both directions)
+    excluded_ids = await get_discover_exclusions(current_user['user_id'])
+    skip_ids = list(excluded_ids | {current_user['user_id']})
     
     query = {
         'user_id': {'$nin': skip_ids},
@@ -1568,157 +1926,181 @@ async def discover_profiles(current_user: dict = Depends(get_current_user)):
     if filters.get('sub_ethnicities') and len(filters['sub_ethnicities']) > 0:
         query['sub_ethnicity'] = {'$in': filters['sub_ethnicities']}
     
-    profiles = await db.users.find(query, {'_id': 0, 'password': 0}).to_list(100)
-    
-    # Distance filter (if location details available)
-    if filters.get('max_distance') and current_user.get('location_details'):
-        user_coords = current_user['location_details']
-        if user_coords.get('latitude') and user_coords.get('longitude'):
-            filtered_profiles = []
-            for profile in profiles:
-                if profile.get('location_details'):
-                    profile_coords = profile['location_details']
-                    if profile_coords.get('latitude') and profile_coords.get('longitude'):
-                        # Calculate distance using Haversine formula
-                        from math import radians, sin, cos, sqrt, atan2
-                        
-                        lat1 = radians(user_coords['latitude'])
-                        lon1 = radians(user_coords['longitude'])
-                        lat2 = radians(profile_coords['latitude'])
-                        lon2 = radians(profile_coords['longitude'])
-                        
-                        dlon = lon2 - lon1
-                        dlat = lat2 - lat1
-                        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                        c = 2 * atan2(sqrt(a), sqrt(1-a))
-                        distance = 3959 * c  # Earth radius in miles
-                        
-                        if distance <= filters['max_distance']:
-                            profile['distance'] = round(distance, 1)
-                            filtered_profiles.append(profile)
-            profiles = filtered_profiles
-    
-    # Prioritize ambassadors and new users - show them first
-    # New users = created within last 48 hours
-    now = datetime.now(timezone.utc)
-    two_days_ago = now - timedelta(hours=48)
+    # Distance filter (if location details available) - runs inside MongoDB on the
+    # 2dsphere index so candidates come back nearest first with distance in miles
+    user_location = current_user.get('location_details') or {}
+    user_point = user_location.get('coordinates') or location_point(
+        user_location.get('latitude'), user_location.get('longitude')
+    )
     
-    new_ambassador_profiles = []
-    new_user_profiles = []
-    ambassador_profiles = []
-    non_ambassador_profiles = []
+    if filters.get('max_distance') and user_point:
+        pipeline = [
+            {'$geoNear': {
+                'near': user_point,
+                'key': 'location_details.coordinates',
+                'distanceField': 'distance',
+                'maxDistance': filters['max_distance'] * METERS_PER_MILE,
+                'distanceMultiplier': 1 / METERS_PER_MILE,
+                'query': query,
+                'spherical': True
+            }},
+            # Round before sorting so cursors compare against the value clients see
+            {'$set': {'distance': {'$round': ['$distance', 1]}}}
+        ]
+    else:
+        pipeline = [
+            {'$match': query},
+            {'$set': {'distance': None}}
+        ]
     
-    for p in profiles:
-        created_at = p.get('created_at')
-        is_ambassador = p.get('is_ambassador', False)
-        
-        # Parse created_at if it's a string
-        if isinstance(created_at, str):
-            try:
-                created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-            except:
-                created_at = now  # Default to now if parsing fails
-        
-        # Determine if user is new (< 48 hours old)
-        is_new_user = created_at > two_days_ago if created_at else False
-        
-        # Categorize profiles by priority
-        if is_new_user and is_ambassador:
-            new_ambassador_profiles.append(p)
-        elif is_new_user:
-            new_user_profiles.append(p)
-        elif is_ambassador:
-            ambassador_profiles.append(p)
-        else:
-            non_ambassador_profiles.append(p)
-    
-    # Combine in priority order: New Ambassadors → New Users → Ambassadors → Regular
-    profiles = new_ambassador_profiles + new_user_profiles + ambassador_profiles + non_ambassador_profiles
+    # Prioritize ambassadors and new users - show them first
+    # New Ambassadors → New Users → Ambassadors → Regular
+    pipeline.append(discover_rank_stage(datetime.now(timezone.utc)))
+    pipeline.append({'$sort': {'discover_rank': 1, 'distance': 1, 'user_id': 1}})
+    if cursor:
+        pipeline.append(discover_after_stage(cursor))
+    pipeline.append({'$limit': limit})
+    output = {**projection, 'distance': 1}
+    if with_sort_key:
+        output['discover_rank'] = 1
+    pipeline.append({'$project': output})
+    
+    return await db.users.aggregate(pipeline, allowDiskUse=True).to_list(limit)
+
+@api_router.get("/discover")
+async def discover_profiles(current_user: dict = Depends(get_current_user)):
+    # Check verification status
+    if current_user.get('verification_status') != 'verified':
+        raise HTTPException(status_code=403, detail='Profile verification required to use Ember')
     
+    profiles = await find_discover_candidates(current_user)
+    presence.annotate(profiles)
     return profiles
 
-@api_router.get("/discover/most-compatible")
-async def most_compatible(current_user: dict = Depends(get_current_user)):
-    profiles = await discover_profiles(current_user)
+@api_router.get("/discover/deck")
+async def discover_deck(
+    cursor: Optional[str] = None,
+    limit: int = DECK_PAGE_SIZE,
+    current_user: dict = Depends(get_current_user)
+):
+    """Paginated Discover deck of slim profile cards with an opaque cursor"""
+    if current_user.get('verification_status') != 'verified':
+        raise HTTPException(status_code=403, detail='Profile verification required to use Ember')
     
-    if not profiles or not current_user.get('interests'):
-        return profiles[:10]
+    limit = max(1, min(limit, DECK_MAX_PAGE_SIZE))
     
-    try:
-        user_interests = ', '.join(current_user.get('interests', []))
-        profiles_summary = [{'name': p.get('name'), 'interests': p.get('interests', []), 'bio': p.get('bio', '')} for p in profiles[:20]]
-        
-        completion = openai_client.chat.completions.create(
-            model='gpt-4o-mini',
-            messages=[
-                {'role': 'system', 'content': 'You are a dating app matchmaker. Return a JSON array of indices (0-based) of the 5 most compatible profiles, ordered by compatibility. Only return the array, nothing else.'},
-                {'role': 'user', 'content': f"User interests: {user_interests}\n\nProfiles:\n{profiles_summary}"}
-            ],
-            max_tokens=100
-        )
-        
-        indices = json.loads(completion.choices[0].message.content)
-        compatible = [profiles[i] for i in indices if i < len(profiles)]
-        return compatible if compatible else profiles[:5]
-    except Exception as e:
-        logger.error(f"AI compatibility error: {e}")
-        return profiles[:5]
-
-@api_router.get("/discover/standouts")
-async def get_standouts(current_user: dict = Depends(get_current_user)):
-    profiles = await discover_profiles(current_user)
+    # Keyset pagination on the deck order, so cards liked or passed between
+    # pages never shift the next page. One extra row tells us if there is more.
+    profiles = await find_discover_candidates(
+        current_user, DECK_CARD_PROJECTION, cursor, limit + 1, with_sort_key=True
+    )
     
-    if not profiles:
-        return []
+    page = profiles[:limit]
+    next_cursor = encode_cursor(discover_sort_key(page[-1])) if len(profiles) > limit else None
     
-    try:
-        user_data = {
-            'interests': current_user.get('interests', []),
-            'bio': current_user.get('bio', ''),
-            'prompts': current_user.get('prompts', [])
+    cards = [
+        {
+            'user_id': p['user_id'],
+            'name': p.get('name'),
+            'age': p.get('age'),
+            'photos': p.get('photos') or [],
+            'prompts': p.get('prompts') or [],
+            'distance': p.get('distance'),
+            'is_ambassador': p.get('is_ambassador', False),
+            'verification_status': p.get('verification_status'),
+            'is_online': presence.is_online(p['user_id'])
         }
+        for p in page
+    ]
+    
+    return {'profiles': cards, 'next_cursor': next_cursor}
+
+async def rank_for_user(current_user: dict, profiles: list) -> list:
+    """Score candidates locally: profile features plus compatibility index similarity"""
+    similarity = await compatibility_index.similarities(current_user, [p['user_id'] for p in profiles])
+    presence.annotate(profiles)  # recency uses live last_active
+    return rank_candidates(current_user, profiles, RANKING_WEIGHTS, compatibility=similarity)
+
+async def ai_rerank(profiles: list, instruction: str, user_data: dict, pool_size: int = AI_RERANK_POOL) -> list:
+    """Let the LLM reorder the top few ranked profiles when AI_RERANK_ENABLED.
+    Profiles it leaves out keep their ranked order behind its picks."""
+    if not AI_RERANK_ENABLED or len(profiles) < 2:
+        return profiles
+    
+    pool = profiles[:pool_size]
+    try:
         profiles_summary = [
             {
                 'index': i,
                 'name': p.get('name'),
+                'age': p.get('age'),
                 'interests': p.get('interests', []),
                 'bio': p.get('bio', ''),
                 'prompts': p.get('prompts', []),
                 'photo_count': len(p.get('photos', []))
             }
-            for i, p in enumerate(profiles[:30])
+            for i, p in enumerate(pool)
         ]
         
-        completion = openai_client.chat.completions.create(
-            model='gpt-4o-mini',
-            messages=[
-                {'role': 'system', 'content': 'You are a dating app matchmaker. Select the 5 best standout profiles based on profile completeness, interesting prompts, and compatibility. Return ONLY a JSON array of indices.'},
-                {'role': 'user', 'content': f"User: {user_data}\n\nProfiles:\n{profiles_summary}"}
-            ],
-            max_tokens=100
-        )
-        
-        indices = json.loads(completion.choices[0].message.content)
-        standouts = [profiles[i] for i in indices if i < len(profiles)]
-        
-        for s in standouts:
-            s['is_standout'] = True
-        
-        return standouts if standouts else profiles[:5]
+        indices = await ai_gateway.complete_list([
+            {'role': 'system', 'content': f"You are a dating app matchmaker. {instruction} Return ONLY a JSON array of profile indices (0-based), best first."},
+            {'role': 'user', 'content': f"User: {user_data}\n\nProfiles:\n{profiles_summary}"}
+        ], max_tokens=100)
+        picked = [i for i in dict.fromkeys(indices) if isinstance(i, int) and 0 <= i < len(pool)]
+        rest = [i for i in range(len(pool)) if i not in picked]
+        return [pool[i] for i in picked + rest] + profiles[pool_size:]
     except Exception as e:
-        logger.error(f"AI standouts error: {e}")
-        sorted_profiles = sorted(profiles, key=lambda p: (len(p.get('photos', [])), len(p.get('prompts', []))), reverse=True)
-        return sorted_profiles[:5]
+        logger.error(f"AI re-rank error: {e}")
+        return profiles
+
+@api_router.get("/discover/most-compatible")
+async def most_compatible(current_user: dict = Depends(get_current_user)):
+    profiles = await discover_profiles(current_user)
+    profiles = await rank_for_user(current_user, profiles)
+    
+    if not profiles or not current_user.get('interests'):
+        return profiles[:10]
+    
+    profiles = await ai_rerank(
+        profiles,
+        'Order these profiles by compatibility with the user.',
+        {'interests': current_user.get('interests', [])}
+    )
+    return profiles[:5]
+
+@api_router.get("/discover/standouts")
+async def get_standouts(current_user: dict = Depends(get_current_user)):
+    profiles = await discover_profiles(current_user)
+    profiles = await rank_for_user(current_user, profiles)
+    
+    if not profiles:
+        return []
+    
+    user_data = {
+        'interests': current_user.get('interests', []),
+        'bio': current_user.get('bio', ''),
+        'prompts': current_user.get('prompts', [])
+    }
+    standouts = (await ai_rerank(
+        profiles,
+        'Order these profiles as standouts based on profile completeness, interesting prompts, and compatibility.',
+        user_data
+    ))[:5]
+    
+    for s in standouts:
+        s['is_standout'] = True
+    
+    return standouts
 
 # ==================== LIKES ROUTES ====================
 
-@api_router.post("/likes")
+@api_router.post("/likes", dependencies=[rate_limited('likes')])
 async def create_like(like: LikeCreate, current_user: dict = Depends(get_current_user)):
     # Check verification
     if current_user.get('verification_status') != 'verified':
         raise HTTPException(status_code=403, detail='Profile verification required to use this feature')
     
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     existing = await db.likes.find_one({
         'liker_id': current_user['user_id'],
@@ -1727,32 +2109,18 @@ async def create_like(like: LikeCreate, current_user: dict = Depends(get_current
     if existing:
         raise HTTPException(status_code=400, detail='Already liked this user')
     
-    # Check swipe limit for regular likes
+    # Check and use up the daily quota for this like type
     if like.like_type == 'regular':
-        if not await check_swipe_limit(current_user):
+        if await consume_daily_limit(current_user['user_id'], 'swipes') is None:
             raise HTTPException(status_code=429, detail='Daily swipe limit reached. Upgrade to premium for unlimited swipes!')
-        # Increment swipe count
-        await increment_swipe_count(current_user['user_id'])
     
-    # Check super like limit
     elif like.like_type == 'super_like':
-        if not await check_super_like_limit(current_user):
+        if await consume_daily_limit(current_user['user_id'], 'super_likes') is None:
             raise HTTPException(status_code=429, detail='Daily super like limit reached')
-        # Increment super like count
-        await db.users.update_one(
-            {'user_id': current_user['user_id']},
-            {'$inc': {'super_like_limit.count': 1}}
-        )
     
-    # Check rose limit
     elif like.like_type == 'rose':
-        if not await check_rose_limit(current_user):
+        if await consume_daily_limit(current_user['user_id'], 'roses') is None:
             raise HTTPException(status_code=429, detail='Daily rose limit reached')
-        # Increment rose count
-        await db.users.update_one(
-            {'user_id': current_user['user_id']},
-            {'$inc': {'rose_limit.count': 1}}
-        )
     
     like_doc = {
         'like_id': f"like_{uuid.uuid4().hex[:12]}",
@@ -1764,6 +2132,7 @@ async def create_like(like: LikeCreate, current_user: dict = Depends(get_current
         'created_at': now
     }
     await db.likes.insert_one(like_doc)
+    await add_discover_exclusion(current_user['user_id'], 'liked', like.liked_user_id)
     
     notification = {
         'type': 'new_like',
@@ -1789,27 +2158,27 @@ async def create_like(like: LikeCreate, current_user: dict = Depends(get_current
     
     # Send push notification based on like type
     if like.like_type == 'super_like':
-        asyncio.create_task(send_push_notification(
+        push_dispatcher.enqueue(
             like.liked_user_id,
             "Someone Super Liked You! ⭐",
             f"{current_user['name']} sent you a Super Like!",
             {'type': 'super_likes', 'from_user_id': current_user['user_id']}
-        ))
+        )
     elif like.like_type == 'rose':
-        asyncio.create_task(send_push_notification(
+        push_dispatcher.enqueue(
             like.liked_user_id,
             "You Received a Rose! 🌹",
             f"{current_user['name']} sent you a rose!",
             {'type': 'roses', 'from_user_id': current_user['user_id']}
-        ))
+        )
     else:
         # Regular like
-        asyncio.create_task(send_push_notification(
+        push_dispatcher.enqueue(
             like.liked_user_id,
             "Someone Likes You! ❤️",
             f"{current_user['name']} liked your profile!",
             {'type': 'likes', 'from_user_id': current_user['user_id']}
-        ))
+        )
     
     mutual = await db.likes.find_one({
         'liker_id': like.liked_user_id,
@@ -1829,8 +2198,10 @@ async def create_like(like: LikeCreate, current_user: dict = Depends(get_current
             'last_message_at': None
         }
         await db.matches.insert_one(match_doc)
+        await add_discover_exclusion(current_user['user_id'], 'matched', like.liked_user_id)
+        await add_discover_exclusion(like.liked_user_id, 'matched', current_user['user_id'])
         
-        other_user = await db.users.find_one({'user_id': like.liked_user_id}, {'_id': 0, 'password': 0})
+        other_user = await db.users.find_one({'user_id': like.liked_user_id}, MATCH_LIST_PROJECTION)
         
         match_notification_1 = {
             'type': 'new_match',
@@ -1857,112 +2228,161 @@ async def create_like(like: LikeCreate, current_user: dict = Depends(get_current
         await manager.send_personal_message(match_notification_2, like.liked_user_id)
         
         # Send push notifications
-        asyncio.create_task(send_push_notification(
+        push_dispatcher.enqueue(
             current_user['user_id'],
             "It's a Match! 💕",
             f"You and {other_user['name']} liked each other!",
             {'type': 'new_matches', 'match_id': match_doc['match_id']}
-        ))
-        asyncio.create_task(send_push_notification(
+        )
+        push_dispatcher.enqueue(
             like.liked_user_id,
             "It's a Match! 💕",
             f"You and {current_user['name']} liked each other!",
             {'type': 'new_matches', 'match_id': match_doc['match_id']}
-        ))
+        )
         
         return {'like': {k: v for k, v in like_doc.items() if k != '_id'}, 'match': {k: v for k, v in match_doc.items() if k != '_id'}}
     
     return {'like': {k: v for k, v in like_doc.items() if k != '_id'}, 'match': None}
 
+LIKES_PAGE_SIZE = 100
+LIKES_MAX_PAGE_SIZE = 100
+
+async def find_newest_page(collection, query: dict, id_field: str, cursor: Optional[str], limit: int) -> tuple:
+    """One page of documents matching query, newest first by (created_at, id_field),
+    plus the cursor for the next page"""
+    if cursor:
+        try:
+            created_at, last_id = decode_cursor(cursor)
+            created_at = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail='Invalid cursor')
+        query = {**query, '$or': [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, id_field: {'$lt': last_id}}
+        ]}
+    
+    docs = await collection.find(query, {'_id': 0}).sort(
+        [('created_at', -1), (id_field, -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor([docs[-1]['created_at'].isoformat(), docs[-1][id_field]])
+    
+    return docs, next_cursor
+
+async def find_received_likes(query: dict, cursor: Optional[str], limit: int) -> tuple:
+    """One page of likes matching query, newest first, plus the cursor for the next page"""
+    limit = max(1, min(limit, LIKES_MAX_PAGE_SIZE))
+    return await find_newest_page(db.likes, query, 'like_id', cursor, limit)
+
 @api_router.get("/likes/received")
-async def get_received_likes(current_user: dict = Depends(get_current_user)):
+async def get_received_likes(
+    cursor: Optional[str] = None,
+    limit: int = LIKES_PAGE_SIZE,
+    current_user: dict = Depends(get_current_user)
+):
     """Get received likes - full details for premium users only"""
-    likes = await db.likes.find({'liked_user_id': current_user['user_id']}, {'_id': 0}).to_list(100)
+    query = {'liked_user_id': current_user['user_id']}
+    count = await db.likes.count_documents(query)
     
-    # Premium users can see who liked them
-    if current_user.get('is_premium'):
-        for like in likes:
-            liker = await db.users.find_one({'user_id': like['liker_id']}, {'_id': 0, 'password': 0})
-            like['liker'] = liker
-        return {'likes': likes, 'premium': True, 'count': len(likes)}
-    else:
-        # Free users only see count and blurred info
+    # Free users only see count and blurred info
+    if not current_user.get('is_premium'):
         return {
             'likes': [],
             'premium': False,
-            'count': len(likes),
+            'count': count,
             'message': 'Upgrade to premium to see who liked you'
         }
+    
+    # Premium users can see who liked them
+    likes, next_cursor = await find_received_likes(query, cursor, limit)
+    likers = await hydrate_users([like['liker_id'] for like in likes], MATCH_LIST_PROJECTION)
+    for like in likes:
+        like['liker'] = likers.get(like['liker_id'])
+    
+    return {'likes': likes, 'premium': True, 'count': count, 'next_cursor': next_cursor}
 
 @api_router.get("/likes/roses-received")
-async def get_roses_received(current_user: dict = Depends(get_current_user)):
+async def get_roses_received(
+    cursor: Optional[str] = None,
+    limit: int = LIKES_PAGE_SIZE,
+    current_user: dict = Depends(get_current_user)
+):
     """Get roses sent to you - premium only"""
+    query = {'liked_user_id': current_user['user_id'], 'like_type': 'rose'}
+    count = await db.likes.count_documents(query)
+    
     if not current_user.get('is_premium'):
-        roses = await db.likes.find({
-            'liked_user_id': current_user['user_id'],
-            'like_type': 'rose'
-        }, {'_id': 0}).to_list(100)
-        
         return {
             'roses': [],
             'premium': False,
-            'count': len(roses),
+            'count': count,
             'message': 'Upgrade to premium to see who sent you roses'
         }
     
-    roses = await db.likes.find({
-        'liked_user_id': current_user['user_id'],
-        'like_type': 'rose'
-    }, {'_id': 0}).to_list(100)
-    
+    roses, next_cursor = await find_received_likes(query, cursor, limit)
+    senders = await hydrate_users([rose['liker_id'] for rose in roses], MATCH_LIST_PROJECTION)
     for rose in roses:
-        sender = await db.users.find_one({'user_id': rose['liker_id']}, {'_id': 0, 'password': 0})
-        rose['sender'] = sender
+        rose['sender'] = senders.get(rose['liker_id'])
     
-    return {'roses': roses, 'premium': True, 'count': len(roses)}
+    return {'roses': roses, 'premium': True, 'count': count, 'next_cursor': next_cursor}
 
 @api_router.delete("/likes/{like_id}")
 async def reject_like(like_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.likes.delete_one({'like_id': like_id, 'liked_user_id': current_user['user_id']})
-    if result.deleted_count == 0:
+    like = await db.likes.find_one_and_delete({'like_id': like_id, 'liked_user_id': current_user['user_id']})
+    if not like:
         raise HTTPException(status_code=404, detail='Like not found')
+    await remove_discover_exclusion(like['liker_id'], 'liked', current_user['user_id'])
     return {'message': 'Like rejected'}
 
 # ==================== MATCHES ROUTES ====================
 
 @api_router.get("/matches")
-async def get_matches(current_user: dict = Depends(get_current_user)):
+async def get_matches(current_user_id: str = Depends(get_current_user_id)):
     matches = await db.matches.find(
-        {'$or': [{'user1_id': current_user['user_id']}, {'user2_id': current_user['user_id']}]},
+        {'$or': [{'user1_id': current_user_id}, {'user2_id': current_user_id}]},
         {'_id': 0}
     ).sort('last_message_at', -1).to_list(100)
     
-    for match in matches:
-        other_id = match['user2_id'] if match['user1_id'] == current_user['user_id'] else match['user1_id']
-        other = await db.users.find_one({'user_id': other_id}, {'_id': 0, 'password': 0})
-        match['other_user'] = other
+    other_ids = [
+        match['user2_id'] if match['user1_id'] == current_user_id else match['user1_id']
+        for match in matches
+    ]
+    others = await hydrate_users(other_ids, MATCH_LIST_PROJECTION)
+    presence.annotate(others.values())
+    for match, other_id in zip(matches, other_ids):
+        match['other_user'] = others.get(other_id)
     
     return matches
 
 @api_router.delete("/matches/{match_id}")
 async def unmatch(match_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.matches.delete_one({
+    match = await db.matches.find_one_and_delete({
         'match_id': match_id,
         '$or': [{'user1_id': current_user['user_id']}, {'user2_id': current_user['user_id']}]
     })
-    if result.deleted_count == 0:
+    if not match:
         raise HTTPException(status_code=404, detail='Match not found')
     
+    await remove_discover_exclusion(match['user1_id'], 'matched', match['user2_id'])
+    await remove_discover_exclusion(match['user2_id'], 'matched', match['user1_id'])
     await db.messages.delete_many({'match_id': match_id})
+    
+    unmatched = {'type': 'unmatched', 'match_id': match_id}
+    await manager.send_personal_message(unmatched, match['user1_id'])
+    await manager.send_personal_message(unmatched, match['user2_id'])
     return {'message': 'Unmatched'}
 
 # ==================== MESSAGES ROUTES ====================
 
 @api_router.get("/messages/{match_id}")
-async def get_messages(match_id: str, current_user: dict = Depends(get_current_user)):
+async def get_messages(match_id: str, current_user_id: str = Depends(get_current_user_id)):
     match = await db.matches.find_one({
         'match_id': match_id,
-        '$or': [{'user1_id': current_user['user_id']}, {'user2_id': current_user['user_id']}]
+        '$or': [{'user1_id': current_user_id}, {'user2_id': current_user_id}]
     })
     if not match:
         raise HTTPException(status_code=404, detail='Match not found')
@@ -1970,13 +2390,13 @@ async def get_messages(match_id: str, current_user: dict = Depends(get_current_u
     messages = await db.messages.find({'match_id': match_id}, {'_id': 0}).sort('created_at', 1).to_list(500)
     
     await db.messages.update_many(
-        {'match_id': match_id, 'sender_id': {'$ne': current_user['user_id']}, 'read': False},
+        {'match_id': match_id, 'sender_id': {'$ne': current_user_id}, 'read': False},
         {'$set': {'read': True}}
     )
     
     return messages
 
-@api_router.post("/messages")
+@api_router.post("/messages", dependencies=[rate_limited('messages')])
 async def send_message(msg: MessageCreate, current_user: dict = Depends(get_current_user)):
     match = await db.matches.find_one({
         'match_id': msg.match_id,
@@ -1985,13 +2405,8 @@ async def send_message(msg: MessageCreate, current_user: dict = Depends(get_curr
     if not match:
         raise HTTPException(status_code=404, detail='Match not found')
     
-    now = datetime.now(timezone.utc).isoformat()
-    message_doc = {
-        'message_id': f"msg_{uuid.uuid4().hex[:12]}",
-        'match_id': msg.match_id,
-        'sender_id': current_user['user_id'],
-        'content': msg.content,
-        'created_at': now,
+    other_id = match['user2_id'] if match['user1_id'] == current_user['user_id'] else match['user1_id']
+    
     # Get receiver's language preference
     receiver = await db.users.find_one({'user_id': other_id}, {'_id': 0, 'preferred_language': 1})
     receiver_lang = receiver.get('preferred_language', 'en') if receiver else 'en'
@@ -2019,7 +2434,7 @@ async def send_message(msg: MessageCreate, current_user: dict = Depends(get_curr
                 translated_content = translation_result['translated_text']
     
     # Create message document
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     message_doc = {
         'message_id': f"msg_{uuid.uuid4().hex[:12]}",
         'match_id': msg.match_id,
@@ -2050,7 +2465,6 @@ async def send_message(msg: MessageCreate, current_user: dict = Depends(get_curr
         {'$set': {'last_message': msg.content, 'last_message_at': now}}
     )
     
-    other_id = match['user2_id'] if match['user1_id'] == current_user['user_id'] else match['user1_id']
     ws_message = {
         'type': 'new_message',
         'message': message_doc,
@@ -2063,43 +2477,41 @@ async def send_message(msg: MessageCreate, current_user: dict = Depends(get_curr
     await manager.send_personal_message(ws_message, other_id)
     
     # Send premium push notification with message preview
-    other_user = await db.users.find_one({'user_id': other_id}, {'_id': 0})
-    if other_user:
-        # Prepare notification content
-        notification_title = f"💬 {current_user['name']}"
-        
-        # Show actual message content (truncate if too long)
-        if msg.message_type == 'voice':
-            notification_body = "🎤 Sent a voice message"
-        elif msg.gif_url:
-            notification_body = "📷 Sent a GIF"
-        else:
-            notification_body = msg.content[:150] + ('...' if len(msg.content) > 150 else '')
-        
-        asyncio.create_task(send_push_notification(
-            other_id,
-            notification_title,
-            notification_body,
-            {
-                'type': 'new_message',
-                'match_id': msg.match_id,
-                'message_id': message_doc['message_id'],
-                'sender_id': current_user['user_id'],
-                'sender_name': current_user['name'],
-                'sender_photo': current_user.get('photos', [None])[0],
-                'tag': f"message_{msg.match_id}"  # Group notifications by conversation
-            }
-        ))
+    # Prepare notification content
+    notification_title = f"💬 {current_user['name']}"
+    
+    # Show actual message content (truncate if too long)
+    if msg.message_type == 'voice':
+        notification_body = "🎤 Sent a voice message"
+    elif msg.gif_url:
+        notification_body = "📷 Sent a GIF"
+    else:
+        notification_body = msg.content[:150] + ('...' if len(msg.content) > 150 else '')
+    
+    push_dispatcher.enqueue(
+        other_id,
+        notification_title,
+        notification_body,
+        {
+            'type': 'new_message',
+            'match_id': msg.match_id,
+            'message_id': message_doc['message_id'],
+            'sender_id': current_user['user_id'],
+            'sender_name': current_user['name'],
+            'sender_photo': (current_user.get('photos') or [None])[0],
+            'tag': f"message_{msg.match_id}"  # Group notifications by conversation
+        }
+    )
     
     return message_doc
 
 @api_router.put("/messages/{message_id}/read")
-async def mark_message_read(message_id: str, current_user: dict = Depends(get_current_user)):
+async def mark_message_read(message_id: str, current_user_id: str = Depends(get_current_user_id)):
     """Mark a message as read"""
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     result = await db.messages.update_one(
-        {'message_id': message_id, 'sender_id': {'$ne': current_user['user_id']}},
+        {'message_id': message_id, 'sender_id': {'$ne': current_user_id}},
         {'$set': {'read': True, 'read_at': now}}
     )
     
@@ -2120,7 +2532,7 @@ async def mark_message_read(message_id: str, current_user: dict = Depends(get_cu
 
 
 @api_router.put("/messages/{message_id}")
-async def edit_message(message_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+async def edit_message(message_id: str, request: Request, current_user_id: str = Depends(get_current_user_id)):
     """Edit a message (within 15 minutes of sending)"""
     body = await request.json()
     new_content = body.get('content', '').strip()
@@ -2138,11 +2550,11 @@ async def edit_message(message_id: str, request: Request, current_user: dict = D
         raise HTTPException(status_code=404, detail='Message not found')
     
     # Verify ownership
-    if message['sender_id'] != current_user['user_id']:
+    if message['sender_id'] != current_user_id:
         raise HTTPException(status_code=403, detail='You can only edit your own messages')
     
     # Check if message was sent within last 15 minutes
-    sent_at = datetime.fromisoformat(message['sent_at'])
+    sent_at = message.get('sent_at') or message['created_at']
     now = datetime.now(timezone.utc)
     time_diff = (now - sent_at).total_seconds() / 60  # minutes
     
@@ -2150,7 +2562,7 @@ async def edit_message(message_id: str, request: Request, current_user: dict = D
         raise HTTPException(status_code=400, detail='Can only edit messages within 15 minutes of sending')
     
     # Update message
-    edited_at = now.isoformat()
+    edited_at = now
     await db.messages.update_one(
         {'message_id': message_id},
         {'$set': {
@@ -2166,7 +2578,7 @@ async def edit_message(message_id: str, request: Request, current_user: dict = D
     # Send update via WebSocket to other user
     match = await db.matches.find_one({'match_id': message['match_id']}, {'_id': 0})
     if match:
-        other_id = match['user2_id'] if match['user1_id'] == current_user['user_id'] else match['user1_id']
+        other_id = match['user2_id'] if match['user1_id'] == current_user_id else match['user1_id']
         ws_message = {
             'type': 'message_edited',
             'message': updated_message
@@ -2176,7 +2588,7 @@ async def edit_message(message_id: str, request: Request, current_user: dict = D
     return updated_message
 
 @api_router.delete("/messages/{message_id}")
-async def delete_message(message_id: str, current_user: dict = Depends(get_current_user)):
+async def delete_message(message_id: str, current_user_id: str = Depends(get_current_user_id)):
     """Delete a message (soft delete - marks as deleted)"""
     # Get the message
     message = await db.messages.find_one({'message_id': message_id}, {'_id': 0})
@@ -2185,11 +2597,11 @@ async def delete_message(message_id: str, current_user: dict = Depends(get_curre
         raise HTTPException(status_code=404, detail='Message not found')
     
     # Verify ownership
-    if message['sender_id'] != current_user['user_id']:
+    if message['sender_id'] != current_user_id:
         raise HTTPException(status_code=403, detail='You can only delete your own messages')
     
     # Soft delete - mark as deleted
-    deleted_at = datetime.now(timezone.utc).isoformat()
+    deleted_at = datetime.now(timezone.utc)
     await db.messages.update_one(
         {'message_id': message_id},
         {'$set': {
@@ -2202,7 +2614,7 @@ async def delete_message(message_id: str, current_user: dict = Depends(get_curre
     # Send update via WebSocket to other user
     match = await db.matches.find_one({'match_id': message['match_id']}, {'_id': 0})
     if match:
-        other_id = match['user2_id'] if match['user1_id'] == current_user['user_id'] else match['user1_id']
+        other_id = match['user2_id'] if match['user1_id'] == current_user_id else match['user1_id']
         ws_message = {
             'type': 'message_deleted',
             'message_id': message_id
@@ -2241,13 +2653,13 @@ async def upload_voice_message(
                 'user_id': current_user['user_id'],
                 'match_id': match_id,
                 'duration': duration,
-                'created_at': datetime.now(timezone.utc).isoformat(),
-                'expires_at': (datetime.now(timezone.utc) + timedelta(hours=24)).isoformat()
+                'created_at': datetime.now(timezone.utc),
+                'expires_at': datetime.now(timezone.utc) + timedelta(hours=24)
             }
         )
         
         # Create message document
-        now = datetime.now(timezone.utc).isoformat()
+        now = datetime.now(timezone.utc)
         message_doc = {
             'message_id': f"msg_{uuid.uuid4().hex[:12]}",
             'match_id': match_id,
@@ -2283,22 +2695,20 @@ async def upload_voice_message(
         await manager.send_personal_message(ws_message, other_id)
         
         # Send premium push notification
-        other_user = await db.users.find_one({'user_id': other_id}, {'_id': 0})
-        if other_user:
-            asyncio.create_task(send_push_notification(
-                other_id,
-                f"💬 {current_user['name']}",
-                f"🎤 Sent a voice message ({duration}s)",
-                {
-                    'type': 'new_message',
-                    'match_id': match_id,
-                    'message_id': message_doc['message_id'],
-                    'sender_id': current_user['user_id'],
-                    'sender_name': current_user['name'],
-                    'sender_photo': current_user.get('photos', [None])[0],
-                    'tag': f"message_{match_id}"
-                }
-            ))
+        push_dispatcher.enqueue(
+            other_id,
+            f"💬 {current_user['name']}",
+            f"🎤 Sent a voice message ({duration}s)",
+            {
+                'type': 'new_message',
+                'match_id': match_id,
+                'message_id': message_doc['message_id'],
+                'sender_id': current_user['user_id'],
+                'sender_name': current_user['name'],
+                'sender_photo': (current_user.get('photos') or [None])[0],
+                'tag': f"message_{match_id}"
+            }
+        )
         
         return message_doc
         
@@ -2309,7 +2719,7 @@ async def upload_voice_message(
 @api_router.get("/messages/voice/{file_id}")
 async def get_voice_message(
     file_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user_id: str = Depends(get_current_user_id)
 ):
     """Stream voice message from GridFS"""
     try:
@@ -2322,7 +2732,7 @@ async def get_voice_message(
         # Check if user is part of the match
         match = await db.matches.find_one({
             'match_id': metadata['match_id'],
-            '$or': [{'user1_id': current_user['user_id']}, {'user2_id': current_user['user_id']}]
+            '$or': [{'user1_id': current_user_id}, {'user2_id': current_user_id}]
         })
         if not match:
             raise HTTPException(status_code=403, detail='Access denied')
@@ -2354,24 +2764,19 @@ async def cleanup_expired_voice_messages():
             now = datetime.now(timezone.utc)
             
             # Find expired voice files in GridFS
-            async for grid_file in fs.find({'metadata.expires_at': {'$exists': True}}):
+            async for grid_file in fs.find({'metadata.expires_at': {'$lt': now}}):
                 try:
-                    expires_at = datetime.fromisoformat(grid_file.metadata['expires_at'])
-                    if expires_at.tzinfo is None:
-                        expires_at = expires_at.replace(tzinfo=timezone.utc)
+                    # Delete from GridFS
+                    await fs.delete(grid_file._id)
+                    
+                    # Mark message as expired
+                    await db.messages.update_one(
+                        {'voice_file_id': str(grid_file._id)},
+                        {'$set': {'content': '🎤 Voice message (expired)', 'is_expired': True}}
+                    )
+                    
+                    logger.info(f"Deleted expired voice message: {grid_file._id}")
                     
-                    if expires_at < now:
-                        # Delete from GridFS
-                        await fs.delete(grid_file._id)
-                        
-                        # Mark message as expired
-                        await db.messages.update_one(
-                            {'voice_file_id': str(grid_file._id)},
-                            {'$set': {'content': '🎤 Voice message (expired)', 'is_expired': True}}
-                        )
-                        
-                        logger.info(f"Deleted expired voice message: {grid_file._id}")
-                        
                 except Exception as e:
                     logger.error(f"Error cleaning up voice file {grid_file._id}: {e}")
                     
@@ -2381,47 +2786,76 @@ async def cleanup_expired_voice_messages():
 
 # ==================== AI ROUTES ====================
 
+# Profile fields the personalised starters are generated from
+STARTER_PROFILE_FIELDS = ('name', 'interests', 'bio', 'prompts')
+
+DEFAULT_STARTERS = [
+    "If you could travel anywhere tomorrow, where would you go?",
+    "What's something you're really passionate about that most people don't know?",
+    "What's the best meal you've ever had?"
+]
+
+# Personalised starters keyed by a hash of the target's STARTER_PROFILE_FIELDS
+starter_cache = TTLCache(
+    maxsize=int(os.environ.get('STARTER_CACHE_SIZE', '10000')),
+    ttl=int(os.environ.get('STARTER_CACHE_TTL', '86400'))
+)
+# Latest content hash per user, so a profile update can evict its entry
+starter_profile_hashes = TTLCache(maxsize=starter_cache.maxsize, ttl=starter_cache.ttl)
+
+# Generic starters generated ahead of time by refresh_generic_starters()
+generic_starter_pool = deque(DEFAULT_STARTERS, maxlen=30)
+GENERIC_STARTER_REFRESH_SECONDS = int(os.environ.get('GENERIC_STARTER_REFRESH_SECONDS', '3600'))
+
+def starter_profile_hash(profile: dict) -> str:
+    content = {field: profile.get(field) for field in STARTER_PROFILE_FIELDS}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def invalidate_starters(user_id: str):
+    """Drop cached personalised starters for a user whose profile changed"""
+    content_hash = starter_profile_hashes.pop(user_id, None)
+    if content_hash:
+        starter_cache.pop(content_hash, None)
+
+async def refresh_generic_starters():
+    """Background task: keep the generic starter pool topped up with fresh AI output"""
+    while True:
+        try:
+            starters = await ai_gateway.complete_list([
+                {'role': 'system', 'content': 'You are a helpful dating coach. Generate conversation starters that are fun, respectful, and likely to get a response. Return only a JSON array of 10 strings.'},
+                {'role': 'user', 'content': "Generate 10 creative, fun, and engaging conversation starters for a dating app."}
+            ], max_tokens=600)
+            generic_starter_pool.extend(s for s in starters if isinstance(s, str) and s.strip())
+        except Exception as e:
+            logger.error(f"Generic starter refresh error: {e}")
+        
+        await asyncio.sleep(GENERIC_STARTER_REFRESH_SECONDS)
+
 @api_router.post("/ai/conversation-starters")
 async def get_conversation_starters(current_user: dict = Depends(get_current_user)):
-    try:
-        prompt = "Generate 3 creative, fun, and engaging conversation starters for a dating app."
-        
-        completion = openai_client.chat.completions.create(
-            model='gpt-4o-mini',
-            messages=[
-                {'role': 'system', 'content': 'You are a helpful dating coach. Generate conversation starters that are fun, respectful, and likely to get a response. Return only a JSON array of 3 strings.'},
-                {'role': 'user', 'content': prompt}
-            ],
-            max_tokens=200
-        )
-        
-        starters = json.loads(completion.choices[0].message.content)
-        return {'starters': starters}
-    except Exception as e:
-        logger.error(f"AI conversation starter error: {e}")
-        return {'starters': [
-            "If you could travel anywhere tomorrow, where would you go?",
-            "What's something you're really passionate about that most people don't know?",
-            "What's the best meal you've ever had?"
-        ]}
+    import random
+    # Served from the pre-generated pool; never waits on the model
+    return {'starters': random.sample(list(generic_starter_pool), 3)}
 
 @api_router.post("/ai/conversation-starters/{other_user_id}")
 async def get_personalized_starters(other_user_id: str, current_user: dict = Depends(get_current_user)):
-    other_profile = await db.users.find_one({'user_id': other_user_id}, {'_id': 0, 'password': 0})
+    other_profile = await db.users.find_one({'user_id': other_user_id}, CARD_PROJECTION)
     if not other_profile:
         raise HTTPException(status_code=404, detail='User not found')
     
+    content_hash = starter_profile_hash(other_profile)
+    cached = starter_cache.get(content_hash)
+    if cached:
+        return {'starters': cached}
+    
     try:
-        completion = openai_client.chat.completions.create(
-            model='gpt-4o-mini',
-            messages=[
-                {'role': 'system', 'content': 'You are a helpful dating coach. Generate personalized conversation starters based on the profile. Return only a JSON array of 3 strings.'},
-                {'role': 'user', 'content': f"Profile: Name: {other_profile.get('name')}, Interests: {other_profile.get('interests', [])}, Bio: {other_profile.get('bio', '')}, Prompts: {other_profile.get('prompts', [])}"}
-            ],
-            max_tokens=200
-        )
+        starters = await ai_gateway.complete_list([
+            {'role': 'system', 'content': 'You are a helpful dating coach. Generate personalized conversation starters based on the profile. Return only a JSON array of 3 strings.'},
+            {'role': 'user', 'content': f"Profile: Name: {other_profile.get('name')}, Interests: {other_profile.get('interests', [])}, Bio: {other_profile.get('bio', '')}, Prompts: {other_profile.get('prompts', [])}"}
+        ], max_tokens=200)
         
-        starters = json.loads(completion.choices[0].message.content)
+        starter_cache[content_hash] = starters
+        starter_profile_hashes[other_user_id] = content_hash
         return {'starters': starters}
     except Exception as e:
         logger.error(f"AI personalized starter error: {e}")
@@ -2582,7 +3016,7 @@ async def start_icebreaker(request: Request, current_user: dict = Depends(get_cu
         'answers': {},
         'score': {match['user1_id']: 0, match['user2_id']: 0},
         'current_question': 0,
-        'created_at': datetime.now(timezone.utc).isoformat()
+        'created_at': datetime.now(timezone.utc)
     }
     
     await db.icebreaker_sessions.insert_one(session_doc)
@@ -2601,7 +3035,7 @@ async def start_icebreaker(request: Request, current_user: dict = Depends(get_cu
     return {k: v for k, v in session_doc.items() if k != '_id'}
 
 @api_router.get("/icebreakers/{session_id}")
-async def get_icebreaker_session(session_id: str, current_user: dict = Depends(get_current_user)):
+async def get_icebreaker_session(session_id: str, current_user_id: str = Depends(get_current_user_id)):
     """Get icebreaker game session details"""
     session = await db.icebreaker_sessions.find_one({'session_id': session_id}, {'_id': 0})
     
@@ -2610,7 +3044,7 @@ async def get_icebreaker_session(session_id: str, current_user: dict = Depends(g
     
     # Verify user is part of the match
     match = await db.matches.find_one({'match_id': session['match_id']}, {'_id': 0})
-    if current_user['user_id'] not in [match['user1_id'], match['user2_id']]:
+    if current_user_id not in [match['user1_id'], match['user2_id']]:
         raise HTTPException(status_code=403, detail='You are not part of this game')
     
     return session
@@ -2656,7 +3090,7 @@ async def submit_icebreaker_answer(session_id: str, request: Request, current_us
         session['current_question'] = question_index + 1
     elif both_answered:
         session['status'] = 'completed'
-        session['completed_at'] = datetime.now(timezone.utc).isoformat()
+        session['completed_at'] = datetime.now(timezone.utc)
     
     # Update session
     await db.icebreaker_sessions.update_one(
@@ -2748,7 +3182,7 @@ async def send_virtual_gift(request: Request, current_user: dict = Depends(get_c
     
     # Create gift record
     gift_record_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     gift_record = {
         'gift_id': gift_record_id,
@@ -2805,12 +3239,12 @@ async def send_virtual_gift(request: Request, current_user: dict = Depends(get_c
     await manager.send_personal_message(ws_message, other_id)
     
     # Send push notification
-    asyncio.create_task(send_push_notification(
+    push_dispatcher.enqueue(
         other_id,
         f"Gift from {current_user['name']} 🎁",
         f"{current_user['name']} sent you a {gift_data['name']} {gift_data['emoji']}",
         {'type': 'virtual_gifts', 'match_id': match_id, 'gift_id': gift_id}
-    ))
+    )
     
     return {
         'gift': {k: v for k, v in gift_record.items() if k != '_id'},
@@ -2818,10 +3252,10 @@ async def send_virtual_gift(request: Request, current_user: dict = Depends(get_c
     }
 
 @api_router.get("/virtual-gifts/received")
-async def get_received_gifts(current_user: dict = Depends(get_current_user)):
+async def get_received_gifts(current_user_id: str = Depends(get_current_user_id)):
     """Get virtual gifts received by the user"""
     gifts = await db.virtual_gifts.find(
-        {'receiver_id': current_user['user_id']},
+        {'receiver_id': current_user_id},
         {'_id': 0}
     ).sort('sent_at', -1).limit(50).to_list(50)
     
@@ -2843,8 +3277,10 @@ async def register_fcm_token(request: Request, current_user: dict = Depends(get_
     # Save token to user's record
     await db.users.update_one(
         {'user_id': current_user['user_id']},
-        {'$set': {'fcm_token': fcm_token, 'last_token_update': datetime.now(timezone.utc).isoformat()}}
+        {'$set': {'fcm_token': fcm_token, 'last_token_update': datetime.now(timezone.utc)}}
     )
+    invalidate_user(current_user['user_id'])
+    push_dispatcher.invalidate(current_user['user_id'])
     
     return {'message': 'Token registered successfully'}
 
@@ -2867,13 +3303,15 @@ async def update_notification_preferences(request: Request, current_user: dict =
         {'user_id': current_user['user_id']},
         {'$set': {'notification_preferences': preferences}}
     )
+    invalidate_user(current_user['user_id'])
+    push_dispatcher.invalidate(current_user['user_id'])
     
     return {'message': 'Preferences updated', 'preferences': preferences}
 
 @api_router.get("/notifications/preferences")
-async def get_notification_preferences(current_user: dict = Depends(get_current_user)):
+async def get_notification_preferences(current_user_id: str = Depends(get_current_user_id)):
     """Get user's notification preferences"""
-    user = await db.users.find_one({'user_id': current_user['user_id']}, {'_id': 0})
+    user = await db.users.find_one({'user_id': current_user_id}, {'_id': 0})
     preferences = user.get('notification_preferences', {
         'new_matches': True,
         'new_messages': True,
@@ -2886,73 +3324,22 @@ async def get_notification_preferences(current_user: dict = Depends(get_current_
     
     return {'preferences': preferences}
 
-async def send_push_notification(user_id: str, title: str, body: str, data: dict = None):
-    """Helper function to send push notification via Firebase"""
-    try:
-        # Get user's FCM token
-        user = await db.users.find_one({'user_id': user_id}, {'_id': 0})
-        
-        if not user or not user.get('fcm_token'):
-            logger.info(f"No FCM token for user {user_id}")
-            return False
-        
-        # Check notification preferences
-        preferences = user.get('notification_preferences', {})
-        notification_type = data.get('type') if data else 'general'
-        
-        # Check if user has this notification type enabled
-        if notification_type in preferences and not preferences.get(notification_type):
-            logger.info(f"Notification type {notification_type} disabled for user {user_id}")
-            return False
-        
-        # Prepare message
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=title,
-                body=body,
-            ),
-            data=data or {},
-            token=user['fcm_token']
-        )
-        
-        # Send message
-        response = messaging.send(message)
-        logger.info(f"Push notification sent to {user_id}: {response}")
-        
-        # Store notification in database
-        notification_doc = {
-            'notification_id': str(uuid.uuid4()),
-            'user_id': user_id,
-            'title': title,
-            'body': body,
-            'data': data or {},
-            'sent_at': datetime.now(timezone.utc).isoformat(),
-            'read': False
-        }
-        await db.notifications.insert_one(notification_doc)
-        
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to send push notification: {e}")
-        return False
-
 @api_router.get("/notifications/history")
-async def get_notification_history(current_user: dict = Depends(get_current_user)):
+async def get_notification_history(current_user_id: str = Depends(get_current_user_id)):
     """Get user's notification history"""
     notifications = await db.notifications.find(
-        {'user_id': current_user['user_id']},
+        {'user_id': current_user_id},
         {'_id': 0}
     ).sort('sent_at', -1).limit(50).to_list(50)
     
     return {'notifications': notifications, 'total': len(notifications)}
 
 @api_router.put("/notifications/{notification_id}/read")
-async def mark_notification_read(notification_id: str, current_user: dict = Depends(get_current_user)):
+async def mark_notification_read(notification_id: str, current_user_id: str = Depends(get_current_user_id)):
     """Mark a notification as read"""
     result = await db.notifications.update_one(
-        {'notification_id': notification_id, 'user_id': current_user['user_id']},
-        {'$set': {'read': True, 'read_at': datetime.now(timezone.utc).isoformat()}}
+        {'notification_id': notification_id, 'user_id': current_user_id},
+        {'$set': {'read': True, 'read_at': datetime.now(timezone.utc)}}
     )
     
     if result.modified_count == 0:
@@ -3024,7 +3411,7 @@ async def get_premium_plans():
 # ==================== VIDEO CALL ENHANCEMENTS ====================
 
 @api_router.post("/calls/{call_id}/reaction")
-async def send_call_reaction(call_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+async def send_call_reaction(call_id: str, request: Request, current_user_id: str = Depends(get_current_user_id)):
     """Send a reaction during a video call (emoji, hearts, etc.)"""
     body = await request.json()
     reaction = body.get('reaction')
@@ -3032,24 +3419,15 @@ async def send_call_reaction(call_id: str, request: Request, current_user: dict
     if not reaction:
         raise HTTPException(status_code=400, detail='Reaction required')
     
-    # Get call details
-    call = await db.calls.find_one({'call_id': call_id}, {'_id': 0})
-    if not call:
+    session = await get_call_session(call_id, current_user_id)
+    if not session:
         raise HTTPException(status_code=404, detail='Call not found')
     
-    # Verify user is part of the call
-    if current_user['user_id'] not in [call['caller_id'], call['callee_id']]:
-        raise HTTPException(status_code=403, detail='Not part of this call')
-    
-    # Send reaction to other user via WebSocket
-    other_id = call['callee_id'] if call['caller_id'] == current_user['user_id'] else call['caller_id']
-    ws_message = {
+    await relay_call_frame(session, current_user_id, {
         'type': 'call_reaction',
         'call_id': call_id,
-        'reaction': reaction,
-        'from_user_id': current_user['user_id']
-    }
-    await manager.send_personal_message(ws_message, other_id)
+        'reaction': reaction
+    })
     
     return {'message': 'Reaction sent', 'reaction': reaction}
 
@@ -3074,25 +3452,25 @@ async def get_available_reactions():
 # ==================== NOTIFICATIONS ROUTES ====================
 
 @api_router.get("/notifications")
-async def get_notifications(current_user: dict = Depends(get_current_user)):
+async def get_notifications(current_user_id: str = Depends(get_current_user_id)):
     notifications = await db.notifications.find(
-        {'user_id': current_user['user_id']},
+        {'user_id': current_user_id},
         {'_id': 0}
     ).sort('created_at', -1).limit(50).to_list(50)
     return notifications
 
 @api_router.put("/notifications/read")
-async def mark_notifications_read(current_user: dict = Depends(get_current_user)):
+async def mark_notifications_read(current_user_id: str = Depends(get_current_user_id)):
     await db.notifications.update_many(
-        {'user_id': current_user['user_id'], 'read': False},
+        {'user_id': current_user_id, 'read': False},
         {'$set': {'read': True}}
     )
     return {'message': 'Notifications marked as read'}
 
 @api_router.get("/notifications/unread-count")
-async def get_unread_count(current_user: dict = Depends(get_current_user)):
+async def get_unread_count(current_user_id: str = Depends(get_current_user_id)):
     count = await db.notifications.count_documents({
-        'user_id': current_user['user_id'],
+        'user_id': current_user_id,
         'read': False
     })
     return {'count': count}
@@ -3123,6 +3501,71 @@ async def get_prompts_library():
 
 # ==================== WEBRTC CALLING WITH TURN SERVERS ====================
 
+# Allowed status changes, and who may make them; 'ended' can be set by either side
+CALL_TRANSITIONS = {
+    'connected': {'from': {'ringing'}, 'by': 'callee_id', 'notify': 'call_answered'},
+    'rejected': {'from': {'ringing'}, 'by': 'callee_id', 'notify': 'call_rejected'},
+    'ended': {'from': {'ringing', 'connected'}, 'by': None, 'notify': 'call_ended'}
+}
+CALL_FINAL_STATUSES = {'rejected', 'ended'}
+
+async def get_call_session(call_id: str, user_id: str) -> Optional[dict]:
+    """In-memory session of a live call if user_id is a participant. Loaded from
+    db.calls once per worker, so signalling after that never touches Mongo."""
+    session = manager.call_sessions.get(call_id)
+    if session is None:
+        call = await db.calls.find_one(
+            {'call_id': call_id},
+            {'_id': 0, 'caller_id': 1, 'callee_id': 1, 'status': 1}
+        )
+        if not call or call['status'] in CALL_FINAL_STATUSES:
+            return None
+        session = call
+        manager.call_sessions[call_id] = session
+    
+    if user_id not in (session['caller_id'], session['callee_id']):
+        return None
+    return session
+
+async def relay_call_frame(session: dict, from_user_id: str, frame: dict):
+    """Forward a signalling frame to the other participant"""
+    other_id = session['callee_id'] if session['caller_id'] == from_user_id else session['caller_id']
+    frame['from_user_id'] = from_user_id
+    await manager.send_personal_message(frame, other_id)
+
+async def transition_call(call_id: str, user_id: str, status: str) -> Optional[dict]:
+    """Move a call to a new status: the only point where calls are written.
+    Returns the session, or None if the call or the transition isn't valid."""
+    session = await get_call_session(call_id, user_id)
+    rule = CALL_TRANSITIONS[status]
+    if not session or (rule['by'] and session[rule['by']] != user_id):
+        return None
+    
+    update = {'status': status}
+    if status == 'ended':
+        update['ended_at'] = datetime.now(timezone.utc)
+    
+    # Conditional on the stored status, so workers with a stale session can't regress it
+    result = await db.calls.update_one(
+        {'call_id': call_id, 'status': {'$in': list(rule['from'])}},
+        {'$set': update}
+    )
+    if result.modified_count == 0:
+        manager.call_sessions.pop(call_id, None)
+        return None
+    
+    session['status'] = status
+    frame = {'type': rule['notify'], 'call_id': call_id}
+    if status == 'connected':
+        frame['ice_servers'] = TURN_SERVERS
+    await relay_call_frame(session, user_id, frame)
+    
+    if status in CALL_FINAL_STATUSES:
+        # Other workers may hold this session too; stop them relaying for it
+        manager.call_sessions.pop(call_id, None)
+        await manager.backplane.broadcast({'type': 'call_closed', 'call_id': call_id})
+    return session
+
 @api_router.get("/calls/ice-servers")
 async def get_ice_servers(current_user: dict = Depends(get_current_user)):
     """Get ICE servers including TURN for reliable connections"""
@@ -3144,7 +3587,7 @@ async def initiate_call(request: Request, current_user: dict = Depends(get_curre
     other_id = match['user2_id'] if match['user1_id'] == current_user['user_id'] else match['user1_id']
     
     call_id = f"call_{uuid.uuid4().hex[:12]}"
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     call_doc = {
         'call_id': call_id,
@@ -3156,6 +3599,11 @@ async def initiate_call(request: Request, current_user: dict = Depends(get_curre
         'created_at': now
     }
     await db.calls.insert_one(call_doc)
+    manager.call_sessions[call_id] = {
+        'caller_id': current_user['user_id'],
+        'callee_id': other_id,
+        'status': 'ringing'
+    }
     
     call_notification = {
         'type': 'incoming_call',
@@ -3174,76 +3622,41 @@ async def initiate_call(request: Request, current_user: dict = Depends(get_curre
     return {'call_id': call_id, 'status': 'ringing', 'ice_servers': TURN_SERVERS}
 
 @api_router.post("/calls/{call_id}/answer")
-async def answer_call(call_id: str, current_user: dict = Depends(get_current_user)):
-    call = await db.calls.find_one({'call_id': call_id, 'callee_id': current_user['user_id']})
-    if not call:
+async def answer_call(call_id: str, current_user_id: str = Depends(get_current_user_id)):
+    if not await transition_call(call_id, current_user_id, 'connected'):
         raise HTTPException(status_code=404, detail='Call not found')
     
-    await db.calls.update_one({'call_id': call_id}, {'$set': {'status': 'connected'}})
-    
-    await manager.send_personal_message({
-        'type': 'call_answered',
-        'call_id': call_id,
-        'ice_servers': TURN_SERVERS
-    }, call['caller_id'])
-    
     return {'status': 'connected', 'ice_servers': TURN_SERVERS}
 
 @api_router.post("/calls/{call_id}/reject")
-async def reject_call(call_id: str, current_user: dict = Depends(get_current_user)):
-    call = await db.calls.find_one({'call_id': call_id, 'callee_id': current_user['user_id']})
-    if not call:
+async def reject_call(call_id: str, current_user_id: str = Depends(get_current_user_id)):
+    if not await transition_call(call_id, current_user_id, 'rejected'):
         raise HTTPException(status_code=404, detail='Call not found')
     
-    await db.calls.update_one({'call_id': call_id}, {'$set': {'status': 'rejected'}})
-    
-    await manager.send_personal_message({
-        'type': 'call_rejected',
-        'call_id': call_id
-    }, call['caller_id'])
-    
     return {'status': 'rejected'}
 
 @api_router.post("/calls/{call_id}/end")
-async def end_call(call_id: str, current_user: dict = Depends(get_current_user)):
-    call = await db.calls.find_one({
-        'call_id': call_id,
-        '$or': [{'caller_id': current_user['user_id']}, {'callee_id': current_user['user_id']}]
-    })
-    if not call:
+async def end_call(call_id: str, current_user_id: str = Depends(get_current_user_id)):
+    if not await transition_call(call_id, current_user_id, 'ended'):
         raise HTTPException(status_code=404, detail='Call not found')
     
-    await db.calls.update_one({'call_id': call_id}, {'$set': {'status': 'ended', 'ended_at': datetime.now(timezone.utc).isoformat()}})
-    
-    other_id = call['callee_id'] if call['caller_id'] == current_user['user_id'] else call['caller_id']
-    await manager.send_personal_message({
-        'type': 'call_ended',
-        'call_id': call_id
-    }, other_id)
-    
     return {'status': 'ended'}
 
 @api_router.post("/calls/{call_id}/signal")
-async def send_signal(call_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+async def send_signal(call_id: str, request: Request, current_user_id: str = Depends(get_current_user_id)):
+    """HTTP fallback; clients send webrtc_signal frames over the WebSocket"""
     body = await request.json()
-    signal_type = body.get('signal_type')
-    signal_data = body.get('data')
     
-    call = await db.calls.find_one({
-        'call_id': call_id,
-        '$or': [{'caller_id': current_user['user_id']}, {'callee_id': current_user['user_id']}]
-    })
-    if not call:
+    session = await get_call_session(call_id, current_user_id)
+    if not session:
         raise HTTPException(status_code=404, detail='Call not found')
     
-    other_id = call['callee_id'] if call['caller_id'] == current_user['user_id'] else call['caller_id']
-    
-    await manager.send_personal_message({
+    await relay_call_frame(session, current_user_id, {
         'type': 'webrtc_signal',
         'call_id': call_id,
-        'signal_type': signal_type,
-        'data': signal_data
-    }, other_id)
+        'signal_type': body.get('signal_type'),
+        'data': body.get('data')
+    })
     
     return {'status': 'signal_sent'}
 
@@ -3259,19 +3672,14 @@ async def check_expired_matches():
         'disconnected': 0
     }
     
-    # Find all matches without first message
-    matches = await db.matches.find({'first_message_sent': False}, {'_id': 0}).to_list(10000)
+    # Find matches without a first message that are old enough for a warning
+    matches = await db.matches.find({
+        'first_message_sent': False,
+        'matched_at': {'$lte': now - timedelta(hours=3)}
+    }, {'_id': 0}).to_list(10000)
     
     for match in matches:
-        matched_at = match.get('matched_at')
-        if not matched_at:
-            continue
-        
-        if isinstance(matched_at, str):
-            matched_at = datetime.fromisoformat(matched_at)
-        if matched_at.tzinfo is None:
-            matched_at = matched_at.replace(tzinfo=timezone.utc)
-        
+        matched_at = match['matched_at']
         hours_since_match = (now - matched_at).total_seconds() / 3600
         warnings_sent = match.get('disconnect_warnings_sent', [])
         
@@ -3283,12 +3691,14 @@ async def check_expired_matches():
                 'user1_id': match['user1_id'],
                 'user2_id': match['user2_id'],
                 'matched_at': match.get('matched_at'),
-                'disconnected_at': now.isoformat(),
+                'disconnected_at': now,
                 'reason': 'no_message_12h'
             })
             
             # Delete the match
             await db.matches.delete_one({'match_id': match['match_id']})
+            await remove_discover_exclusion(match['user1_id'], 'matched', match['user2_id'])
+            await remove_discover_exclusion(match['user2_id'], 'matched', match['user1_id'])
             
             # Send disconnect notifications
             disconnect_message = {
@@ -3304,8 +3714,8 @@ async def check_expired_matches():
         
         # 6 hour warning
         elif hours_since_match >= 6 and '6h' not in warnings_sent:
-            user1 = await db.users.find_one({'user_id': match['user1_id']}, {'_id': 0, 'password': 0})
-            user2 = await db.users.find_one({'user_id': match['user2_id']}, {'_id': 0, 'password': 0})
+            user1 = await db.users.find_one({'user_id': match['user1_id']}, MATCH_LIST_PROJECTION)
+            user2 = await db.users.find_one({'user_id': match['user2_id']}, MATCH_LIST_PROJECTION)
             
             warning_message_1 = {
                 'type': 'match_expiring_soon',
@@ -3345,8 +3755,8 @@ async def check_expired_matches():
         
         # 3 hour warning
         elif hours_since_match >= 3 and '3h' not in warnings_sent:
-            user1 = await db.users.find_one({'user_id': match['user1_id']}, {'_id': 0, 'password': 0})
-            user2 = await db.users.find_one({'user_id': match['user2_id']}, {'_id': 0, 'password': 0})
+            user1 = await db.users.find_one({'user_id': match['user1_id']}, MATCH_LIST_PROJECTION)
+            user2 = await db.users.find_one({'user_id': match['user2_id']}, MATCH_LIST_PROJECTION)
             
             warning_message_1 = {
                 'type': 'match_expiring_soon',
@@ -3397,6 +3807,7 @@ async def update_filter_preferences(filters: FilterPreferences, current_user: di
         {'user_id': current_user['user_id']},
         {'$set': {'filter_preferences': filter_dict}}
     )
+    invalidate_user(current_user['user_id'])
     
     return {'message': 'Filter preferences updated', 'filters': filter_dict}
 
@@ -3432,17 +3843,12 @@ async def undo_last_pass(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail='No recent pass to undo')
     
     # Check if it was within the last hour
-    if isinstance(last_passed_at, str):
-        last_passed_at = datetime.fromisoformat(last_passed_at)
-    if last_passed_at.tzinfo is None:
-        last_passed_at = last_passed_at.replace(tzinfo=timezone.utc)
-    
     now = datetime.now(timezone.utc)
     if (now - last_passed_at).total_seconds() > 3600:  # 1 hour
         raise HTTPException(status_code=400, detail='Can only undo passes from the last hour')
     
     # Get the profile
-    profile = await db.users.find_one({'user_id': last_passed_id}, {'_id': 0, 'password': 0})
+    profile = await db.users.find_one({'user_id': last_passed_id}, CARD_PROJECTION)
     if not profile:
         raise HTTPException(status_code=404, detail='Profile not found')
     
@@ -3451,12 +3857,14 @@ async def undo_last_pass(current_user: dict = Depends(get_current_user)):
         {'user_id': current_user['user_id']},
         {'$set': {'last_passed_user_id': None, 'last_passed_at': None}}
     )
+    invalidate_user(current_user['user_id'])
+    await remove_discover_exclusion(current_user['user_id'], 'passed', last_passed_id)
     
     return {'message': 'Pass undone', 'profile': profile}
 
 @api_router.get("/discover/daily-picks")
 async def get_daily_picks(current_user: dict = Depends(get_current_user)):
-    """Get 10 AI-curated daily picks"""
+    """Get 10 daily picks, ranked locally and optionally re-ranked by AI"""
     # Check verification
     if current_user.get('verification_status') != 'verified':
         raise HTTPException(status_code=403, detail='Profile verification required')
@@ -3471,65 +3879,27 @@ async def get_daily_picks(current_user: dict = Depends(get_current_user)):
     
     if existing_picks:
         # Return existing picks
-        profiles = []
-        for user_id in existing_picks['picked_user_ids']:
-            profile = await db.users.find_one({'user_id': user_id}, {'_id': 0, 'password': 0})
-            if profile:
-                profiles.append(profile)
-        return profiles
+        profiles = await hydrate_users(existing_picks['picked_user_ids'], CARD_PROJECTION)
+        return list(profiles.values())
     
     # Generate new picks
-    # Get all eligible profiles
+    # Get all eligible profiles, best scored first
     profiles = await discover_profiles(current_user)
+    profiles = await rank_for_user(current_user, profiles)
     
-    if len(profiles) <= 10:
-        picked_profiles = profiles
-    else:
-        # Use AI to select best 10
-        try:
-            user_data = {
-                'interests': current_user.get('interests', []),
-                'bio': current_user.get('bio', ''),
-                'age': current_user.get('age'),
-                'location': current_user.get('location', '')
-            }
-            
-            profiles_summary = [
-                {
-                    'index': i,
-                    'name': p.get('name'),
-                    'age': p.get('age'),
-                    'interests': p.get('interests', []),
-                    'bio': p.get('bio', ''),
-                    'prompts': p.get('prompts', []),
-                    'photo_count': len(p.get('photos', [])),
-                    'location': p.get('location', '')
-                }
-                for i, p in enumerate(profiles[:50])
-            ]
-            
-            completion = openai_client.chat.completions.create(
-                model='gpt-4o-mini',
-                messages=[
-                    {'role': 'system', 'content': 'You are a dating app matchmaker. Select the 10 best daily picks based on compatibility, profile quality, and interesting bios. Return ONLY a JSON array of 10 indices (0-based).'},
-                    {'role': 'user', 'content': f"User profile: {user_data}\n\nAvailable profiles:\n{profiles_summary}"}
-                ],
-                max_tokens=100
-            )
-            
-            indices = json.loads(completion.choices[0].message.content)
-            picked_profiles = [profiles[i] for i in indices if i < len(profiles)]
-            
-            if len(picked_profiles) < 10:
-                # Fill with remaining profiles
-                remaining = [p for p in profiles if p not in picked_profiles]
-                picked_profiles.extend(remaining[:10 - len(picked_profiles)])
-        
-        except Exception as e:
-            logger.error(f"AI daily picks error: {e}")
-            # Fallback to random selection
-            import random
-            picked_profiles = random.sample(profiles, min(10, len(profiles)))
+    user_data = {
+        'interests': current_user.get('interests', []),
+        'bio': current_user.get('bio', ''),
+        'age': current_user.get('age'),
+        'location': current_user.get('location', '')
+    }
+    profiles = await ai_rerank(
+        profiles,
+        'Order these daily pick candidates by compatibility, profile quality, and interesting bios.',
+        user_data,
+        pool_size=max(AI_RERANK_POOL, 20)
+    )
+    picked_profiles = profiles[:10]
     
     # Store picks
     picked_user_ids = [p['user_id'] for p in picked_profiles]
@@ -3537,13 +3907,40 @@ async def get_daily_picks(current_user: dict = Depends(get_current_user)):
         'user_id': current_user['user_id'],
         'date': today,
         'picked_user_ids': picked_user_ids,
-        'generated_at': datetime.now(timezone.utc).isoformat()
+        'generated_at': datetime.now(timezone.utc)
     })
     
     return picked_profiles
 
 # ==================== WEBSOCKET ENDPOINT ====================
 
+# Call frames a client may send; call_answer/reject/end mirror the HTTP endpoints
+WS_CALL_STATUS_FRAMES = {'call_answer': 'connected', 'call_reject': 'rejected', 'call_end': 'ended'}
+WS_CALL_FRAMES = {'webrtc_signal', 'call_reaction'} | set(WS_CALL_STATUS_FRAMES)
+
+async def handle_call_frame(connection: ClientConnection, data: dict):
+    """Call signalling over the socket: relayed from the in-memory call session,
+    with a Mongo write only when the call changes state"""
+    frame_type = data['type']
+    call_id = data.get('call_id')
+    user_id = connection.user_id
+    if frame_type == 'call_reaction' and not data.get('reaction'):
+        return
+    
+    if frame_type in WS_CALL_STATUS_FRAMES:
+        session = await transition_call(call_id, user_id, WS_CALL_STATUS_FRAMES[frame_type])
+    else:
+        session = await get_call_session(call_id, user_id)
+        if session:
+            if frame_type == 'webrtc_signal':
+                frame = {'signal_type': data.get('signal_type'), 'data': data.get('data')}
+            else:
+                frame = {'reaction': data.get('reaction')}
+            await relay_call_frame(session, user_id, {'type': frame_type, 'call_id': call_id, **frame})
+    
+    if not session:
+        connection.send({'type': 'call_error', 'call_id': call_id, 'frame': frame_type, 'detail': 'Call not found'})
+
 @app.websocket("/ws/{token}")
 async def websocket_endpoint(websocket: WebSocket, token: str):
     user = await get_user_from_token(token)
@@ -3551,28 +3948,32 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
         await websocket.close(code=4001)
         return
     
-    await manager.connect(websocket, user['user_id'])
+    connection = await manager.connect(websocket, user['user_id'])
     try:
         while True:
             data = await websocket.receive_json()
             
             if data.get('type') == 'ping':
-                await websocket.send_json({'type': 'pong'})
+                presence.touch(user['user_id'])
+                connection.send({'type': 'pong'})
             elif data.get('type') == 'typing':
+                # Checked against the connection's match cache and coalesced per
+                # match; typing never touches the database
                 match_id = data.get('match_id')
-                match = await db.matches.find_one({'match_id': match_id})
-                if match:
-                    other_id = match['user2_id'] if match['user1_id'] == user['user_id'] else match['user1_id']
+                other_id = connection.typing_peer(match_id)
+                if other_id:
                     await manager.send_personal_message({
                         'type': 'typing',
                         'match_id': match_id,
                         'user_id': user['user_id']
                     }, other_id)
+            elif data.get('type') in WS_CALL_FRAMES:
+                await handle_call_frame(connection, data)
     except WebSocketDisconnect:
-        manager.disconnect(user['user_id'])
+        await manager.disconnect(connection)
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        manager.disconnect(user['user_id'])
+        await manager.disconnect(connection)
 
 # ==================== STATIC FILES ====================
 
@@ -3719,7 +4120,7 @@ async def send_date_suggestion(
     
     # Create message with date suggestion
     message_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     message_doc = {
         'message_id': message_id,
@@ -3761,12 +4162,12 @@ async def send_date_suggestion(
     await manager.send_personal_message(ws_message, other_id)
     
     # Send push notification for date suggestion
-    asyncio.create_task(send_push_notification(
+    push_dispatcher.enqueue(
         other_id,
         f"Date Idea from {current_user['name']} 📍",
         f"{current_user['name']} suggested: {place_data.get('name', 'a place')}",
         {'type': 'date_suggestions', 'match_id': match_id, 'message_id': message_id}
-    ))
+    )
     
     return {k: v for k, v in message_doc.items() if k != '_id'}
 
@@ -3860,7 +4261,7 @@ async def apply_for_ambassador(current_user: dict = Depends(get_current_user)):
         }
     
     # Auto-approve since there's space available and all checks passed
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     # Calculate 2 months premium (60 days)
     premium_end_date = datetime.now(timezone.utc) + timedelta(days=60)
@@ -3877,6 +4278,7 @@ async def apply_for_ambassador(current_user: dict = Depends(get_current_user)):
             }
         }
     )
+    invalidate_user(current_user['user_id'])
     
     return {
         'success': True,
@@ -3933,6 +4335,7 @@ async def update_preferred_language(
             {'user_id': current_user['user_id']},
             {'$set': {'preferred_language': language}}
         )
+        invalidate_user(current_user['user_id'])
         return {'message': 'Language updated successfully', 'language': language}
     except Exception as e:
         logger.error(f"Error updating language: {e}")
@@ -3976,7 +4379,7 @@ async def translate_message(
         'subject': subject,
         'message': message,
         'status': 'new',
-        'created_at': datetime.now(timezone.utc).isoformat(),
+        'created_at': datetime.now(timezone.utc),
         'resolved_at': None
     }
     
@@ -4005,11 +4408,16 @@ async def get_ambassador_status(current_user: dict = Depends(get_current_user)):
     }
 
 
-app.mount("/api/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
+@app.get("/api/uploads/{file_path:path}", name="uploads")
+async def serve_upload(file_path: str, range_header: Optional[str] = Header(None, alias='Range')):
+    """Serve locally stored media, with Range support for video seeking"""
+    return await local_media.serve(file_path, range_header)
 
 # Include router
 app.include_router(api_router)
 
+app.add_middleware(UploadSizeLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -4023,7 +4431,20 @@ async def startup_event():
     """Start background tasks"""
     asyncio.create_task(cleanup_expired_voice_messages())
     logger.info("Voice message cleanup task started")
+    asyncio.create_task(refresh_generic_starters())
+    logger.info("Generic starter refresh task started")
+    asyncio.create_task(log_password_hashing_metrics())
+    await manager.start()
+    asyncio.create_task(presence.run())
+    asyncio.create_task(push_dispatcher.run())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await manager.stop()
+    await presence.flush()
+    await push_dispatcher.drain()
+    push_dispatcher.close()
     client.close()
+    await ai_gateway.close()
+    local_media.close()
+    password_hasher.close()
@@ -0,0 +1,84 @@
+"""Upload pipeline: body size limits enforced while streaming, and blocking
+storage SDK calls run in a bounded thread pool off the event loop"""
+import os
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+MAX_UPLOAD_BYTES = 50 * MB
+# Base64 inflates binary data by 4/3; multipart adds boundaries and headers
+BASE64_LIMIT = MAX_UPLOAD_BYTES * 4 // 3 + 64 * 1024
+MULTIPART_LIMIT = MAX_UPLOAD_BYTES + 64 * 1024
+
+# Longest matching path prefix wins
+UPLOAD_BODY_LIMITS = [
+    ('/api/upload/photo/base64', BASE64_LIMIT),
+    ('/api/upload/video/base64', BASE64_LIMIT),
+    ('/api/upload/', MULTIPART_LIMIT),
+    ('/api/verification/photo', BASE64_LIMIT),
+    ('/api/verification/id', BASE64_LIMIT)
+]
+
+upload_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('UPLOAD_MAX_WORKERS', '4')),
+    thread_name_prefix='upload'
+)
+
+async def run_upload_call(func, *args, **kwargs):
+    """Run a blocking SDK call (e.g. cloudinary.uploader.upload) in the upload pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(upload_executor, functools.partial(func, *args, **kwargs))
+
+def too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f'Upload must be less than {limit // MB}MB')
+
+class UploadSizeLimitMiddleware:
+    """Rejects oversized upload bodies before they are buffered or spooled.
+    Declared Content-Length is checked up front; chunked bodies are counted
+    as they stream in and cut off as soon as they pass the limit."""
+
+    def __init__(self, app, limits: List[Tuple[str, int]] = UPLOAD_BODY_LIMITS):
+        self.app = app
+        self.limits = sorted(limits, key=lambda item: len(item[0]), reverse=True)
+
+    def limit_for(self, path: str):
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] not in ('POST', 'PUT'):
+            return await self.app(scope, receive, send)
+
+        limit = self.limit_for(scope['path'])
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope['headers'])
+        content_length = headers.get(b'content-length')
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            error = too_large(limit)
+            response = JSONResponse({'detail': error.detail}, status_code=error.status_code)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    # Surfaces through body parsing as a normal 413 response
+                    raise too_large(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
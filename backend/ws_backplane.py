@@ -0,0 +1,247 @@
+"""Pub/sub backplane so WebSocket events reach users connected to any worker"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional, Set
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, dict], Awaitable[None]]
+Control = Callable[[dict], Awaitable[None]]
+
+EVENTS_CHANNEL = 'ws_events'
+PRESENCE_CHANNEL = 'ws_presence'
+CONTROL_CHANNEL = 'ws_control'
+
+class Backplane:
+    """Single-process backplane: every recipient is local, so nothing to forward"""
+
+    async def start(self, deliver: Deliver, local_users: Callable[[], Set[str]], control: Control = None):
+        """deliver(user_id, message) sends to this process's sockets for a user;
+        control(message) handles broadcasts about shared state"""
+
+    async def publish(self, user_id: str, message: dict):
+        """Forward an event to other processes (already delivered locally)"""
+
+    async def broadcast(self, message: dict):
+        """Tell every other process about a state change (e.g. a call ended)"""
+
+    async def user_connected(self, user_id: str):
+        pass
+
+    async def user_disconnected(self, user_id: str):
+        pass
+
+    def is_online_elsewhere(self, user_id: str) -> bool:
+        return False
+
+    async def stop(self):
+        pass
+
+class InMemoryBroker:
+    """In-process broker stand-in: lets several BrokerBackplanes (one per
+    simulated worker) talk in tests without any external service"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def publish(self, channel: str, data: dict):
+        for queue in self.subscribers.get(channel, ()):
+            queue.put_nowait(data)
+
+    async def subscribe(self, channel: str):
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(channel, set()).add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.subscribers[channel].discard(queue)
+
+    async def close(self):
+        pass
+
+class MongoBroker:
+    """Broker on a capped collection tailed by every worker. Uses the MongoDB
+    deployment the app already has, so no extra infrastructure is needed."""
+
+    def __init__(self, db, collection: str = 'ws_backplane', size_bytes: int = 16 * 1024 * 1024):
+        self.db = db
+        self.name = collection
+        self.collection = db[collection]
+        self.size_bytes = size_bytes
+        self.ready = False
+
+    async def _ensure_collection(self):
+        if self.ready:
+            return
+        try:
+            await self.db.create_collection(self.name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass  # created by another worker
+        self.ready = True
+
+    async def publish(self, channel: str, data: dict):
+        await self._ensure_collection()
+        await self.collection.insert_one({
+            'channel': channel,
+            'data': data,
+            'created_at': datetime.now(timezone.utc)
+        })
+
+    async def subscribe(self, channel: str):
+        await self._ensure_collection()
+        since = datetime.now(timezone.utc)
+        seen = []  # recent ids, to skip re-reads after the cursor is recreated
+        while True:
+            cursor = self.collection.find(
+                {'channel': channel, 'created_at': {'$gte': since}},
+                cursor_type=CursorType.TAILABLE_AWAIT
+            )
+            try:
+                while cursor.alive:
+                    async for doc in cursor:
+                        if doc['_id'] in seen:
+                            continue
+                        seen.append(doc['_id'])
+                        del seen[:-1000]
+                        since = doc['created_at']
+                        yield doc['data']
+                    await asyncio.sleep(0.05)
+            except Exception as e:
+                logger.error(f"Backplane cursor error on {channel}: {e}")
+            await asyncio.sleep(0.5)
+
+    async def close(self):
+        pass
+
+class BrokerBackplane(Backplane):
+    """Fans events out through a broker to every worker; each worker delivers
+    to the sockets it holds. Workers also share which users they hold, so
+    events for users who are offline everywhere are never published."""
+
+    HEARTBEAT_SECONDS = 15
+    NODE_EXPIRY_SECONDS = 45
+
+    def __init__(self, broker, node_id: Optional[str] = None):
+        self.broker = broker
+        self.node_id = node_id or f"node_{uuid.uuid4().hex[:8]}"
+        self.remote_users: Dict[str, Dict[str, float]] = {}  # user_id -> {node_id: seen}
+        self.started_at = time.monotonic()
+        self.tasks = []
+        self.deliver = None
+        self.local_users = None
+        self.control = None
+
+    async def start(self, deliver: Deliver, local_users: Callable[[], Set[str]], control: Control = None):
+        self.deliver = deliver
+        self.local_users = local_users
+        self.control = control
+        self.started_at = time.monotonic()
+        self.tasks = [
+            asyncio.create_task(self._listen_events()),
+            asyncio.create_task(self._listen_presence()),
+            asyncio.create_task(self._heartbeat())
+        ]
+        if control:
+            self.tasks.append(asyncio.create_task(self._listen_control()))
+        logger.info(f"WebSocket backplane {self.node_id} started")
+
+    def is_online_elsewhere(self, user_id: str) -> bool:
+        nodes = self.remote_users.get(user_id)
+        if not nodes:
+            return False
+        cutoff = time.monotonic() - self.NODE_EXPIRY_SECONDS
+        return any(seen >= cutoff for seen in nodes.values())
+
+    async def publish(self, user_id: str, message: dict):
+        # Until one heartbeat has gone round we may not know every remote user
+        warming_up = time.monotonic() - self.started_at < self.HEARTBEAT_SECONDS * 2
+        if not warming_up and not self.is_online_elsewhere(user_id):
+            return
+        try:
+            await self.broker.publish(EVENTS_CHANNEL, {'origin': self.node_id, 'user_id': user_id, 'message': message})
+        except Exception as e:
+            logger.error(f"Backplane publish error: {e}")
+
+    async def broadcast(self, message: dict):
+        try:
+            await self.broker.publish(CONTROL_CHANNEL, {'origin': self.node_id, 'message': message})
+        except Exception as e:
+            logger.error(f"Backplane broadcast error: {e}")
+
+    async def _announce(self, users, online: bool):
+        try:
+            await self.broker.publish(PRESENCE_CHANNEL, {'origin': self.node_id, 'users': list(users), 'online': online})
+        except Exception as e:
+            logger.error(f"Backplane presence error: {e}")
+
+    async def user_connected(self, user_id: str):
+        await self._announce([user_id], True)
+
+    async def user_disconnected(self, user_id: str):
+        await self._announce([user_id], False)
+
+    async def _listen_events(self):
+        async for event in self.broker.subscribe(EVENTS_CHANNEL):
+            if event.get('origin') == self.node_id:
+                continue
+            try:
+                await self.deliver(event['user_id'], event['message'])
+            except Exception as e:
+                logger.error(f"Backplane delivery error: {e}")
+
+    async def _listen_control(self):
+        async for event in self.broker.subscribe(CONTROL_CHANNEL):
+            if event.get('origin') == self.node_id:
+                continue
+            try:
+                await self.control(event['message'])
+            except Exception as e:
+                logger.error(f"Backplane control error: {e}")
+
+    async def _listen_presence(self):
+        async for event in self.broker.subscribe(PRESENCE_CHANNEL):
+            origin = event.get('origin')
+            if origin == self.node_id:
+                continue
+            now = time.monotonic()
+            for user_id in event.get('users', []):
+                nodes = self.remote_users.setdefault(user_id, {})
+                if event.get('online'):
+                    nodes[origin] = now
+                else:
+                    nodes.pop(origin, None)
+                    if not nodes:
+                        self.remote_users.pop(user_id, None)
+
+    async def _heartbeat(self):
+        """Re-announce local users so new workers learn them and dead ones expire"""
+        while True:
+            await self._announce(self.local_users(), True)
+            await asyncio.sleep(self.HEARTBEAT_SECONDS)
+            cutoff = time.monotonic() - self.NODE_EXPIRY_SECONDS
+            for user_id in list(self.remote_users):
+                nodes = {n: seen for n, seen in self.remote_users[user_id].items() if seen >= cutoff}
+                if nodes:
+                    self.remote_users[user_id] = nodes
+                else:
+                    del self.remote_users[user_id]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await self.broker.close()
+
+def create_backplane(kind: str, db=None) -> Backplane:
+    """WS_BACKPLANE: 'memory' (single worker, default) or 'mongo'"""
+    if kind == 'mongo':
+        return BrokerBackplane(MongoBroker(db, os.getenv('WS_BACKPLANE_COLLECTION', 'ws_backplane')))
+    if kind != 'memory':
+        logger.warning(f"Unknown WS_BACKPLANE '{kind}', using in-memory")
+    return Backplane()
@@ -0,0 +1,149 @@
+"""One WebSocket connection with a bounded outbound queue drained by its own writer task"""
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+SEND_QUEUE_SIZE = int(os.getenv('WS_SEND_QUEUE_SIZE', '100'))
+SEND_TIMEOUT_SECONDS = float(os.getenv('WS_SEND_TIMEOUT_SECONDS', '10'))
+TYPING_INTERVAL_SECONDS = float(os.getenv('WS_TYPING_INTERVAL_SECONDS', '2'))
+
+# Frames where only the latest one matters: a newer frame with the same key
+# replaces the queued one in place instead of taking another slot
+COALESCE_KEYS = {
+    'typing': ('match_id', 'user_id'),
+    'match_expiring_soon': ('match_id',),
+    'message_read': ('message_id',)
+}
+# Frames that may be dropped outright when the queue is full
+DROPPABLE_TYPES = {'typing', 'pong'}
+
+# 1013 "try again later": the client reconnects and refetches what it missed
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# 1011 "internal error": the socket failed under the writer
+SEND_ERROR_CLOSE_CODE = 1011
+
+def coalesce_key(message: dict) -> Optional[tuple]:
+    fields = COALESCE_KEYS.get(message.get('type'))
+    if fields is None:
+        return None
+    return (message['type'],) + tuple(message.get(field) for field in fields)
+
+class ClientConnection:
+    """Producers call send(), which never blocks: the frame is queued (or
+    coalesced) and the writer task pushes it to the socket. When the queue is
+    full, droppable frames go first; if the client still can't keep up it is
+    disconnected rather than allowed to stall everyone notifying it."""
+
+    def __init__(self, websocket: WebSocket, user_id: str, max_queue: int = SEND_QUEUE_SIZE,
+                 send_timeout: float = SEND_TIMEOUT_SECONDS):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.queue: OrderedDict = OrderedDict()  # key -> message
+        self.wakeup = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.sequence = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.match_peers: Dict[str, str] = {}  # match_id -> other user, for typing
+        self.match_peers_loaded = False
+        self.pending_match_frames = []  # match changes seen while match_peers loads
+        self.typing_forwarded: Dict[str, float] = {}  # match_id -> last forward
+
+    def start(self):
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def send(self, message: dict) -> bool:
+        """Queue a JSON-ready frame; returns False if it was dropped"""
+        if self.closed:
+            return False
+
+        key = coalesce_key(message)
+        if key is not None and key in self.queue:
+            self.queue[key] = message
+            self.coalesced += 1
+            return True
+
+        if len(self.queue) >= self.max_queue and not self._make_room(message):
+            return False
+
+        if key is None:
+            self.sequence += 1
+            key = self.sequence
+        self.queue[key] = message
+        self.wakeup.set()
+        return True
+
+    def typing_peer(self, match_id: str) -> Optional[str]:
+        """Peer to forward a typing event to, or None if the user isn't in the
+        match or already forwarded one for it within the interval"""
+        peer_id = self.match_peers.get(match_id)
+        if peer_id is None:
+            return None
+        now = time.monotonic()
+        if now - self.typing_forwarded.get(match_id, 0.0) < TYPING_INTERVAL_SECONDS:
+            return None
+        self.typing_forwarded[match_id] = now
+        return peer_id
+
+    def forget_match(self, match_id: str):
+        self.match_peers.pop(match_id, None)
+        self.typing_forwarded.pop(match_id, None)
+
+    def _make_room(self, message: dict) -> bool:
+        for key, queued in self.queue.items():
+            if queued.get('type') in DROPPABLE_TYPES:
+                del self.queue[key]
+                self.dropped += 1
+                return True
+
+        self.dropped += 1
+        if message.get('type') in DROPPABLE_TYPES:
+            return False
+        logger.warning(f"Closing slow WebSocket for {self.user_id}: {len(self.queue)} frames queued")
+        self.close(SLOW_CONSUMER_CLOSE_CODE)
+        return False
+
+    async def _write_loop(self):
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                _, message = self.queue.popitem(last=False)
+                await asyncio.wait_for(self.websocket.send_json(message), self.send_timeout)
+        except asyncio.CancelledError:
+            pass
+        except asyncio.TimeoutError:
+            logger.warning(f"Closing WebSocket for {self.user_id}: send took over {self.send_timeout}s")
+            self.close(SLOW_CONSUMER_CLOSE_CODE)
+        except Exception as e:
+            # Close the socket too, so the reader loop ends and the manager
+            # drops this connection instead of keeping a dead one registered
+            logger.error(f"Error sending message to {self.user_id}: {e}")
+            self.close(SEND_ERROR_CLOSE_CODE)
+
+    def close(self, code: Optional[int] = None):
+        """Stop the writer; with a code, also close the socket so the reader loop ends"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.wakeup.set()
+        if code is not None:
+            asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
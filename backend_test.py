@@ -1236,7 +1236,7 @@ class EmberAPITester:
             )
             
             if success:
-                blocked_count = len(response) if isinstance(response, list) else 0
+                blocked_count = len(response.get('blocks', [])) if isinstance(response, dict) else 0
                 print(f"   Found {blocked_count} blocked users")
                 
                 # Test unblock user
@@ -110,7 +110,7 @@ async def create_test_profiles():
         }
     ]
     
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     password = "TestPass123"  # Same password for all test accounts
     
     created_users = []
@@ -234,7 +234,7 @@ async def create_matches_with_test_user(test_user_id, female_user_ids):
         
         # Create match
         match_id = f"match_{uuid.uuid4().hex[:12]}"
-        now = datetime.now(timezone.utc).isoformat()
+        now = datetime.now(timezone.utc)
         
         match_doc = {
             'match_id': match_id,
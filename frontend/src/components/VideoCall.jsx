@@ -9,7 +9,7 @@ import { toast } from 'sonner';
 
 export const VideoCall = ({ callData, onEnd }) => {
   const { user } = useAuth();
-  const { lastMessage, sendMessage } = useWebSocket();
+  const { lastMessage, sendMessage, isConnected } = useWebSocket();
   const [callStatus, setCallStatus] = useState(callData?.status || 'connecting');
   const [isMuted, setIsMuted] = useState(false);
   const [isVideoOff, setIsVideoOff] = useState(false);
@@ -137,6 +137,11 @@ export const VideoCall = ({ callData, onEnd }) => {
   };
 
   const sendSignal = async (signalType, data) => {
+    // Signals go over the open socket; HTTP is only a fallback while reconnecting
+    if (isConnected) {
+      sendMessage({ type: 'webrtc_signal', call_id: callData.call_id, signal_type: signalType, data });
+      return;
+    }
     try {
       await axios.post(`${API}/calls/${callData.call_id}/signal`, {
         signal_type: signalType,
@@ -25,10 +25,17 @@ export default function Likes() {
     fetchRoses();
   }, []);
 
-  const fetchLikes = async () => {
+  // With a cursor, appends the next page to the list already shown
+  const fetchLikes = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API}/likes/received`, { headers, withCredentials: true });
-      setLikesData(response.data);
+      const response = await axios.get(`${API}/likes/received`, {
+        headers,
+        withCredentials: true,
+        params: cursor ? { cursor } : {}
+      });
+      setLikesData(prev => cursor && prev
+        ? { ...response.data, likes: [...prev.likes, ...response.data.likes] }
+        : response.data);
     } catch (error) {
       toast.error('Failed to load likes');
     } finally {
@@ -36,10 +43,16 @@ export default function Likes() {
     }
   };
 
-  const fetchRoses = async () => {
+  const fetchRoses = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API}/likes/roses-received`, { headers, withCredentials: true });
-      setRosesData(response.data);
+      const response = await axios.get(`${API}/likes/roses-received`, {
+        headers,
+        withCredentials: true,
+        params: cursor ? { cursor } : {}
+      });
+      setRosesData(prev => cursor && prev
+        ? { ...response.data, roses: [...prev.roses, ...response.data.roses] }
+        : response.data);
     } catch (error) {
       console.error('Failed to load roses:', error);
     }
@@ -296,6 +309,17 @@ export default function Likes() {
                     </div>
                   </div>
                 ))}
+
+                {likesData.next_cursor && (
+                  <Button
+                    variant="outline"
+                    className="w-full rounded-full"
+                    onClick={() => fetchLikes(likesData.next_cursor)}
+                    data-testid="load-more-likes"
+                  >
+                    Load more
+                  </Button>
+                )}
               </div>
             )}
           </>
@@ -438,6 +462,17 @@ export default function Likes() {
                     </div>
                   </div>
                 ))}
+
+                {rosesData.next_cursor && (
+                  <Button
+                    variant="outline"
+                    className="w-full rounded-full"
+                    onClick={() => fetchRoses(rosesData.next_cursor)}
+                    data-testid="load-more-roses"
+                  >
+                    Load more
+                  </Button>
+                )}
               </div>
             )}
           </>
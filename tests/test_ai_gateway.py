@@ -0,0 +1,52 @@
+"""AIGateway against the LocalBackend stand-in"""
+import asyncio
+import pytest
+from ai_gateway import AIGateway, AIGatewayError, LocalBackend
+
+MESSAGES = [{'role': 'user', 'content': 'hi'}]
+
+def test_complete_list_parses_fenced_json():
+    backend = LocalBackend(lambda messages: '```json\n["a", "b"]\n```')
+    gateway = AIGateway(backend, max_concurrency=2, timeout=1)
+
+    assert asyncio.run(gateway.complete_list(MESSAGES)) == ['a', 'b']
+    assert backend.calls == [MESSAGES]
+
+def test_empty_list_is_an_error():
+    gateway = AIGateway(LocalBackend(), max_concurrency=1, timeout=1)
+
+    with pytest.raises(AIGatewayError):
+        asyncio.run(gateway.complete_list(MESSAGES))
+    assert gateway.stats['errors'] == 1
+
+def test_timeout_raises_gateway_error():
+    class SlowBackend(LocalBackend):
+        async def complete(self, messages, max_tokens):
+            await asyncio.sleep(1)
+            return 'late'
+
+    gateway = AIGateway(SlowBackend(), max_concurrency=1, timeout=0.05)
+
+    with pytest.raises(AIGatewayError):
+        asyncio.run(gateway.complete(MESSAGES))
+    assert gateway.stats['timeouts'] == 1
+
+def test_concurrency_is_capped():
+    peak = 0
+    running = 0
+
+    class CountingBackend(LocalBackend):
+        async def complete(self, messages, max_tokens):
+            nonlocal peak, running
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return 'ok'
+
+    async def run():
+        gateway = AIGateway(CountingBackend(), max_concurrency=2, timeout=1)
+        await asyncio.gather(*(gateway.complete(MESSAGES) for _ in range(6)))
+
+    asyncio.run(run())
+    assert peak == 2
@@ -0,0 +1,70 @@
+"""Profile embeddings and the Mongo-backed similarity lookup"""
+import asyncio
+import numpy as np
+import pytest
+from compatibility_index import EMBEDDING_DIM, CompatibilityIndex, cosine_similarities, embed_profile, tokenize
+
+HIKER = {'user_id': 'hiker', 'interests': ['Hiking', 'Rock Climbing'], 'bio': 'I love the mountains and camping'}
+CLIMBER = {'user_id': 'climber', 'interests': ['rock climbing', 'hiking', 'yoga'], 'bio': 'Weekends in the mountains'}
+GAMER = {'user_id': 'gamer', 'interests': ['video games', 'anime'], 'bio': 'Indoor person, ramen enthusiast'}
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+class Embeddings:
+    def __init__(self):
+        self.docs = {}
+
+    async def update_one(self, query, update, upsert=False):
+        self.docs[query['user_id']] = {'user_id': query['user_id'], **update['$set']}
+
+    async def delete_one(self, query):
+        self.docs.pop(query['user_id'], None)
+
+    def find(self, query, projection=None):
+        ids = query['user_id']['$in']
+        return Cursor([d for user_id, d in self.docs.items() if user_id in ids and d['dim'] == query['dim']])
+
+def test_tokenize_drops_stop_words_and_single_letters():
+    assert tokenize("I'm a big fan of the Sea, and x-rays!") == ['big', 'fan', 'sea', 'rays']
+
+def test_embeddings_are_deterministic_and_normalised():
+    first, second = embed_profile(HIKER), embed_profile(dict(HIKER))
+    assert first.shape == (EMBEDDING_DIM,)
+    assert np.array_equal(first, second)
+    assert np.linalg.norm(first) == pytest.approx(1.0)
+    # Interest case and surrounding whitespace don't matter
+    assert np.array_equal(embed_profile({'interests': [' HIKING ']}), embed_profile({'interests': ['hiking']}))
+
+def test_empty_profile_embeds_to_zero():
+    assert not embed_profile({}).any()
+
+def test_cosine_ordering_follows_shared_content():
+    matrix = np.stack([embed_profile(CLIMBER), embed_profile(GAMER), embed_profile(HIKER)])
+    scores = cosine_similarities(embed_profile(HIKER), matrix)
+    assert scores[2] == pytest.approx(1.0, abs=1e-6)
+    assert scores[2] > scores[0] > scores[1]
+    assert cosine_similarities(embed_profile(HIKER), np.empty((0, EMBEDDING_DIM))).shape == (0,)
+
+def test_index_similarities_in_input_order_with_nan_for_missing():
+    async def run():
+        index = CompatibilityIndex(Embeddings())
+        await index.update_user(CLIMBER)
+        await index.update_user(GAMER)
+        scores = await index.similarities(HIKER, ['gamer', 'nobody', 'climber'])
+
+        await index.remove_user('climber')
+        after_remove = await index.similarities(HIKER, ['climber'])
+        return scores, after_remove
+
+    scores, after_remove = asyncio.run(run())
+    assert np.isnan(scores[1])
+    assert scores[2] > scores[0]
+    # Stored as float16, so close to but not exactly the float32 similarity
+    expected = cosine_similarities(embed_profile(HIKER), embed_profile(CLIMBER)[None, :])[0]
+    assert scores[2] == pytest.approx(expected, abs=1e-2)
+    assert np.isnan(after_remove[0])
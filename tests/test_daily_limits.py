@@ -0,0 +1,69 @@
+"""Daily quota formatting and the atomic consume update"""
+import asyncio
+from datetime import datetime, timezone, timedelta
+from daily_limits import consume_daily_limit, format_daily_limits
+
+NOW = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+
+class RecordingUsers:
+    """find_one_and_update returns a canned document and records the call"""
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        self.calls.append((query, update, kwargs))
+        return self.result
+
+def test_counts_within_the_window_are_used():
+    user = {'swipe_limit': {'count': 4, 'last_reset': NOW - timedelta(hours=3), 'daily_max': 10}}
+    limits = format_daily_limits(user, NOW)
+    assert limits['swipes'] == {'used': 4, 'max': 10, 'remaining': 6, 'unlimited': False}
+
+def test_stale_or_missing_counters_read_as_reset():
+    user = {
+        'swipe_limit': {'count': 10, 'last_reset': NOW - timedelta(hours=24)},
+        'rose_limit': {'count': 1, 'last_reset': None}
+    }
+    limits = format_daily_limits(user, NOW)
+    assert limits['swipes']['used'] == 0
+    assert limits['swipes']['remaining'] == 10
+    assert limits['roses'] == {'used': 0, 'max': 1, 'remaining': 1}
+    assert limits['super_likes'] == {'used': 0, 'max': 3, 'remaining': 3}
+
+def test_premium_swipes_are_unlimited_but_other_quotas_are_not():
+    user = {
+        'is_premium': True,
+        'swipe_limit': {'count': 50, 'last_reset': NOW - timedelta(hours=1)},
+        'super_like_limit': {'count': 3, 'last_reset': NOW - timedelta(hours=1)}
+    }
+    limits = format_daily_limits(user, NOW)
+    assert limits['swipes']['remaining'] == 'unlimited'
+    assert limits['swipes']['unlimited'] is True
+    assert limits['super_likes']['remaining'] == 0
+    assert 'unlimited' not in limits['super_likes']
+
+def test_remaining_never_goes_negative():
+    user = {'rose_limit': {'count': 5, 'last_reset': NOW, 'daily_max': 1}}
+    assert format_daily_limits(user, NOW)['roses']['remaining'] == 0
+
+def test_consume_matches_only_while_quota_remains():
+    users = RecordingUsers({'rose_limit': {'count': 1, 'last_reset': NOW, 'daily_max': 1}})
+    limits = asyncio.run(consume_daily_limit(users, 'u1', 'roses', now=NOW))
+
+    query, update, kwargs = users.calls[0]
+    assert query['user_id'] == 'u1'
+    assert '$lt' in query['$expr']  # no premium bypass for roses
+    assert set(update[0]['$set']) == {'rose_limit.count', 'rose_limit.last_reset', 'rose_limit.daily_max'}
+    assert limits['roses'] == {'used': 1, 'max': 1, 'remaining': 0}
+
+def test_consume_lets_premium_swipes_through():
+    users = RecordingUsers({'is_premium': True})
+    asyncio.run(consume_daily_limit(users, 'u1', 'swipes', now=NOW))
+    premium_check, quota_check = users.calls[0][0]['$expr']['$or']
+    assert premium_check == {'$eq': ['$is_premium', True]}
+    assert '$lt' in quota_check
+
+def test_consume_returns_none_when_used_up():
+    assert asyncio.run(consume_daily_limit(RecordingUsers(None), 'u1', 'super_likes', now=NOW)) is None
@@ -0,0 +1,61 @@
+"""LocalStorage public-id checks and photo saves against a temp directory"""
+import io
+import base64
+import asyncio
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from media_storage import LocalStorage, is_safe_public_id
+
+def png_data_uri(width: int, height: int) -> str:
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'red').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+@pytest.mark.parametrize('public_id', [
+    '', '..', '../secret.txt', 'ember/users/u1/../../u2/photo.png',
+    'ember/users/u1/./photo.png', 'ember//photo.png', '/etc/passwd', 'ember\\..\\photo.png'
+])
+def test_unsafe_public_ids_are_rejected(tmp_path, public_id):
+    assert not is_safe_public_id(public_id)
+    with pytest.raises(HTTPException) as error:
+        LocalStorage(tmp_path).resolve(public_id)
+    assert error.value.status_code == 404
+
+def test_plain_public_ids_resolve_under_the_root(tmp_path):
+    assert is_safe_public_id('ember/users/u1/photo_1.png')
+    assert LocalStorage(tmp_path).resolve('ember/users/u1/photo_1.png') == tmp_path.resolve() / 'ember/users/u1/photo_1.png'
+
+def test_delete_refuses_paths_outside_the_root(tmp_path):
+    outside = tmp_path / 'outside.txt'
+    outside.write_text('keep')
+    storage = LocalStorage(tmp_path / 'media')
+    with pytest.raises(HTTPException):
+        asyncio.run(storage.delete('../outside.txt'))
+    assert outside.exists()
+
+def test_save_photo_returns_thumbnail_url_and_dimensions(tmp_path):
+    async def run():
+        storage = LocalStorage(tmp_path, base_url='http://media', thumbnail_workers=1)
+        result = await storage.save_photo(png_data_uri(640, 480), 'ember/users/u1', 'photo_1')
+        storage.close()
+        return result
+
+    result = asyncio.run(run())
+    assert result['public_id'] == 'ember/users/u1/photo_1.png'
+    assert result['thumbnail_url'] == 'http://media/api/uploads/ember/users/u1/photo_1_thumb.jpg'
+    assert (result['width'], result['height']) == (640, 480)
+    with Image.open(tmp_path / 'ember/users/u1/photo_1_thumb.jpg') as thumbnail:
+        assert max(thumbnail.size) == 300
+
+def test_save_photo_without_thumbnail_skips_the_worker(tmp_path):
+    async def run():
+        storage = LocalStorage(tmp_path)
+        result = await storage.save_photo(png_data_uri(64, 32), 'ember/verification/u1', 'id_1', thumbnail=False)
+        assert storage._thumbnail_pool is None
+        return result
+
+    result = asyncio.run(run())
+    assert result['thumbnail_url'] is None
+    assert (result['width'], result['height']) == (64, 32)
+    assert not (tmp_path / 'ember/verification/u1/id_1_thumb.jpg').exists()
@@ -0,0 +1,43 @@
+"""PasswordHasher queue accounting, including callers cancelled while queued"""
+import time
+import asyncio
+import pytest
+from password_hasher import PasswordHasher, PasswordHasherBusy
+
+def test_hash_and_verify_round_trip():
+    async def run():
+        hasher = PasswordHasher(max_workers=1)
+        hashed = await hasher.hash('secret')
+        assert await hasher.verify('secret', hashed)
+        assert not await hasher.verify('wrong', hashed)
+        assert not await hasher.verify('secret', '')
+        assert hasher.metrics()['completed'] == 3
+        hasher.close()
+
+    asyncio.run(run())
+
+def test_cancelled_while_queued_frees_its_slot():
+    async def run():
+        hasher = PasswordHasher(max_workers=1, max_queue=1)
+        blocker = asyncio.create_task(hasher._submit(time.sleep, 0.1))
+        await asyncio.sleep(0.02)  # the only worker is busy
+        waiting = asyncio.create_task(hasher._submit(time.sleep, 0))
+        await asyncio.sleep(0)
+        assert hasher.queued == 1
+
+        with pytest.raises(PasswordHasherBusy):
+            await hasher._submit(time.sleep, 0)
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        await blocker
+        await asyncio.sleep(0.02)  # let the abandoned job run off
+
+        assert hasher.pending == 0
+        assert hasher.metrics()['queued'] == 0
+        assert hasher.metrics()['rejected'] == 1
+        await hasher._submit(time.sleep, 0)  # the slot is usable again
+        hasher.close()
+
+    asyncio.run(run())
@@ -0,0 +1,57 @@
+"""PresenceService flushes against a recording collection"""
+import asyncio
+from datetime import datetime, timezone, timedelta
+from presence import PresenceService
+
+class RecordingCollection:
+    def __init__(self):
+        self.writes = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.writes.append(operations)
+
+def test_flush_writes_only_users_seen_since_last_flush():
+    async def run():
+        collection = RecordingCollection()
+        presence = PresenceService(collection, connected_refresh=300)
+        presence.connected('u1')
+        presence.connected('u2')
+        presence.disconnected('u2')
+
+        await presence.flush()
+        assert len(collection.writes[0]) == 2
+        assert presence.last_seen.keys() == {'u1'}
+
+        await presence.flush()  # nothing happened since
+        assert len(collection.writes) == 1
+
+        presence.touch('u1')
+        await presence.flush()
+        assert len(collection.writes[1]) == 1
+
+    asyncio.run(run())
+
+def test_idle_connected_users_are_refreshed_at_the_coarse_cadence():
+    async def run():
+        collection = RecordingCollection()
+        presence = PresenceService(collection, connected_refresh=300)
+        presence.connected('u1')
+        await presence.flush()
+
+        presence.last_seen['u1'] -= timedelta(seconds=301)
+        await presence.flush()
+        assert len(collection.writes) == 2
+        assert presence.last_seen['u1'] > datetime.now(timezone.utc) - timedelta(seconds=5)
+
+    asyncio.run(run())
+
+def test_annotate_keeps_the_fresher_last_active():
+    presence = PresenceService(RecordingCollection())
+    presence.connected('u1')
+    old = datetime.now(timezone.utc) - timedelta(days=1)
+    users = [{'user_id': 'u1', 'last_active': old}, {'user_id': 'u2', 'last_active': old}]
+
+    presence.annotate(users)
+
+    assert users[0]['is_online'] and users[0]['last_active'] > old
+    assert not users[1]['is_online'] and users[1]['last_active'] == old
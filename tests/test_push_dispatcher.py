@@ -0,0 +1,105 @@
+"""PushDispatcher against FakeTransport and an in-memory users/notifications db"""
+import asyncio
+from types import SimpleNamespace
+from push_dispatcher import PushDispatcher, FakeTransport
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+class Users:
+    def __init__(self, docs):
+        self.docs = {d['user_id']: d for d in docs}
+        self.queries = []
+        self.updates = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        ids = query['user_id']['$in']
+        return Cursor([dict(self.docs[i]) for i in ids if i in self.docs])
+
+    async def update_one(self, query, update):
+        self.updates.append((query, update))
+        doc = self.docs.get(query['user_id'])
+        if doc and doc.get('fcm_token') == query['fcm_token']:
+            for key in update.get('$unset', {}):
+                doc.pop(key, None)
+
+class Notifications:
+    def __init__(self):
+        self.inserted = []
+
+    async def insert_many(self, docs):
+        self.inserted.extend(docs)
+
+def make_db(*users):
+    return SimpleNamespace(users=Users(users), notifications=Notifications())
+
+def test_messages_within_a_window_go_out_in_one_batch():
+    async def run():
+        db = make_db({'user_id': 'u1', 'fcm_token': 't1'}, {'user_id': 'u2', 'fcm_token': 't2'})
+        transport = FakeTransport()
+        dispatcher = PushDispatcher(db, transport, window=0.05)
+        dispatcher.enqueue('u1', 'Hi', 'one', {'type': 'new_message'})
+        dispatcher.enqueue('u2', 'Hi', 'two', {'type': 'new_message'})
+        dispatcher.enqueue('u1', 'Hi', 'three', {'type': 'new_message'})
+
+        await dispatcher.dispatch(await dispatcher._collect())
+        assert len(transport.batches) == 1
+        assert [m.token for m in transport.sent] == ['t1', 't2', 't1']
+        assert len(db.users.queries) == 1
+        assert len(db.notifications.inserted) == 3
+        dispatcher.close()
+
+    asyncio.run(run())
+
+def test_disabled_notification_types_are_skipped():
+    async def run():
+        db = make_db(
+            {'user_id': 'u1', 'fcm_token': 't1', 'notification_preferences': {'new_message': False}},
+            {'user_id': 'u2'}
+        )
+        transport = FakeTransport()
+        dispatcher = PushDispatcher(db, transport)
+        dispatcher.enqueue('u1', 'Hi', 'muted', {'type': 'new_message'})
+        dispatcher.enqueue('u1', 'Match', 'allowed', {'type': 'new_match'})
+        dispatcher.enqueue('u2', 'Hi', 'no token', {'type': 'new_match'})
+
+        await dispatcher.drain()
+        assert [m.body for m in transport.sent] == ['allowed']
+        assert dispatcher.stats['skipped'] == 2
+        dispatcher.close()
+
+    asyncio.run(run())
+
+def test_unregistered_token_is_unset_and_cache_invalidated():
+    async def run():
+        db = make_db({'user_id': 'u1', 'fcm_token': 'dead'})
+        transport = FakeTransport(unregistered_tokens={'dead'})
+        dispatcher = PushDispatcher(db, transport)
+        dispatcher.enqueue('u1', 'Hi', 'lost', {'type': 'new_message'})
+
+        await dispatcher.drain()
+        assert db.users.updates == [({'user_id': 'u1', 'fcm_token': 'dead'}, {'$unset': {'fcm_token': ''}})]
+        assert 'u1' not in dispatcher.recipients
+        assert 'fcm_token' not in db.users.docs['u1']
+        assert db.notifications.inserted == []
+
+        # Reloaded without a token, the next notification is skipped
+        dispatcher.enqueue('u1', 'Hi', 'again', {'type': 'new_message'})
+        await dispatcher.drain()
+        assert len(transport.sent) == 1
+        assert dispatcher.stats['skipped'] == 1
+        dispatcher.close()
+
+    asyncio.run(run())
+
+def test_none_values_are_left_out_of_the_data_payload():
+    dispatcher = PushDispatcher(make_db(), FakeTransport())
+    dispatcher.enqueue('u1', 'Hi', 'body', {'type': 'new_message', 'sender_photo': None, 'count': 2})
+    message = dispatcher.queue.get_nowait()
+    assert message.data == {'type': 'new_message', 'count': '2'}
+    dispatcher.close()
@@ -0,0 +1,62 @@
+"""Feature scaling, weights and ordering of the vectorized ranker"""
+from datetime import datetime, timezone, timedelta
+import numpy as np
+import pytest
+from ranking_engine import FEATURES, candidate_features, load_weights, rank_candidates, score_candidates
+
+NOW = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+USER = {'user_id': 'me', 'age': 30, 'interests': ['hiking', 'jazz', 'cooking']}
+
+def column(features, name):
+    return features[:, FEATURES.index(name)]
+
+def test_features_are_normalised_and_unknowns_neutral():
+    candidates = [
+        {'age': 30, 'distance': 0, 'interests': ['hiking', 'jazz', 'cooking'], 'prompts': [1, 2, 3, 4],
+         'photos': [1] * 6, 'last_active': NOW, 'is_ambassador': True},
+        {}
+    ]
+    features = candidate_features(USER, candidates, now=NOW, compatibility=np.array([1.0, np.nan]))
+
+    assert features.shape == (2, len(FEATURES))
+    assert np.all((features >= 0) & (features <= 1))
+    assert np.allclose(features[0], 1.0)
+    for name in ('age', 'distance', 'compatibility', 'recency'):
+        assert column(features, name)[1] == 0.5
+    assert column(features, 'interests')[1] == 0.0
+
+def test_recency_halves_every_half_life():
+    candidates = [{'last_active': NOW - timedelta(hours=72)}, {'last_active': (NOW - timedelta(hours=144)).replace(tzinfo=None)}]
+    assert column(candidate_features(USER, candidates, now=NOW), 'recency') == pytest.approx([0.5, 0.25])
+
+def test_ranking_order_for_fixed_candidates():
+    candidates = [
+        {'user_id': 'far', 'age': 30, 'distance': 90, 'interests': ['jazz']},
+        {'user_id': 'close_match', 'age': 31, 'distance': 2, 'interests': ['hiking', 'jazz']},
+        {'user_id': 'close_stranger', 'age': 32, 'distance': 2, 'interests': ['golf']},
+    ]
+    ranked = rank_candidates(USER, candidates, now=NOW)
+    assert [c['user_id'] for c in ranked] == ['close_match', 'close_stranger', 'far']
+
+    # Only distance counts: the two nearby candidates tie and keep input order
+    distance_only = {f: 0.0 for f in FEATURES} | {'distance': 1.0}
+    ranked = rank_candidates(USER, candidates, weights=distance_only, now=NOW, limit=2)
+    assert [c['user_id'] for c in ranked] == ['close_match', 'close_stranger']
+
+def test_compatibility_similarity_moves_candidates():
+    candidates = [{'user_id': 'a'}, {'user_id': 'b'}, {'user_id': 'c'}]
+    compatibility = np.array([-1.0, 1.0, np.nan])
+    scores = score_candidates(USER, candidates, now=NOW, compatibility=compatibility)
+    assert scores[1] > scores[2] > scores[0]
+    ranked = rank_candidates(USER, candidates, now=NOW, compatibility=compatibility)
+    assert [c['user_id'] for c in ranked] == ['b', 'c', 'a']
+
+def test_empty_candidates():
+    assert rank_candidates(USER, [], now=NOW) == []
+    assert score_candidates(USER, [], now=NOW).shape == (0,)
+
+def test_load_weights_overrides_known_features_only():
+    weights = load_weights('{"distance": 3, "height": 9}')
+    assert weights['distance'] == 3.0
+    assert 'height' not in weights
+    assert load_weights('not json') == load_weights()
@@ -0,0 +1,62 @@
+"""Token buckets: bursts, continuous refill and retry_after"""
+import asyncio
+import pytest
+import rate_limiter
+from rate_limiter import InMemoryBucketStore, RateLimiter
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock)
+    return clock
+
+def hits(limiter, rule, key, count):
+    async def run():
+        return [await limiter.hit(rule, key) for _ in range(count)]
+    return asyncio.run(run())
+
+def test_burst_up_to_capacity_then_reject_with_retry_after(clock):
+    limiter = RateLimiter(rules={'likes': {'capacity': 3, 'refill_per_second': 0.5}})
+    results = hits(limiter, 'likes', 'u1', 4)
+
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert results[-1][1] == pytest.approx(2.0)  # one token at 0.5/s
+    assert limiter.rejected['likes'] == 1
+
+def test_tokens_refill_continuously_up_to_capacity(clock):
+    limiter = RateLimiter(rules={'likes': {'capacity': 2, 'refill_per_second': 1.0}})
+    hits(limiter, 'likes', 'u1', 2)
+
+    clock.now += 0.5
+    allowed, retry_after = hits(limiter, 'likes', 'u1', 1)[0]
+    assert not allowed
+    assert retry_after == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert hits(limiter, 'likes', 'u1', 1)[0][0]
+
+    clock.now += 60  # a long pause only refills to capacity
+    assert [allowed for allowed, _ in hits(limiter, 'likes', 'u1', 3)] == [True, True, False]
+
+def test_buckets_are_per_rule_and_key(clock):
+    limiter = RateLimiter(rules={
+        'likes': {'capacity': 1, 'refill_per_second': 1.0},
+        'messages': {'capacity': 1, 'refill_per_second': 1.0}
+    })
+    assert hits(limiter, 'likes', 'u1', 1)[0][0]
+    assert not hits(limiter, 'likes', 'u1', 1)[0][0]
+    assert hits(limiter, 'likes', 'u2', 1)[0][0]
+    assert hits(limiter, 'messages', 'u1', 1)[0][0]
+
+def test_cost_larger_than_available_tokens_is_rejected(clock):
+    store = InMemoryBucketStore()
+    allowed, retry_after = asyncio.run(store.take('k', capacity=5, refill_per_second=2.0, cost=6))
+    assert not allowed
+    assert retry_after == pytest.approx(0.5)
@@ -0,0 +1,95 @@
+"""BrokerBackplane across simulated workers sharing an InMemoryBroker"""
+import asyncio
+from ws_backplane import Backplane, BrokerBackplane, InMemoryBroker
+
+async def start_workers(*local_users):
+    broker = InMemoryBroker()
+    workers = []
+    for index, users in enumerate(local_users):
+        delivered = []
+
+        async def deliver(user_id, message, delivered=delivered):
+            delivered.append((user_id, message))
+
+        backplane = BrokerBackplane(broker, f'node_{index}')
+        await backplane.start(deliver, lambda users=users: set(users))
+        workers.append((backplane, delivered))
+    await asyncio.sleep(0)  # let the heartbeats announce local users
+    return workers
+
+async def stop_workers(workers):
+    for backplane, _ in workers:
+        await backplane.stop()
+
+def test_event_reaches_other_workers_once_and_never_echoes():
+    async def run():
+        workers = await start_workers(set(), {'u2'}, {'u2'})
+        (a, a_delivered), (_, b_delivered), (_, c_delivered) = workers
+
+        await a.publish('u2', {'type': 'new_message'})
+        await asyncio.sleep(0)
+
+        assert a_delivered == []
+        assert b_delivered == [('u2', {'type': 'new_message'})]
+        assert c_delivered == [('u2', {'type': 'new_message'})]
+        await stop_workers(workers)
+
+    asyncio.run(run())
+
+def test_presence_is_shared_and_offline_users_are_not_published():
+    async def run():
+        workers = await start_workers(set(), set())
+        (a, _), (b, b_delivered) = workers
+
+        await b.user_connected('u3')
+        await asyncio.sleep(0)
+        assert a.is_online_elsewhere('u3')
+
+        await b.user_disconnected('u3')
+        await asyncio.sleep(0)
+        assert not a.is_online_elsewhere('u3')
+
+        a.started_at -= a.HEARTBEAT_SECONDS * 2  # past warm-up
+        await a.publish('u3', {'type': 'typing'})
+        await asyncio.sleep(0)
+        assert b_delivered == []
+        await stop_workers(workers)
+
+    asyncio.run(run())
+
+def test_single_process_backplane_forwards_nothing():
+    backplane = Backplane()
+    asyncio.run(backplane.publish('u1', {'type': 'typing'}))
+    assert not backplane.is_online_elsewhere('u1')
+
+def test_broadcast_reaches_every_other_worker():
+    async def run():
+        broker = InMemoryBroker()
+        received = {}
+        workers = []
+        for name in ('a', 'b', 'c'):
+            received[name] = []
+
+            async def control(message, name=name):
+                received[name].append(message)
+
+            async def deliver(user_id, message):
+                pass
+
+            backplane = BrokerBackplane(broker, name)
+            await backplane.start(deliver, set, control)
+            workers.append(backplane)
+        await asyncio.sleep(0)
+
+        await workers[0].broadcast({'type': 'call_closed', 'call_id': 'call_1'})
+        await asyncio.sleep(0)
+
+        assert received == {
+            'a': [],
+            'b': [{'type': 'call_closed', 'call_id': 'call_1'}],
+            'c': [{'type': 'call_closed', 'call_id': 'call_1'}]
+        }
+        for backplane in workers:
+            await backplane.stop()
+
+    asyncio.run(run())
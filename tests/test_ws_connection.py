@@ -0,0 +1,96 @@
+"""ClientConnection send queue: coalescing, drop policy and slow-consumer close"""
+import asyncio
+from ws_connection import ClientConnection, SEND_ERROR_CLOSE_CODE, SLOW_CONSUMER_CLOSE_CODE
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.sent = []
+        self.close_code = None
+
+    async def send_json(self, message):
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self, code=None):
+        self.close_code = code
+
+def test_typing_frames_coalesce_per_match():
+    async def run():
+        websocket = FakeWebSocket()
+        connection = ClientConnection(websocket, 'u1', max_queue=10)
+        for i in range(5):
+            connection.send({'type': 'typing', 'match_id': 'm1', 'user_id': 'u2', 'n': i})
+        connection.send({'type': 'new_message', 'message_id': 'x'})
+        connection.start()
+        await asyncio.sleep(0.01)
+
+        assert websocket.sent == [
+            {'type': 'typing', 'match_id': 'm1', 'user_id': 'u2', 'n': 4},
+            {'type': 'new_message', 'message_id': 'x'}
+        ]
+        assert connection.coalesced == 4
+        connection.close()
+
+    asyncio.run(run())
+
+def test_full_queue_drops_droppable_frames_first():
+    async def run():
+        connection = ClientConnection(FakeWebSocket(), 'u1', max_queue=2)
+        connection.send({'type': 'pong'})
+        connection.send({'type': 'new_message', 'message_id': 'a'})
+
+        assert connection.send({'type': 'new_message', 'message_id': 'b'})
+        assert [m['type'] for m in connection.queue.values()] == ['new_message', 'new_message']
+        assert not connection.send({'type': 'pong'})
+        assert connection.dropped == 2
+        assert not connection.closed
+
+    asyncio.run(run())
+
+def test_slow_consumer_is_closed_without_blocking_producers():
+    async def run():
+        websocket = FakeWebSocket(delay=1)
+        connection = ClientConnection(websocket, 'u1', max_queue=2)
+        connection.start()
+        await asyncio.sleep(0)  # writer takes the first frame and stalls on it
+
+        results = [connection.send({'type': 'new_message', 'n': i}) for i in range(4)]
+        await asyncio.sleep(0.01)
+
+        assert results == [True, True, False, False]
+        assert connection.closed
+        assert websocket.close_code == SLOW_CONSUMER_CLOSE_CODE
+
+    asyncio.run(run())
+
+def test_send_timeout_closes_the_socket():
+    async def run():
+        websocket = FakeWebSocket(delay=1)
+        connection = ClientConnection(websocket, 'u1', send_timeout=0.01)
+        connection.start()
+        connection.send({'type': 'new_message', 'message_id': 'a'})
+        await asyncio.sleep(0.05)
+
+        assert connection.closed
+        assert websocket.close_code == SLOW_CONSUMER_CLOSE_CODE
+        assert not connection.send({'type': 'new_message', 'message_id': 'b'})
+
+    asyncio.run(run())
+
+def test_send_error_closes_the_socket():
+    class BrokenWebSocket(FakeWebSocket):
+        async def send_json(self, message):
+            raise RuntimeError('connection reset')
+
+    async def run():
+        websocket = BrokenWebSocket()
+        connection = ClientConnection(websocket, 'u1')
+        connection.start()
+        connection.send({'type': 'new_message', 'message_id': 'a'})
+        await asyncio.sleep(0.01)
+
+        assert connection.closed
+        assert websocket.close_code == SEND_ERROR_CLOSE_CODE
+
+    asyncio.run(run())